@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Общие часы анимаций элементов сцены.
+
+Вместо QPropertyAnimation на каждый блок (пульсация выделения, подсветка
+поиска, свечение) все анимации - это дорожки одного таймера. Значение
+дорожки вычисляется из времени, поэтому её можно не пересчитывать, пока
+элемент за пределами вида: на каждом кадре обновляются и перерисовываются
+только видимые элементы. Когда дорожек не остаётся, таймер
+останавливается.
+"""
+
+import time
+from PyQt5.QtCore import QObject, QTimer, QEasingCurve
+from PyQt5.QtGui import QColor
+
+FRAME_INTERVAL_MS = 16
+REFRESH_EVERY_TICKS = 15  # Как часто (в кадрах) заново проверять, какие элементы видны
+
+
+def _interpolate(start, end, progress):
+    if isinstance(start, QColor):
+        return QColor(*(round(a + (b - a) * progress) for a, b in zip(start.getRgb(), end.getRgb())))
+    return start + (end - start) * progress
+
+
+class AnimationTrack:
+    """Анимация значения от start к end за duration_ms.
+
+    loop: None - один проход, 'repeat' - повтор с начала, 'pingpong' -
+    туда и обратно. setter(value) применяет значение и возвращает элементы,
+    которые нужно перерисовать.
+    """
+
+    __slots__ = ('setter', 'start', 'end', 'duration', 'easing', 'loop', 'on_finished', 'started_at')
+
+    def __init__(self, setter, start, end, duration_ms, easing=QEasingCurve.Linear, loop=None, on_finished=None):
+        self.setter = setter
+        self.start = start
+        self.end = end
+        self.duration = duration_ms / 1000.0
+        self.easing = QEasingCurve(easing)
+        self.loop = loop
+        self.on_finished = on_finished
+        self.started_at = time.monotonic()
+
+    def is_finished(self, now):
+        return self.loop is None and now - self.started_at >= self.duration
+
+    def value_at(self, now):
+        phase = (now - self.started_at) / self.duration
+        if self.loop is None:
+            progress = min(phase, 1.0)
+        elif self.loop == 'pingpong':
+            progress = phase % 2.0
+            progress = progress if progress <= 1.0 else 2.0 - progress
+        else:
+            progress = phase % 1.0
+        return _interpolate(self.start, self.end, self.easing.valueForProgress(progress))
+
+
+class AnimationClock(QObject):
+    """Один таймер на все дорожки.
+
+    Циклические дорожки пересчитываются только у видимых элементов. Список
+    видимых строится заново, когда сдвинулся вид, появились новые дорожки
+    или прошло REFRESH_EVERY_TICKS кадров (блок могли перетащить), поэтому
+    тысячи пульсирующих блоков за пределами экрана почти ничего не стоят.
+    Конечные дорожки (появление, угасание) досчитываются до конца всегда.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._items = {}        # элемент -> {имя: AnimationTrack}
+        self._finite = {}       # (элемент, имя) -> конечная дорожка
+        self._visible = []      # элементы с дорожками, попавшие в виды при последнем обновлении
+        self._view_rects = {}   # сцена -> видимые прямоугольники её видов
+        self._stale = True
+        self._ticks = 0
+        self._timer = QTimer(self)
+        self._timer.setInterval(FRAME_INTERVAL_MS)
+        self._timer.timeout.connect(self._tick)
+
+    def start(self, item, name, track):
+        """Запускает дорожку элемента; прежняя дорожка с тем же именем заменяется."""
+        tracks = self._items.setdefault(item, {})
+        self._stale = self._stale or not tracks
+        tracks[name] = track
+        if track.loop is None:
+            self._finite[(item, name)] = track
+        else:
+            self._finite.pop((item, name), None)
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def stop(self, item, name):
+        """Останавливает дорожку, оставляя текущее значение."""
+        tracks = self._items.get(item)
+        if tracks and tracks.pop(name, None) is not None and not tracks:
+            del self._items[item]
+        self._finite.pop((item, name), None)
+
+    def is_running(self, item, name):
+        return name in self._items.get(item, ())
+
+    def active_count(self):
+        return sum(len(tracks) for tracks in self._items.values())
+
+    def _tick(self):
+        self._ticks += 1
+        view_rects = {scene: self._scene_view_rects(scene) for scene in self._view_rects}
+        if self._stale or view_rects != self._view_rects or self._ticks % REFRESH_EVERY_TICKS == 0:
+            self._refresh()
+        if not self._items:
+            self._timer.stop()
+            return
+        now = time.monotonic()
+        dirty = set()
+        finished = []
+        for key, track in list(self._finite.items()):
+            if track.is_finished(now):
+                self.stop(*key)
+                finished.append(track)
+                self._apply(key[0], track, now, dirty)
+        for item in self._visible:
+            tracks = self._items.get(item)
+            if tracks:
+                for track in list(tracks.values()):
+                    self._apply(item, track, now, dirty)
+        for target in dirty:
+            target.update()
+        for track in finished:
+            if track.on_finished:
+                track.on_finished()
+
+    def _refresh(self):
+        # Заодно убираем дорожки элементов, которых уже нет на сцене
+        self._stale = False
+        self._view_rects = {}
+        self._visible = []
+        for item in list(self._items):
+            try:
+                scene = item.scene()
+            except RuntimeError:
+                scene = None   # C++-объект уже удалён
+            if scene is None:
+                for name in list(self._items[item]):
+                    self.stop(item, name)
+                continue
+            if scene not in self._view_rects:
+                self._view_rects[scene] = self._scene_view_rects(scene)
+            if self._intersects(item, self._view_rects[scene]):
+                self._visible.append(item)
+
+    def _apply(self, item, track, now, dirty):
+        try:
+            rects = self._view_rects.get(item.scene(), ())
+        except RuntimeError:
+            return
+        for target in track.setter(track.value_at(now)) or ():
+            if target not in dirty and self._intersects(target, rects):
+                dirty.add(target)
+
+    @staticmethod
+    def _scene_view_rects(scene):
+        return [view.mapToScene(view.viewport().rect()).boundingRect() for view in scene.views() if view.isVisible()]
+
+    @staticmethod
+    def _intersects(item, rects):
+        bounds = item.sceneBoundingRect()
+        return any(bounds.intersects(rect) for rect in rects)
+
+
+_shared_clock = None
+
+
+def shared_animation_clock():
+    """Часы процесса, общие для всех сцен."""
+    global _shared_clock
+    if _shared_clock is None:
+        _shared_clock = AnimationClock()
+    return _shared_clock
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+from datetime import datetime
+from PyQt5.QtCore import QObject, QTimer, Qt, pyqtSignal
+from PyQt5.QtWidgets import QApplication
+from app_settings import load_settings, save_settings
+from project_saver import BackgroundSaver
+
+RECOVERY_DIR = 'recovery'
+RECOVERY_FILE = 'autosave.rmap'
+IDLE_DELAY_MS = 2000      # Сохраняем, когда правки затихли на столько миллисекунд
+MAX_DELAY_MS = 30000      # ... но не реже, чем раз в столько, даже при непрерывных правках
+RETRY_DELAY_MS = 10000    # Повтор после неудачной записи
+
+
+class AutosaveScheduler(QObject):
+    """Автосохранение в файл восстановления.
+
+    Правки сцены (сигнал RoadMapWidget.project_changed) помечают проект
+    изменённым; серия правок - перетаскивание, набор текста - сливается
+    в одно сохранение после паузы IDLE_DELAY_MS. На GUI-потоке берётся
+    только снимок, сама запись идёт через BackgroundSaver. Сведения о
+    копии хранятся в settings.json, чтобы после сбоя предложить её при
+    следующем запуске.
+    """
+
+    saved = pyqtSignal(str)
+    failed = pyqtSignal(str)
+
+    def __init__(self, widget, parent=None):
+        super().__init__(parent)
+        self.widget = widget
+        self.source_path = None   # Файл проекта, к которому относится копия
+        self.recovery_path = os.path.abspath(os.path.join(RECOVERY_DIR, RECOVERY_FILE))
+        self.enabled = load_settings().get('autosave', True)
+        self.generation = 0       # Счётчик правок: сохранение проекта сравнивает его до и после записи
+        self._dirty = False
+        self._suspended = False
+        self._discard_pending = False
+        self._idle_timer = QTimer(self)
+        self._idle_timer.setSingleShot(True)
+        self._idle_timer.setInterval(IDLE_DELAY_MS)
+        self._idle_timer.timeout.connect(self.save_now)
+        self._max_timer = QTimer(self)
+        self._max_timer.setSingleShot(True)
+        self._max_timer.timeout.connect(self.save_now)
+        self._saver = BackgroundSaver(self)
+        self._saver.saved.connect(self._on_saved)
+        self._saver.failed.connect(self._on_failed)
+
+    def is_dirty(self):
+        return self._dirty
+
+    def mark_dirty(self):
+        if not self.enabled or self._suspended:
+            return
+        self.generation += 1
+        self._dirty = True
+        self._idle_timer.start()
+        if not self._max_timer.isActive():
+            self._max_timer.start(MAX_DELAY_MS)
+
+    def mark_clean(self):
+        self._dirty = False
+        self._idle_timer.stop()
+        self._max_timer.stop()
+
+    def suspend(self):
+        """Не реагировать на правки (например, пока сцена наполняется при загрузке)."""
+        self._suspended = True
+        self.mark_clean()
+
+    def resume(self):
+        self._suspended = False
+
+    def save_now(self):
+        if not self._dirty or self._suspended:
+            return
+        if QApplication.mouseButtons() != Qt.NoButton:
+            # Идёт перетаскивание - снимок всё равно сразу устареет
+            self._idle_timer.start()
+            return
+        self._idle_timer.stop()
+        self._max_timer.stop()
+        self._dirty = False
+        self._discard_pending = False
+        try:
+            os.makedirs(os.path.dirname(self.recovery_path), exist_ok=True)
+            self._saver.save(self.recovery_path, self.widget.get_project_data(), self.widget.image_store)
+        except Exception as e:
+            self._on_failed(self.recovery_path, str(e))
+
+    def wait(self):
+        self._saver.wait()
+
+    def discard_recovery(self):
+        """Удаляет копию восстановления (проект сохранён или изменения отброшены)."""
+        self.mark_clean()
+        self._saver.discard(self.recovery_path)
+        if self._saver.is_busy():
+            # Идущая запись удалит свой результат, когда закончится
+            self._discard_pending = True
+        self._remove_recovery()
+
+    def pending_recovery(self):
+        """Возвращает сведения о копии, которую стоит предложить восстановить, или None.
+
+        Копия предлагается, если она новее сохранённого файла проекта;
+        устаревшая копия сразу удаляется.
+        """
+        record = load_settings().get('recovery')
+        if not record or not os.path.exists(record.get('path', '')):
+            if record:
+                self._remove_recovery(record.get('path'))
+            return None
+        source = record.get('source')
+        if source and os.path.exists(source) and os.path.getmtime(source) >= os.path.getmtime(record['path']):
+            self._remove_recovery(record['path'])
+            return None
+        return record
+
+    def _on_saved(self, file_path):
+        if self._discard_pending:
+            self._discard_pending = False
+            self._remove_recovery()
+            return
+        settings = load_settings()
+        settings['recovery'] = {'path': file_path, 'source': self.source_path,
+                                'saved_at': datetime.now().isoformat(timespec='seconds')}
+        save_settings(settings)
+        self.saved.emit(file_path)
+
+    def _on_failed(self, file_path, message):
+        # Изменения остаются несохранёнными; пробуем ещё раз позже
+        print(f"Ошибка автосохранения: {message}")
+        self._dirty = True
+        self._max_timer.start(RETRY_DELAY_MS)
+        self.failed.emit(message)
+
+    def _remove_recovery(self, path=None):
+        path = path or self.recovery_path
+        if os.path.exists(path):
+            os.remove(path)
+        settings = load_settings()
+        if 'recovery' in settings:
+            del settings['recovery']
+            save_settings(settings)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Замеры GraphAnalysis после правок графа (без Qt).
+
+    python benchmarks/bench_graph.py --stages 10000 100000
+
+Граф из N блоков разбит на компоненты по --component блоков: в каждой
+цикл с хордами и хвост из мостов. После первого полного обхода
+меряется запрос стороны связи (far_side) сразу после правки: хорда
+внутри цикла, удаление связи, удаление блока и связь между двумя
+компонентами. Первые правки не сбрасывают результатов, после удаления
+обходится только задетая компонента, а связь между компонентами и
+правка в графе из одной компоненты (--component N) пересчитывают всё.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from graph_analysis import GraphAnalysis  # noqa: E402
+from graph_index import GraphIndex  # noqa: E402
+
+
+class Edge:
+    def __init__(self, start_item, end_item):
+        self.start_item, self.end_item = start_item, end_item
+
+
+def make_graph(count, size, seed=1):
+    rng = random.Random(seed)
+    graph, components = GraphIndex(), []
+    for first in range(0, count, size):
+        names = ['s%07d' % i for i in range(first, min(first + size, count))]
+        ring, tail = names[:len(names) * 2 // 3 or 1], names[len(names) * 2 // 3:]
+        edges = [Edge(a, b) for a, b in zip(ring, ring[1:] + ring[:1])]
+        edges += [Edge(rng.choice(ring), rng.choice(ring)) for _ in range(len(ring) // 10)]
+        previous = ring[-1]
+        for name in tail:
+            edges.append(Edge(previous, name))
+            previous = name
+        for name in names:
+            graph.add_node(name)
+        for edge in edges:
+            graph.add_edge(edge)
+        components.append((ring, tail, edges))
+    return graph, components
+
+
+def report(name, seconds):
+    print('  %-34s %12.3f ms' % (name, seconds * 1000))
+
+
+def timed_edit(analysis, edit, query):
+    edit()
+    start = time.perf_counter()
+    analysis.far_side(*query)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stages', type=int, nargs='+', default=[10000, 100000], help='Размеры графа')
+    parser.add_argument('--component', type=int, default=200, help='Блоков в одной компоненте')
+    args = parser.parse_args()
+    for count in args.stages:
+        size = min(args.component, count)
+        print('%d stages, components of %d' % (count, size))
+        graph, components = make_graph(count, size)
+        analysis = GraphAnalysis(graph)
+        ring, tail, edges = components[len(components) // 2]
+        query = (ring[0], ring[0], ring[1])
+        start = time.perf_counter()
+        analysis.far_side(*query)
+        report('first query (full pass)', time.perf_counter() - start)
+        report('chord inside a cycle + query', timed_edit(analysis, lambda: graph.add_edge(Edge(ring[2], ring[5])), query))
+        report('remove a link + query', timed_edit(analysis, lambda: graph.remove_edge(edges[0]), query))
+        report('remove a stage + query', timed_edit(analysis, lambda: graph.remove_node(tail[-1]), query))
+        other = components[0][0][0]
+        report('link two components + query', timed_edit(analysis, lambda: graph.add_edge(Edge(ring[3], other)), query))
+
+
+if __name__ == '__main__':
+    main()
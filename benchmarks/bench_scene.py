@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Замеры сцены RoadMapWidget на N блоках (без окна, QT_QPA_PLATFORM=offscreen).
+
+    python benchmarks/bench_scene.py --stages 1000 10000
+
+Скрипт строит сцену из N текстовых блоков со случайными позициями и
+тегами и печатает время построения, память, простой цикла событий и
+время частых запросов (выделение, поиск по тегу, блок под курсором,
+блоки в области, масштаб колесом, шаг перетаскивания), затем загрузку
+проекта с N связями через load_project и отмену удаления всех блоков.
+Методы, которых в дереве нет, пропускаются, поэтому тот же скрипт,
+запущенный на более раннем коммите, даёт столбец "до" для сравнения.
+Числа зависят от машины; сравнивать имеет смысл только прогоны на одной.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import QEventLoop, QPoint, QPointF, QRectF, Qt, QTimer
+from PyQt5.QtGui import QWheelEvent
+from PyQt5.QtWidgets import QApplication
+
+app = QApplication.instance() or QApplication(sys.argv[:1])
+
+SETTLE_SECONDS = 1.0   # Сколько цикл событий крутится после построения, прежде чем мерить простой
+
+from roadmap_widget import RoadMapWidget, StageGraphicsItem  # noqa: E402  (нужен QApplication)
+
+QUERY_POINTS = 200    # Сколько точек и областей на один замер запросов
+
+
+def rss_mb():
+    """Занятая процессом память в МБ (Linux) или None."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def make_project(count, seed=1):
+    rng = random.Random(seed)
+    side = int((count ** 0.5) * 300)
+    stages = [{'id': 's%07d' % i, 'title': 'Этап %d [t%d]' % (i, i % 50),
+               'position': {'x': rng.uniform(0, side), 'y': rng.uniform(0, side)}} for i in range(count)]
+    connections = [{'from': 's%07d' % i, 'to': 's%07d' % rng.randrange(count)} for i in range(count)]
+    return {'stages': stages, 'connections': [conn for conn in connections if conn['from'] != conn['to']]}, side
+
+
+def report(name, seconds=None, value=None, unit=''):
+    if seconds is not None:
+        print('  %-30s %12.3f ms' % (name, seconds * 1000))
+    else:
+        print('  %-30s %12s %s' % (name, value, unit))
+
+
+def timed(fn, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def run_event_loop(seconds):
+    loop = QEventLoop()
+    QTimer.singleShot(int(seconds * 1000), loop.quit)
+    loop.exec_()
+
+
+def build_scene(widget, project):
+    # Блоки без связей и без выделения - то, что стоит сам блок
+    materialize = getattr(widget, 'materialize_stages', None)
+    if materialize is not None:
+        return materialize([dict(stage) for stage in project['stages']])
+    if hasattr(widget, 'materialize_stage'):
+        return [widget.materialize_stage(dict(stage)) for stage in project['stages']]
+    return [widget.add_stage(dict(stage), save_state=False) for stage in project['stages']]
+
+
+def bench_build(count, project, side, args):
+    """Построение сцены, память на блок, число виджетов и загрузка CPU в простое."""
+    widget = RoadMapWidget()
+    widget.resize(1200, 800)
+    rss_before = rss_mb()
+    widgets_before = len(QApplication.allWidgets())
+    items = []
+    report('build %d stages' % count, timed(lambda: items.extend(build_scene(widget, project))))
+    rss_after = rss_mb()
+    if rss_before is not None:
+        report('RSS per stage', value='%.1f' % ((rss_after - rss_before) * 1024 / count), unit='KB')
+    report('QWidgets created', value=len(QApplication.allWidgets()) - widgets_before)
+    run_event_loop(SETTLE_SECONDS)   # Отложенные после построения задачи (пути связей, индекс сцены) - не простой
+    cpu, wall = time.process_time(), time.perf_counter()
+    run_event_loop(args.idle)
+    report('idle CPU (%.0f s)' % args.idle, value='%.1f' % (100 * (time.process_time() - cpu) / (time.perf_counter() - wall)), unit='%')
+    return widget, items
+
+
+def bench_queries(widget, items, side):
+    """Запросы, которые идут на каждое действие пользователя."""
+    rng = random.Random(2)
+    selected = rng.sample(items, 10)
+    for item in selected:
+        item.setSelected(True)
+    toggled = selected[0]   # Смена выделения одного блока при девяти уже выделенных
+    report('selection changed', timed(lambda: toggled.setSelected(not toggled.isSelected()), 20))
+    report('search_by_tag', timed(lambda: widget.search_by_tag('t3'), 5))
+    report('get_selected_items', timed(widget.get_selected_items, 20))
+    if hasattr(widget, 'stage_items'):
+        report('stage_items', timed(widget.stage_items, 20))
+    points = [QPointF(rng.uniform(0, side), rng.uniform(0, side)) for _ in range(QUERY_POINTS)]
+    if hasattr(widget, 'stage_at'):
+        stage_at = widget.stage_at
+    else:
+        def stage_at(pos):
+            return next((item for item in widget.scene.items(pos) if isinstance(item, StageGraphicsItem)), None)
+    report('stage under cursor x%d' % QUERY_POINTS, timed(lambda: [stage_at(p) for p in points], 3))
+    if hasattr(widget, 'stages_in'):
+        report('stages in 1200x800 x%d' % QUERY_POINTS,
+               timed(lambda: [widget.stages_in(QRectF(p.x(), p.y(), 1200, 800)) for p in points], 3))
+    if hasattr(widget, 'nearest_stages'):
+        report('8 nearest x%d' % QUERY_POINTS, timed(lambda: [widget.nearest_stages(p, 8) for p in points], 3))
+
+    def zoom():
+        for delta in (-120, 120):
+            widget.wheelEvent(QWheelEvent(QPointF(600, 400), QPointF(600, 400), QPoint(0, 0), QPoint(0, delta),
+                                          Qt.NoButton, Qt.NoModifier, Qt.NoScrollPhase, False))
+    report('zoom out+in', timed(zoom, 20))
+    dragged = items[0]
+    report('drag step', timed(lambda: dragged.setPos(dragged.pos() + QPointF(7, 0)), 200))
+    widget.scene.clearSelection()
+
+
+def bench_load(count, project):
+    """Загрузка проекта целиком и восстановление всех блоков отменой удаления."""
+    widget = RoadMapWidget()
+    widget.resize(1200, 800)
+    changes = []
+    widget.project_changed.connect(lambda: changes.append(None))
+    report('load_project %d + %d links' % (count, len(project['connections'])),
+           timed(lambda: widget.load_project({**project, 'stages': [dict(stage) for stage in project['stages']]})))
+    report('project_changed emitted', value=len(changes))
+    if hasattr(widget, 'undo'):
+        widget.save_undo_state()
+        stages = [item for item in widget.scene.items() if isinstance(item, StageGraphicsItem)]
+        delete = lambda: [widget.delete_stage(item, save_state=False) for item in stages]
+        batch = getattr(widget, 'batch_update', None)
+        report('delete all stages', timed(lambda: _in_batch(batch, delete)))
+        report('undo: restore all stages', timed(widget.undo))
+    return widget
+
+
+def _in_batch(batch, fn):
+    if batch is None:
+        return fn()
+    with batch():
+        return fn()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stages', type=int, nargs='+', default=[1000, 10000], help='Размеры сцены')
+    parser.add_argument('--idle', type=float, default=3.0, help='Сколько секунд мерить простой')
+    parser.add_argument('--skip-load', action='store_true', help='Без load_project (на старых деревьях он квадратичен)')
+    args = parser.parse_args()
+    for count in args.stages:
+        print('%d stages' % count)
+        project, side = make_project(count)
+        widget, items = bench_build(count, project, side, args)
+        bench_queries(widget, items, side)
+        widget.clear()
+        widget.deleteLater()
+        app.processEvents()
+        if not args.skip_load:
+            widget = bench_load(count, project)
+            widget.clear()
+            widget.deleteLater()
+            app.processEvents()
+
+
+if __name__ == '__main__':
+    main()
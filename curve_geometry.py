@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Таблицы длины дуги и проекция точки на кривую.
+
+Путь (отрезки и кубические кривые Безье) один раз разбивается на
+ломаную; для неё хранятся накопленные длины и дерево охватывающих
+прямоугольников. После этого точка на заданной доле длины ищется
+двоичным поиском, а ближайшая к курсору точка - спуском по дереву с
+отсечением ветвей, вместо сотни вызовов pointAtPercent на каждое
+движение мыши. Модуль не зависит от Qt: QPainterPath читается только
+через elementCount()/elementAt().
+"""
+
+import math
+from bisect import bisect_right
+
+CURVE_SEGMENTS = 64   # Отрезков ломаной на одну кубическую кривую
+LEAF_SEGMENTS = 4     # Отрезков в листе дерева прямоугольников
+
+# Типы элементов QPainterPath (QPainterPath.ElementType)
+_MOVE_TO, _LINE_TO, _CURVE_TO = 0, 1, 2
+
+
+def cubic_point(p0, p1, p2, p3, u):
+    v = 1.0 - u
+    a, b, c, d = v * v * v, 3 * v * v * u, 3 * v * u * u, u * u * u
+    return (a * p0[0] + b * p1[0] + c * p2[0] + d * p3[0],
+            a * p0[1] + b * p1[1] + c * p2[1] + d * p3[1])
+
+
+def _project_on_segment(x, y, x1, y1, x2, y2):
+    """Доля отрезка (0..1) ближайшей точки и квадрат расстояния до неё."""
+    dx, dy = x2 - x1, y2 - y1
+    length_sq = dx * dx + dy * dy
+    f = 0.0 if length_sq == 0 else max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / length_sq))
+    px, py = x1 + f * dx, y1 + f * dy
+    return f, (x - px) * (x - px) + (y - py) * (y - py)
+
+
+class CurveLUT:
+    """Ломаная пути с таблицей накопленной длины и деревом прямоугольников."""
+
+    def __init__(self, points):
+        self.xs = [p[0] for p in points]
+        self.ys = [p[1] for p in points]
+        self.lengths = [0.0]
+        for i in range(1, len(points)):
+            self.lengths.append(self.lengths[-1] + math.hypot(self.xs[i] - self.xs[i - 1], self.ys[i] - self.ys[i - 1]))
+        self.length = self.lengths[-1]
+        self._nodes = []
+        if len(points) > 1:
+            self._build(0, len(points) - 1)
+
+    @classmethod
+    def from_line(cls, start, end):
+        return cls([start, end])
+
+    @classmethod
+    def from_cubic(cls, p0, p1, p2, p3, segments=CURVE_SEGMENTS):
+        return cls([cubic_point(p0, p1, p2, p3, i / segments) for i in range(segments + 1)])
+
+    @classmethod
+    def from_path(cls, path, segments=CURVE_SEGMENTS):
+        """Ломаная из QPainterPath (отрезки и кубические кривые первого подпути)."""
+        points = []
+        i, count = 0, path.elementCount()
+        while i < count:
+            element = path.elementAt(i)
+            if element.type == _CURVE_TO and i + 2 < count and points:
+                c1, c2 = path.elementAt(i + 1), path.elementAt(i + 2)
+                start = points[-1]
+                points.extend(cubic_point(start, (element.x, element.y), (c1.x, c1.y), (c2.x, c2.y), k / segments)
+                              for k in range(1, segments + 1))
+                i += 3
+                continue
+            if element.type == _MOVE_TO and points:
+                break
+            points.append((element.x, element.y))
+            i += 1
+        return cls(points or [(0.0, 0.0)])
+
+    def _build(self, first, last):
+        # Узел: (min_x, min_y, max_x, max_y, первый отрезок, последний отрезок, левый, правый)
+        index = len(self._nodes)
+        self._nodes.append(None)
+        xs, ys = self.xs[first:last + 1], self.ys[first:last + 1]
+        left = right = -1
+        if last - first > LEAF_SEGMENTS:
+            middle = (first + last) // 2
+            left = self._build(first, middle)
+            right = self._build(middle, last)
+        self._nodes[index] = (min(xs), min(ys), max(xs), max(ys), first, last, left, right)
+        return index
+
+    def point_at_percent(self, t):
+        """Точка на доле t (0..1) длины пути - двоичный поиск по таблице длин."""
+        if len(self.xs) == 1 or self.length == 0:
+            return self.xs[0], self.ys[0]
+        s = max(0.0, min(1.0, t)) * self.length
+        i = min(bisect_right(self.lengths, s), len(self.lengths) - 1)
+        span = self.lengths[i] - self.lengths[i - 1]
+        f = (s - self.lengths[i - 1]) / span if span else 0.0
+        return (self.xs[i - 1] + f * (self.xs[i] - self.xs[i - 1]),
+                self.ys[i - 1] + f * (self.ys[i] - self.ys[i - 1]))
+
+    def project(self, x, y):
+        """Ближайшая к (x, y) точка пути: (доля длины 0..1, px, py, расстояние)."""
+        if not self._nodes:
+            return 0.0, self.xs[0], self.ys[0], math.hypot(x - self.xs[0], y - self.ys[0])
+        best_sq, best_segment, best_f = float('inf'), 0, 0.0
+        stack = [0]
+        while stack:
+            min_x, min_y, max_x, max_y, first, last, left, right = self._nodes[stack.pop()]
+            dx = min_x - x if x < min_x else (x - max_x if x > max_x else 0.0)
+            dy = min_y - y if y < min_y else (y - max_y if y > max_y else 0.0)
+            if dx * dx + dy * dy >= best_sq:
+                continue   # Вся ветвь дальше уже найденной точки
+            if left < 0:
+                xs, ys = self.xs, self.ys
+                for i in range(first, last):
+                    f, dist_sq = _project_on_segment(x, y, xs[i], ys[i], xs[i + 1], ys[i + 1])
+                    if dist_sq < best_sq:
+                        best_sq, best_segment, best_f = dist_sq, i, f
+                continue
+            # Сначала ближняя половина: тогда дальняя чаще отсекается целиком
+            left_node, right_node = self._nodes[left], self._nodes[right]
+            if (x - (left_node[0] + left_node[2]) / 2) ** 2 + (y - (left_node[1] + left_node[3]) / 2) ** 2 < \
+               (x - (right_node[0] + right_node[2]) / 2) ** 2 + (y - (right_node[1] + right_node[3]) / 2) ** 2:
+                stack.extend((right, left))
+            else:
+                stack.extend((left, right))
+        i = best_segment
+        px = self.xs[i] + best_f * (self.xs[i + 1] - self.xs[i])
+        py = self.ys[i] + best_f * (self.ys[i + 1] - self.ys[i])
+        s = self.lengths[i] + best_f * (self.lengths[i + 1] - self.lengths[i])
+        return (s / self.length if self.length else 0.0), px, py, math.sqrt(best_sq)
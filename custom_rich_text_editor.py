@@ -1,14 +1,9 @@
 import re
-import json
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLineEdit, QPushButton, QApplication, QScrollArea, QDialog, QHBoxLayout, QSizePolicy, QLabel, QMessageBox
 from PyQt5.QtGui import QPainter, QFont, QColor, QKeyEvent, QFontMetrics, QClipboard
 from PyQt5.QtCore import Qt, QRect, QPoint, pyqtSignal, QTimer
 from glass_menu import GlassMenuButton
-
-class TextFragment:
-    def __init__(self, text, formats=None):
-        self.text = text
-        self.formats = formats or []
+from rich_text_model import TextFragment, combined_markers, fragments_to_raw, fragments_to_json, fragments_from_json, parse_markers
 
 class CustomRichTextEditor(QWidget):
     scroll_needed = pyqtSignal()  # Сигнал для уведомления о необходимости скролла
@@ -28,8 +23,7 @@ class CustomRichTextEditor(QWidget):
         # --- Курсор мигает ---
         self._cursor_visible = True
         self._cursor_timer = QTimer(self)
-        self._cursor_timer.timeout.connect(self._blink_cursor)
-        self._cursor_timer.start(500)
+        self._cursor_timer.timeout.connect(self._blink_cursor)  # Запускается только при фокусе
         self._last_keypress = 0
         # --- Стилизация ---
         self.setStyleSheet('''
@@ -46,23 +40,7 @@ class CustomRichTextEditor(QWidget):
         return editor
 
     def _rebuild_raw(self):
-        self.raw_text = ''
-        for frag in self.fragments:
-            text = frag.text
-            fmts = set(frag.formats)
-            if fmts == {'bold', 'italic'}:
-                text = f'***{text}***'
-            else:
-                for fmt in reversed(frag.formats):
-                    if fmt == 'bold':
-                        text = f'**{text}**'
-                    elif fmt == 'italic':
-                        text = f'*{text}*'
-                    elif fmt == 'strike':
-                        text = f'~~{text}~~'
-                    elif fmt == 'underline':
-                        text = f'__{text}__'
-            self.raw_text += text
+        self.raw_text = fragments_to_raw(self.fragments)
 
     def _split_text_into_words(self, text):
         """Разбивает текст на слова, сохраняя пробелы и знаки препинания"""
@@ -342,71 +320,12 @@ class CustomRichTextEditor(QWidget):
             parent.force_scroll_to_cursor()
 
     def apply_formatting_by_markers(self):
-        # Новый парсер: разбирает только те части текста, где есть маркеры, остальные фрагменты не трогает
-        def parse_fragments(fragments):
-            result = []
-            changed = False
-            for frag in fragments:
-                # Если фрагмент уже форматирован (frag.formats не пустой), оставляем как есть
-                if frag.formats:
-                    result.append(frag)
-                    continue
-                # Если во фрагменте есть маркеры — парсим его
-                text = frag.text
-                def parse(text, active_formats=None):
-                    if active_formats is None:
-                        active_formats = []
-                    patterns = [
-                        (r'\*\*\*([^*]+)\*\*\*', ['bold', 'italic']),
-                        (r'__([^_]+)__', ['underline']),
-                        (r'\*\*([^*]+)\*\*', ['bold']),
-                        (r'\*([^*]+)\*', ['italic']),
-                        (r'~~([^~]+)~~', ['strike']),
-                    ]
-                    fragments = []
-                    i = 0
-                    found_marker = False
-                    while i < len(text):
-                        nearest = None
-                        nearest_pat = None
-                        nearest_fmts = None
-                        nearest_start = None
-                        for pat, fmts in patterns:
-                            m = re.search(pat, text[i:])
-                            if m:
-                                start = m.start(0)
-                                if nearest is None or start < nearest_start:
-                                    nearest = m
-                                    nearest_pat = pat
-                                    nearest_fmts = fmts
-                                    nearest_start = start
-                        if nearest:
-                            # Добавить обычный текст до маркера
-                            if nearest_start > 0:
-                                frag_text = text[i:i+nearest_start]
-                                if frag_text:
-                                    fragments.append(TextFragment(frag_text, active_formats.copy()))
-                            found_marker = True
-                            inner = nearest.group(1)
-                            inner_frags = parse(inner, active_formats + nearest_fmts)[0]
-                            fragments.extend(inner_frags)
-                            i += nearest.start(0) + nearest.end(0)
-                        else:
-                            # Нет больше маркеров — добавляем остаток текста
-                            frag_text = text[i:]
-                            if frag_text:
-                                fragments.append(TextFragment(frag_text, active_formats.copy()))
-                            break
-                    return fragments, found_marker
-                new_frags, found_marker = parse(text)
-                if found_marker:
-                    result.extend(new_frags)
-                    changed = True
-                else:
-                    result.append(frag)
-            return result, changed
-        # Применяем только к неформатированным фрагментам
-        self.fragments, changed = parse_fragments(self.fragments)
+        # Разбираются только неформатированные фрагменты, в которых есть маркеры
+        result = []
+        for frag in self.fragments:
+            new_frags, found_marker = parse_markers(frag.text) if not frag.formats else ([], False)
+            result.extend(new_frags if found_marker else [frag])
+        self.fragments = result
         self.cursor_pos = len(self.get_display_text())
 
     def try_unformat_at_cursor(self):
@@ -473,12 +392,7 @@ class CustomRichTextEditor(QWidget):
 
     def get_combined_markers(self, formats):
         # Для bold+italic — ***, для остальных комбинаций — вложенные маркеры
-        fmts = set(formats)
-        if fmts == {'bold', 'italic'}:
-            return '***', '***'
-        markers = ''.join({'bold': '**', 'italic': '*', 'strike': '~~', 'underline': '__'}[fmt] for fmt in formats)
-        closing = ''.join({'bold': '**', 'italic': '*', 'strike': '~~', 'underline': '__'}[fmt] for fmt in reversed(formats))
-        return markers, closing
+        return combined_markers(formats)
 
     def get_raw_text(self):
         self._rebuild_raw()
@@ -486,27 +400,15 @@ class CustomRichTextEditor(QWidget):
 
     def to_json(self):
         """Сериализует фрагменты в JSON-строку"""
-        data = [
-            {"text": frag.text, "formats": frag.formats} for frag in self.fragments
-        ]
-        return json.dumps(data, ensure_ascii=False)
+        return fragments_to_json(self.fragments)
 
     def from_json(self, json_str):
-        """Восстанавливает фрагменты из JSON-строки"""
-        try:
-            data = json.loads(json_str)
-            self.fragments = [TextFragment(item["text"], item["formats"]) for item in data]
-            self.cursor_pos = sum(len(frag.text) for frag in self.fragments)
-            self.selection_start = self.selection_end = self.cursor_pos
-            self._rebuild_raw()
-            self.update()
-        except Exception as e:
-            # Если не удалось — сбрасываем в обычный текст
-            self.fragments = [TextFragment(json_str)]
-            self.cursor_pos = len(json_str)
-            self.selection_start = self.selection_end = self.cursor_pos
-            self._rebuild_raw()
-            self.update()
+        """Восстанавливает фрагменты из JSON-строки (не JSON - как обычный текст)"""
+        self.fragments = fragments_from_json(json_str)
+        self.cursor_pos = sum(len(frag.text) for frag in self.fragments)
+        self.selection_start = self.selection_end = self.cursor_pos
+        self._rebuild_raw()
+        self.update()
 
     def _get_scroll_offset(self):
         # scroll_offset больше не нужен, всегда возвращаем 0
@@ -754,11 +656,8 @@ class CustomRichTextEditor(QWidget):
                     fragments_to_copy.append(TextFragment(frag_text, frag.formats.copy()))
             pos += frag_len
         # Сохраняем в буфер обмена как сериализованный текст с маркерами
-        temp_editor = CustomRichTextEditor.create_temp_editor()
-        temp_editor.fragments = fragments_to_copy
-        temp_editor._rebuild_raw()
         clipboard = QApplication.clipboard()
-        clipboard.setText(temp_editor.raw_text)
+        clipboard.setText(fragments_to_raw(fragments_to_copy))
 
     def paste_clipboard(self):
         clipboard = QApplication.clipboard()
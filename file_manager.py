@@ -3,122 +3,93 @@
 
 import json
 import os
-import base64
+import zipfile
 from PIL import Image, ImageDraw, ImageFont
-from PyQt5.QtWidgets import QMessageBox
-from PyQt5.QtCore import QObject
+from PyQt5.QtCore import QObject, pyqtSignal
+from image_store import ImageStore
+from project_saver import BackgroundSaver
+from project_archive import (ARCHIVE_VERSION, STAGES_NAME, CONNECTIONS_NAME, MANIFEST_NAME, IMAGES_DIR,
+                             ProjectArchive, is_archive_path, to_archive_path, read_archive_header,
+                             write_project_archive, convert_legacy_json)
 
 class FileManager(QObject):
     """Менеджер файлов для работы с проектами RoadMap"""
+
+    project_saved = pyqtSignal(str)
+    save_failed = pyqtSignal(str, str)  # путь, текст ошибки
     
     def __init__(self, parent=None):
         super().__init__(parent)
         self.current_file_path = None
+        self.archive = None  # Открытый ProjectArchive последнего сохранения/загрузки
+        self._saver = BackgroundSaver(self)
+        self._saver.saved.connect(self._on_background_saved)
+        self._saver.failed.connect(self.save_failed)
+        self._saver_image_store = None
         
-    def save_project(self, file_path, project_data):
-        """Сохранение проекта в формате .rm"""
+    def save_project(self, file_path, project_data, image_store=None):
+        """Сохранение проекта в архив .rmap"""
         try:
-            # Подготавливаем данные для сохранения
-            save_data = {
-                'version': '1.0',
-                'project_info': {
-                    'name': project_data.get('name', 'Новый проект'),
-                    'description': project_data.get('description', ''),
-                    'created_date': project_data.get('created_date', ''),
-                    'modified_date': project_data.get('modified_date', '')
-                },
-                'stages': [],
-                'connections': project_data.get('connections', [])
-            }
-            
-            # Обрабатываем этапы
-            for stage in project_data.get('stages', []):
-                stage_data = stage.copy()
-                
-                # Обрабатываем изображения
-                if 'image_path' in stage_data and stage_data['image_path']:
-                    image_path = stage_data['image_path']
-                    if os.path.exists(image_path):
-                        # Кодируем изображение в base64
-                        with open(image_path, 'rb') as img_file:
-                            img_data = base64.b64encode(img_file.read()).decode('utf-8')
-                            stage_data['image_data'] = img_data
-                            stage_data['image_format'] = os.path.splitext(image_path)[1][1:].upper()
-                
-                # Сохраняем текст заметки для блокнота
-                if stage_data.get('type') == 'note' or stage_data.get('type') == 'txt':
-                    stage_data['note_text'] = stage.get('note_text', '')
-                
-                save_data['stages'].append(stage_data)
-            
-            # Сохраняем в JSON файл
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(save_data, f, ensure_ascii=False, indent=2)
-                
+            file_path = to_archive_path(file_path)
+            if image_store is None:
+                image_store = ImageStore()
+                for stage in project_data.get('stages', []):
+                    if stage.get('type') == 'image':
+                        image_store.adopt_stage_image(stage)
+            write_project_archive(file_path, project_data, image_store)
+            self._open_archive(file_path)
+            # Изображения, ещё не загруженные блоками, теперь читаются из нового файла
+            image_store.register_archive(self.archive)
             self.current_file_path = file_path
-            return True
+            return file_path
             
         except Exception as e:
             raise Exception(f"Ошибка сохранения проекта: {str(e)}")
             
-    def load_project(self, file_path):
-        """Загрузка проекта из формата .rm"""
+    def save_project_async(self, file_path, project_data, image_store):
+        """Сохранение проекта в фоне: снимок берётся сейчас, запись идёт в рабочем потоке.
+
+        Возвращает итоговый путь; о результате сообщают сигналы
+        project_saved и save_failed.
+        """
+        file_path = to_archive_path(file_path)
+        self._saver_image_store = image_store
+        self._saver.save(file_path, project_data, image_store)
+        self.current_file_path = file_path
+        return file_path
+
+    def is_saving(self):
+        return self._saver.is_busy()
+
+    def wait_for_saves(self):
+        self._saver.wait()
+
+    def _on_background_saved(self, file_path):
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                save_data = json.load(f)
-                
-            # Проверяем версию
-            version = save_data.get('version', '1.0')
-            if version != '1.0':
-                raise Exception(f"Неподдерживаемая версия файла: {version}")
-                
-            # Восстанавливаем данные проекта
-            project_data = {
-                'name': save_data.get('project_info', {}).get('name', 'Новый проект'),
-                'description': save_data.get('project_info', {}).get('description', ''),
-                'created_date': save_data.get('project_info', {}).get('created_date', ''),
-                'modified_date': save_data.get('project_info', {}).get('modified_date', ''),
-                'stages': [],
-                'connections': save_data.get('connections', [])
-            }
+            self._open_archive(file_path)
+            if self._saver_image_store is not None:
+                self._saver_image_store.register_archive(self.archive)
+        except Exception as e:
+            print(f"Ошибка открытия сохранённого проекта: {str(e)}")
+        self.project_saved.emit(file_path)
             
-            # Обрабатываем этапы
-            for stage_data in save_data.get('stages', []):
-                stage = stage_data.copy()
-                
-                # Восстанавливаем изображения
-                if 'image_data' in stage:
-                    try:
-                        # Создаем временную папку для изображений
-                        temp_dir = os.path.join(os.path.dirname(file_path), 'images')
-                        os.makedirs(temp_dir, exist_ok=True)
-                        
-                        # Декодируем и сохраняем изображение
-                        img_data = base64.b64decode(stage['image_data'])
-                        img_format = stage.get('image_format', 'PNG')
-                        img_filename = f"stage_{stage['id']}.{img_format.lower()}"
-                        img_path = os.path.join(temp_dir, img_filename)
-                        
-                        with open(img_path, 'wb') as img_file:
-                            img_file.write(img_data)
-                            
-                        stage['image_path'] = img_path
-                        
-                    except Exception as e:
-                        print(f"Ошибка восстановления изображения: {str(e)}")
-                        stage['image_path'] = ''
-                
-                # Восстанавливаем текст заметки для блокнота
-                if stage.get('type') == 'note' or stage.get('type') == 'txt':
-                    stage['note_text'] = stage_data.get('note_text', '')
-                
-                project_data['stages'].append(stage)
-                
+    def load_project(self, file_path):
+        """Загрузка проекта из архива .rmap; старые .json сначала конвертируются"""
+        try:
+            if not is_archive_path(file_path):
+                file_path = convert_legacy_json(file_path)
+            self._open_archive(file_path)
+            project_data = self.archive.load_project_data()
             self.current_file_path = file_path
             return project_data
             
         except Exception as e:
             raise Exception(f"Ошибка загрузки проекта: {str(e)}")
+
+    def _open_archive(self, file_path):
+        if self.archive is not None:
+            self.archive.close()
+        self.archive = ProjectArchive(file_path)
             
     def export_to_image(self, project_data, file_path, format='PNG', size=(1920, 1080)):
         """Экспорт проекта в изображение"""
@@ -416,32 +387,91 @@ class FileManager(QObject):
         except Exception as e:
             raise Exception(f"Ошибка экспорта в HTML: {str(e)}")
             
-    def get_file_info(self, file_path):
-        """Получение информации о файле проекта"""
+    def get_file_info(self, file_path, with_thumbnail=False):
+        """Получение информации о файле проекта
+
+        Для архивов читается только заголовок в начале файла (несколько КБ);
+        with_thumbnail=True добавляет в результат PNG-миниатюру ('thumbnail').
+        """
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                
-            project_info = data.get('project_info', {})
-            stages_count = len(data.get('stages', []))
-            connections_count = len(data.get('connections', []))
+            header = read_archive_header(file_path, with_thumbnail) if is_archive_path(file_path) else None
+            if header is not None:
+                project_info = header
+                stages_count = header.get('stages_count', 0)
+                connections_count = header.get('connections_count', 0)
+                version = header.get('version')
+            elif is_archive_path(file_path):
+                # Архив без заголовка: сведения есть только в manifest.json
+                archive = ProjectArchive(file_path)
+                try:
+                    manifest = archive.manifest
+                finally:
+                    archive.close()
+                project_info = manifest.get('project_info', {})
+                stages_count = manifest.get('stages_count', 0)
+                connections_count = manifest.get('connections_count', 0)
+                version = manifest.get('version')
+            else:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                project_info = data.get('project_info', {})
+                stages_count = len(data.get('stages', []))
+                connections_count = len(data.get('connections', []))
+                version = data.get('version', '1.0')
             
-            return {
+            info = {
                 'name': project_info.get('name', 'Неизвестный проект'),
                 'description': project_info.get('description', ''),
                 'created_date': project_info.get('created_date', ''),
                 'modified_date': project_info.get('modified_date', ''),
                 'stages_count': stages_count,
                 'connections_count': connections_count,
-                'version': data.get('version', '1.0')
+                'version': version
             }
+            if with_thumbnail:
+                info['thumbnail'] = header.get('thumbnail') if header else None
+            return info
             
         except Exception as e:
             raise Exception(f"Ошибка чтения информации о файле: {str(e)}")
             
-    def validate_project_file(self, file_path):
-        """Проверка корректности файла проекта"""
+    def validate_project_file(self, file_path, deep=False):
+        """Проверка корректности файла проекта
+
+        Для архива с заголовком по умолчанию проверяются заголовок (CRC,
+        формат, версия) и оглавление zip в конце файла: на месте ли все
+        части и столько ли изображений, сколько записано. deep=True
+        дополнительно разбирает все этапы.
+        """
         try:
+            header = read_archive_header(file_path) if is_archive_path(file_path) and not deep else None
+            if header is not None:
+                if header.get('version') != ARCHIVE_VERSION:
+                    return False, f"Неподдерживаемая версия: {header.get('version')}"
+                with zipfile.ZipFile(file_path, 'r') as zf:
+                    names = zf.namelist()
+                missing = [name for name in (MANIFEST_NAME, STAGES_NAME, CONNECTIONS_NAME) if name not in names]
+                if missing:
+                    return False, f"Отсутствует часть проекта: {missing[0]}"
+                images_count = sum(1 for name in names if name.startswith(IMAGES_DIR))
+                if images_count != header.get('images_count', images_count):
+                    return False, f"Не хватает изображений: {images_count} из {header['images_count']}"
+                return True, "Файл корректен"
+
+            if is_archive_path(file_path):
+                archive = ProjectArchive(file_path)
+                try:
+                    if archive.manifest.get('version') != ARCHIVE_VERSION:
+                        return False, f"Неподдерживаемая версия: {archive.manifest.get('version')}"
+                    for i, stage in enumerate(archive.iter_stages()):
+                        if 'id' not in stage:
+                            return False, f"Некорректный этап {i}: отсутствуют обязательные поля"
+                        if stage.get('image_hash') and not archive.has_image(stage['image_hash']):
+                            return False, f"Некорректный этап {i}: нет изображения {stage['image_hash']}"
+                finally:
+                    archive.close()
+                return True, "Файл корректен"
+
             with open(file_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
                 
@@ -463,7 +493,7 @@ class FileManager(QObject):
                     
             return True, "Файл корректен"
             
-        except json.JSONDecodeError:
-            return False, "Некорректный JSON файл"
+        except (json.JSONDecodeError, zipfile.BadZipFile, ValueError):
+            return False, "Некорректный файл проекта"
         except Exception as e:
             return False, f"Ошибка проверки файла: {str(e)}" 
\ No newline at end of file
@@ -0,0 +1,71 @@
+from PyQt5.QtWidgets import QWidget, QLabel, QHBoxLayout, QProgressBar
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QPainter, QColor, QBrush
+
+
+class GlassProgressIndicator(QWidget):
+    """Небольшая полупрозрачная плашка прогресса внизу окна (загрузка, сохранение, экспорт)."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setAttribute(Qt.WA_TranslucentBackground)
+        self.setAttribute(Qt.WA_TransparentForMouseEvents, True)
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(16, 8, 16, 8)
+        layout.setSpacing(12)
+        self.label = QLabel(self)
+        self.label.setStyleSheet('''
+            color: #fff;
+            font-size: 9pt;
+            font-family: 'Segoe UI', Arial, sans-serif;
+            background: transparent;
+        ''')
+        self.bar = QProgressBar(self)
+        self.bar.setTextVisible(False)
+        self.bar.setFixedSize(160, 6)
+        self.bar.setStyleSheet('''
+            QProgressBar {
+                background: rgba(255,255,255,0.25);
+                border: none;
+                border-radius: 3px;
+            }
+            QProgressBar::chunk {
+                background: rgba(255,255,255,0.9);
+                border-radius: 3px;
+            }
+        ''')
+        layout.addWidget(self.label)
+        layout.addWidget(self.bar)
+        self.hide()
+
+    def start(self, text):
+        self.label.setText(text)
+        self.bar.setRange(0, 0)  # Неопределённый прогресс, пока не известен объём
+        self._reposition()
+        self.show()
+        self.raise_()
+
+    def set_progress(self, done, total):
+        if total > 0:
+            self.bar.setRange(0, total)
+            self.bar.setValue(min(done, total))
+
+    def finish(self):
+        self.hide()
+
+    def _reposition(self):
+        self.adjustSize()
+        parent = self.parentWidget()
+        if parent:
+            self.move((parent.width() - self.width()) // 2, parent.height() - self.height() - 24)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        rect = self.rect().adjusted(1, 1, -1, -1)
+        painter.setBrush(QBrush(QColor(0, 0, 0, 145)))
+        painter.setPen(Qt.NoPen)
+        painter.drawRoundedRect(rect, 12, 12)
+        painter.setBrush(Qt.NoBrush)
+        painter.setPen(QColor(120, 120, 120, 120))
+        painter.drawRoundedRect(rect, 12, 12)
@@ -1,10 +1,11 @@
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QPushButton, QLabel, QHBoxLayout, QSizePolicy, QSpacerItem, QStyle, QGraphicsDropShadowEffect, QFileDialog
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QPushButton, QLabel, QHBoxLayout, QSizePolicy, QSpacerItem, QStyle, QGraphicsDropShadowEffect, QFileDialog, QScrollArea, QFrame
 from PyQt5.QtCore import QPropertyAnimation, Qt, QSize, QEvent, pyqtProperty, QRectF, pyqtSignal, QPoint
 from PyQt5.QtGui import QIcon, QPixmap, QPainter, QLinearGradient, QColor, QBrush, QPainterPath
 import os
 import base64
 import json
 from app_settings import load_settings, save_settings
+from project_cache import ProjectInfoCache, ProjectInfoWorker, file_signature
 
 AVATAR_PATH = 'avatar.png'
 
@@ -12,6 +13,7 @@ class GlassSidebarMenu(QWidget):
     open_project_requested = pyqtSignal()
     save_project_requested = pyqtSignal()
     export_png_requested = pyqtSignal()
+    recent_project_selected = pyqtSignal(str)
 
     def __init__(self, parent=None):
         super().__init__(parent, Qt.FramelessWindowHint | Qt.Tool)
@@ -77,7 +79,10 @@ class GlassSidebarMenu(QWidget):
         #     btn.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
         #     layout.addWidget(btn)
 
-        layout.addSpacerItem(QSpacerItem(20, 40, QSizePolicy.Minimum, QSizePolicy.Expanding))
+        # --- Недавние проекты ---
+        self.recent_projects = RecentProjectsList(self)
+        self.recent_projects.project_selected.connect(self.recent_project_selected)
+        layout.addWidget(self.recent_projects, 1)
 
         self.btn_theme = QPushButton(self.style().standardIcon(QStyle.SP_BrowserReload), '  Сменить тему', self)
         self.btn_theme.setIconSize(QSize(28, 28))
@@ -113,6 +118,7 @@ class GlassSidebarMenu(QWidget):
             self._animation.setEndValue(self._expanded_width)
             self._animation.start()
             self._is_expanded = True
+            self.recent_projects.refresh()
             self.show()
 
     def collapse(self):
@@ -150,6 +156,191 @@ class GlassSidebarMenu(QWidget):
         painter.drawRoundedRect(rect, 18, 18)
         super().paintEvent(event)
 
+class RecentProjectItem(QWidget):
+    """Строка списка недавних проектов: миниатюра, имя и число этапов."""
+
+    clicked = pyqtSignal(str)
+
+    def __init__(self, file_path, parent=None):
+        super().__init__(parent)
+        self.file_path = file_path
+        self.signature = None
+        self._hovered = False
+        self.setCursor(Qt.PointingHandCursor)
+        self.setToolTip(file_path)
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(12, 4, 12, 4)
+        layout.setSpacing(10)
+        self.thumbnail = QLabel(self)
+        self.thumbnail.setFixedSize(64, 44)
+        self.thumbnail.setAlignment(Qt.AlignCenter)
+        self.thumbnail.setStyleSheet('background: #f4f4f4; border: 1px solid #ddd; border-radius: 4px;')
+        layout.addWidget(self.thumbnail)
+        text_layout = QVBoxLayout()
+        text_layout.setSpacing(0)
+        self.name_label = QLabel(os.path.splitext(os.path.basename(file_path))[0], self)
+        self.name_label.setStyleSheet('color: #222; font-size: 9pt; background: transparent;')
+        self.details_label = QLabel('...', self)
+        self.details_label.setStyleSheet('color: #888; font-size: 8pt; background: transparent;')
+        text_layout.addWidget(self.name_label)
+        text_layout.addWidget(self.details_label)
+        layout.addLayout(text_layout, 1)
+
+    def set_info(self, signature, info, thumbnail):
+        self.signature = signature
+        fm = self.name_label.fontMetrics()
+        self.name_label.setText(fm.elidedText(info.get('name', ''), Qt.ElideRight, 130))
+        details = []
+        if info.get('stages_count') is not None:
+            details.append(f"{info['stages_count']} этапов")
+        if info.get('modified_date'):
+            details.append(info['modified_date'][:10])
+        self.details_label.setText(' · '.join(details))
+        pixmap = QPixmap()
+        if thumbnail and pixmap.loadFromData(thumbnail):
+            self.thumbnail.setPixmap(pixmap.scaled(self.thumbnail.size() - QSize(4, 4), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        else:
+            self.thumbnail.clear()
+
+    def set_error(self, message):
+        self.signature = None
+        self.details_label.setText(message)
+
+    def enterEvent(self, event):
+        self._hovered = True
+        self.update()
+        super().enterEvent(event)
+
+    def leaveEvent(self, event):
+        self._hovered = False
+        self.update()
+        super().leaveEvent(event)
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self.clicked.emit(self.file_path)
+            event.accept()
+            return
+        super().mousePressEvent(event)
+
+    def paintEvent(self, event):
+        if self._hovered:
+            painter = QPainter(self)
+            painter.setRenderHint(QPainter.Antialiasing)
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(QColor(0, 0, 0, 18))
+            painter.drawRoundedRect(QRectF(self.rect()).adjusted(4, 0, -4, 0), 8, 8)
+        super().paintEvent(event)
+
+class RecentProjectsList(QWidget):
+    """Список недавних проектов с миниатюрами.
+
+    Сведения берутся из ProjectInfoCache; файлы, которых нет в кэше или
+    которые изменились, читает ProjectInfoWorker в фоне (только заголовок
+    архива), так что просмотр списка никогда не загружает проект целиком.
+    """
+
+    project_selected = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.cache = ProjectInfoCache()
+        self._paths = []
+        self._items = {}
+        self._worker = None
+        self._queued = []
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 8, 0, 8)
+        layout.setSpacing(4)
+        title = QLabel('  Недавние проекты', self)
+        title.setStyleSheet('color: #666; font-size: 9pt; font-weight: bold; background: transparent;')
+        layout.addWidget(title)
+        scroll = QScrollArea(self)
+        scroll.setWidgetResizable(True)
+        scroll.setFrameShape(QFrame.NoFrame)
+        scroll.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        scroll.setStyleSheet('QScrollArea { background: transparent; } QScrollArea > QWidget > QWidget { background: transparent; }')
+        self._container = QWidget(scroll)
+        self._items_layout = QVBoxLayout(self._container)
+        self._items_layout.setContentsMargins(0, 0, 0, 0)
+        self._items_layout.setSpacing(2)
+        self._items_layout.addStretch(1)
+        scroll.setWidget(self._container)
+        layout.addWidget(scroll, 1)
+
+    def set_paths(self, paths):
+        self._paths = list(paths)
+        old_items, self._items = self._items, {}
+        for item in old_items.values():
+            self._items_layout.removeWidget(item)
+        for index, file_path in enumerate(self._paths):
+            # Уже показанные строки переиспользуются вместе с миниатюрой
+            item = old_items.pop(file_path, None)
+            if item is None:
+                item = RecentProjectItem(file_path, self._container)
+                item.clicked.connect(self.project_selected)
+            self._items_layout.insertWidget(index, item)
+            self._items[file_path] = item
+        for item in old_items.values():
+            item.deleteLater()
+        self.refresh()
+
+    def refresh(self):
+        """Обновляет строки, чьи файлы изменились с прошлого показа."""
+        misses = []
+        for file_path, item in self._items.items():
+            signature = file_signature(file_path)
+            if signature is None:
+                item.set_error('Файл не найден')
+                continue
+            if item.signature == signature:
+                continue
+            cached = self.cache.lookup(file_path)
+            if cached is not None:
+                item.set_info(signature, *cached)
+            else:
+                misses.append(file_path)
+        if misses:
+            self._queued = [path for path in self._queued if path not in misses] + misses
+            self._start_worker()
+
+    def _start_worker(self):
+        if self._worker is not None or not self._queued:
+            return
+        self._worker = ProjectInfoWorker(self._queued, self)
+        self._queued = []
+        self._worker.info_ready.connect(self._on_info_ready)
+        self._worker.info_failed.connect(self._on_info_failed)
+        self._worker.finished.connect(self._on_worker_finished)
+        self._worker.start()
+
+    def _on_info_ready(self, file_path, signature, info, thumbnail):
+        signature = tuple(signature)
+        try:
+            self.cache.store(file_path, signature, info, thumbnail)
+        except OSError as e:
+            print(f"Ошибка записи кэша проектов: {str(e)}")
+        item = self._items.get(file_path)
+        if item is not None:
+            item.set_info(signature, info, thumbnail)
+
+    def _on_info_failed(self, file_path, message):
+        item = self._items.get(file_path)
+        if item is not None:
+            item.set_error(message)
+
+    def _on_worker_finished(self):
+        self._worker.deleteLater()
+        self._worker = None
+        self._start_worker()
+
+    def stop(self):
+        """Останавливает чтение заголовков (перед закрытием окна)."""
+        self._queued = []
+        if self._worker is not None:
+            self._worker.requestInterruption()
+            self._worker.wait()
+
 class GradientHeader(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
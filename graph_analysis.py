@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Мосты и компоненты двусвязности по рёбрам для индекса графа.
+
+Фокус на половине связи спрашивает, какие блоки останутся по ту сторону
+связи, если её убрать. Если связь лежит на цикле, ответ - вся компонента
+связности; если это мост, то одна из двух частей, на которые он делит
+компоненту. Один обход в глубину (алгоритм Тарьяна) находит все мосты и
+раскладывает блоки в прямом порядке обхода: поддерево любой вершины -
+непрерывный отрезок этого порядка, поэтому обе стороны моста - срезы
+списка, а не новый обход графа.
+
+Результаты считаются лениво: первый запрос после изменения графа
+(GraphIndex.version) разбирает журнал изменений индекса. Связь внутри
+одной компоненты двусвязности мостов не меняет и ничего не сбрасывает;
+после удаления связи или блока заново обходится только его компонента
+связности, и её блоки раскладываются в тот же отрезок порядка (место
+удалённых блоков остаётся пустым до полного пересчёта). Связь с новым
+блоком или между разными компонентами, а также потерянный журнал
+пересчитывают всё. Ответы на запросы кэшируются, пока их компонента не
+изменилась. Направление связей не учитывается, параллельные связи между
+парой блоков считаются одним ребром.
+"""
+
+
+class GraphAnalysis:
+    def __init__(self, graph):
+        self.graph = graph
+        self._version = None
+        self._tin = {}            # номер -> позиция в прямом порядке обхода
+        self._tout = {}           # номер -> конец его поддерева в порядке обхода
+        self._parent = {}         # номер -> родитель в дереве обхода
+        self._component = {}      # номер -> (начало, конец) его компоненты в порядке обхода
+        self._label = {}          # номер -> верхний блок его компоненты двусвязности
+        self._order = []          # номера в прямом порядке обхода (None - место удалённого блока)
+        self._holes = 0           # Сколько мест в _order пустует
+        self._bridge_child = set()   # номера c, для которых ребро (родитель c, c) - мост
+        self._sides = {}          # (от кого, a, b) -> frozenset блоков
+
+    # --- Пересчёт ---
+    def _ensure(self):
+        version = self.graph.version
+        if self._version == version:
+            return
+        changes = self.graph.changes_since(self._version) if self._version is not None else None
+        if changes is None or not self._apply(changes):
+            self._compute()
+        self._version = version
+
+    def _compute(self):
+        self._tin, self._tout, self._parent = {}, {}, {}
+        self._component, self._label, self._bridge_child = {}, {}, set()
+        self._order = self._walk(self.graph.node_ids(), 0)
+        self._holes = 0
+        self._sides = {}
+
+    def _apply(self, changes):
+        # Разбирает журнал; False - нужен полный пересчёт
+        component, label = self._component, self._label
+        dirty = set()     # отрезки компонент, которые нужно обойти заново
+        added = {}        # новые блоки без связей, по порядку
+        for change in changes:
+            if change is None:
+                continue
+            kind, a, b = change
+            if kind == 'add_node':
+                added[a] = None
+            elif kind == 'remove_node':
+                if a in component:
+                    dirty.add(component[a])
+                added.pop(a, None)
+            elif a != b:
+                span = component.get(a)
+                if span is None or span != component.get(b):
+                    return False   # Связь с новым блоком или между компонентами
+                if kind == 'unlink' or span in dirty or label[a] != label[b]:
+                    dirty.add(span)
+        if (self._holes + sum(end - start for start, end in dirty)) * 2 > len(self._order) + len(added):
+            return False   # Обход затронул бы большую часть графа - проще пересчитать всё
+        changed = set()
+        for start, end in dirty:
+            changed.update(self._relayout(start, end))
+        for node_id in added:
+            position = len(self._order)
+            self._order.append(node_id)
+            self._tin[node_id], self._tout[node_id] = position, position + 1
+            self._parent[node_id] = None
+            component[node_id] = (position, position + 1)
+            label[node_id] = node_id
+        if changed:
+            self._sides = {key: side for key, side in self._sides.items() if key[0] not in changed}
+        return True
+
+    def _relayout(self, start, end):
+        # Заново обходит компоненту на отрезке [start, end) и кладёт её блоки в тот же отрезок
+        old = [node_id for node_id in self._order[start:end] if node_id is not None]
+        for node_id in old:
+            del self._tin[node_id], self._tout[node_id], self._parent[node_id]
+            del self._component[node_id], self._label[node_id]
+            self._bridge_child.discard(node_id)
+        node = self.graph.node
+        segment = self._walk([node_id for node_id in old if node(node_id) is not None], start)
+        self._order[start:end] = segment + [None] * (end - start - len(segment))
+        self._holes += len(old) - len(segment)
+        return old
+
+    def _walk(self, roots, offset):
+        # Обход Тарьяна от корней по порядку; позиции в порядке обхода начинаются с offset
+        graph = self.graph
+        tin, tout, parent, low = self._tin, self._tout, self._parent, {}
+        bridge_child, component, label = self._bridge_child, self._component, self._label
+        order = []
+        for root in roots:
+            if root in tin:
+                continue
+            start = len(order)
+            tin[root] = low[root] = offset + start
+            parent[root] = None
+            order.append(root)
+            stack = [(root, iter(graph.neighbor_ids(root)))]
+            while stack:
+                node, neighbors = stack[-1]
+                for other in neighbors:
+                    if other == node or other == parent[node]:
+                        continue
+                    if other in tin:
+                        if tin[other] < low[node]:
+                            low[node] = tin[other]
+                        continue
+                    parent[other] = node
+                    tin[other] = low[other] = offset + len(order)
+                    order.append(other)
+                    stack.append((other, iter(graph.neighbor_ids(other))))
+                    break
+                else:
+                    stack.pop()
+                    tout[node] = offset + len(order)
+                    up = parent[node]
+                    if up is not None:
+                        if low[node] < low[up]:
+                            low[up] = low[node]
+                        if low[node] > tin[up]:
+                            bridge_child.add(node)
+            span = (offset + start, offset + len(order))
+            for node_id in order[start:]:
+                component[node_id] = span
+                up = parent[node_id]
+                label[node_id] = node_id if up is None or node_id in bridge_child else label[up]
+        return order
+
+    def _bridge_child_of(self, a_id, b_id):
+        # Номер нижнего конца моста a-b или None, если a-b не мост
+        if self._parent.get(b_id) == a_id and b_id in self._bridge_child:
+            return b_id
+        if self._parent.get(a_id) == b_id and a_id in self._bridge_child:
+            return a_id
+        return None
+
+    def _nodes(self, node_ids):
+        node = self.graph.node
+        return frozenset(node(node_id) for node_id in node_ids)
+
+    # --- Запросы ---
+    def is_bridge(self, a, b):
+        """Разделит ли компоненту удаление всех связей между a и b."""
+        self._ensure()
+        a_id, b_id = self.graph.node_id(a), self.graph.node_id(b)
+        return a_id is not None and b_id is not None and self._bridge_child_of(a_id, b_id) is not None
+
+    def bridges(self):
+        """Мосты парами блоков (родитель в дереве обхода, потомок)."""
+        self._ensure()
+        node = self.graph.node
+        return [(node(self._parent[child]), node(child)) for child in self._bridge_child]
+
+    def component(self, node):
+        """Блоки компоненты связности, в которой лежит node."""
+        self._ensure()
+        node_id = self.graph.node_id(node)
+        if node_id is None:
+            return frozenset((node,))
+        start, end = self._component[node_id]
+        return self._nodes(self._order[start:end])
+
+    def two_edge_components(self):
+        """Компоненты двусвязности по рёбрам: списки блоков, между которыми только мосты."""
+        self._ensure()
+        groups = {}
+        for node_id in self._order:
+            if node_id is not None:
+                groups.setdefault(self._label[node_id], []).append(self.graph.node(node_id))
+        return list(groups.values())
+
+    def far_side(self, from_node, a, b):
+        """Блоки, достижимые из from_node, если убрать все связи между a и b.
+
+        То же, что GraphIndex.reachable(from_node, exclude=(a, b)), но без
+        обхода: компонента или одна сторона моста из кэша.
+        """
+        self._ensure()
+        graph = self.graph
+        from_id, a_id, b_id = graph.node_id(from_node), graph.node_id(a), graph.node_id(b)
+        if from_id is None:
+            return frozenset((from_node,))
+        key = (from_id, a_id, b_id)
+        side = self._sides.get(key)
+        if side is not None:
+            return side
+        start, end = self._component[from_id]
+        child = self._bridge_child_of(a_id, b_id) if a_id is not None and b_id is not None else None
+        if child is None or self._component[child] != (start, end):
+            side = self._nodes(self._order[start:end])
+        elif self._tin[child] <= self._tin[from_id] < self._tout[child]:
+            side = self._nodes(self._order[self._tin[child]:self._tout[child]])
+        else:
+            side = self._nodes(self._order[start:self._tin[child]] + self._order[self._tout[child]:end])
+        self._sides[key] = side
+        return side
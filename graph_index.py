@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Индекс графа блоков и связей.
+
+Блоки получают целые номера, для каждого номера хранятся множества
+соседей по исходящим и входящим связям, а пары номеров отображаются на
+объекты связей. Вид обновляет индекс при добавлении и удалении блоков и
+связей, поэтому поиск связи между двумя блоками - это обращение к
+словарю, а обход графа идёт по соседям, а не по всем элементам сцены.
+Модуль не зависит от Qt: узел - любой хешируемый объект, связь - объект
+с атрибутами start_item и end_item.
+"""
+
+from collections import deque
+
+CHANGE_LOG_LIMIT = 50000   # Сколько последних изменений помнит журнал для инкрементальных кэшей
+
+
+class GraphIndex:
+    def __init__(self):
+        self._ids = {}        # узел -> номер
+        self._nodes = {}      # номер -> узел
+        self._out = {}        # номер -> множество номеров, куда ведут связи
+        self._in = {}         # номер -> множество номеров, откуда ведут связи
+        self._edges = {}      # (номер начала, номер конца) -> {связь: None} (параллельные связи по порядку)
+        self._next_id = 0
+        self.version = 0      # Растёт при каждом изменении (для кэшей поверх индекса)
+        self._log = []        # Изменения после версии _log_start, по одному на каждый шаг version
+        self._log_start = 0
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, node):
+        return node in self._ids
+
+    def clear(self):
+        self._ids.clear()
+        self._nodes.clear()
+        self._out.clear()
+        self._in.clear()
+        self._edges.clear()
+        self.version += 1
+        self._log = []
+        self._log_start = self.version
+
+    def _changed(self, change):
+        if len(self._log) >= CHANGE_LOG_LIMIT:
+            self._log = []
+            self._log_start = self.version
+        self._log.append(change)
+        self.version += 1
+
+    def changes_since(self, version):
+        """Изменения после version или None, если журнал их уже не помнит.
+
+        Изменение - кортеж (вид, номер, номер): ('add_node', n, None),
+        ('remove_node', n, None), ('link', a, b), когда между a и b появилась
+        первая связь в любом направлении, ('unlink', a, b), когда исчезла
+        последняя. Параллельные связи соседство не меняют и дают None.
+        """
+        if version < self._log_start:
+            return None
+        return self._log[version - self._log_start:]
+
+    # --- Узлы ---
+    def node_id(self, node):
+        return self._ids.get(node)
+
+    def node(self, node_id):
+        return self._nodes.get(node_id)
+
+    def nodes(self):
+        return list(self._ids)
+
+    def node_ids(self):
+        return list(self._nodes)
+
+    def add_node(self, node):
+        node_id = self._ids.get(node)
+        if node_id is None:
+            node_id = self._next_id
+            self._next_id += 1
+            self._ids[node] = node_id
+            self._nodes[node_id] = node
+            self._out[node_id] = set()
+            self._in[node_id] = set()
+            self._changed(('add_node', node_id, None))
+        return node_id
+
+    def remove_node(self, node):
+        """Убирает узел вместе с его связями и возвращает эти связи."""
+        node_id = self._ids.get(node)
+        if node_id is None:
+            return []
+        removed = self.connections_of(node)
+        for connection in removed:
+            self.remove_edge(connection)
+        del self._ids[node], self._nodes[node_id], self._out[node_id], self._in[node_id]
+        self._changed(('remove_node', node_id, None))
+        return removed
+
+    # --- Связи ---
+    def add_edge(self, connection):
+        a, b = self.add_node(connection.start_item), self.add_node(connection.end_item)
+        linked = b in self._out[a] or b in self._in[a]
+        self._edges.setdefault((a, b), {})[connection] = None
+        self._out[a].add(b)
+        self._in[b].add(a)
+        self._changed(None if linked else ('link', a, b))
+
+    def remove_edge(self, connection):
+        a, b = self._ids.get(connection.start_item), self._ids.get(connection.end_item)
+        parallel = self._edges.get((a, b))
+        if not parallel or connection not in parallel:
+            return False
+        del parallel[connection]
+        change = None
+        if not parallel:
+            del self._edges[(a, b)]
+            self._out[a].discard(b)
+            self._in[b].discard(a)
+            if b not in self._out[a] and b not in self._in[a]:
+                change = ('unlink', a, b)
+        self._changed(change)
+        return True
+
+    def edge(self, start, end):
+        """Первая связь start -> end или None."""
+        parallel = self._edges.get((self._ids.get(start), self._ids.get(end)))
+        return next(iter(parallel)) if parallel else None
+
+    def edge_between(self, a, b):
+        """Первая связь между блоками в любом направлении или None."""
+        return self.edge(a, b) or self.edge(b, a)
+
+    def connections(self):
+        return [connection for parallel in self._edges.values() for connection in parallel]
+
+    def connections_of(self, node):
+        node_id = self._ids.get(node)
+        if node_id is None:
+            return []
+        found = []
+        for other in self._out[node_id]:
+            found.extend(self._edges[(node_id, other)])
+        for other in self._in[node_id]:
+            if other != node_id:
+                found.extend(self._edges[(other, node_id)])
+        return found
+
+    def edge_count(self):
+        return sum(len(parallel) for parallel in self._edges.values())
+
+    # --- Обход ---
+    def neighbor_ids(self, node_id):
+        """Соседи номера без учёта направления связей."""
+        return self._out[node_id] | self._in[node_id]
+
+    def neighbors(self, node):
+        node_id = self._ids.get(node)
+        if node_id is None:
+            return set()
+        return {self._nodes[other] for other in self.neighbor_ids(node_id)}
+
+    def degree(self, node):
+        return len(self.connections_of(node))
+
+    def reachable(self, start, exclude=None):
+        """Узлы, достижимые из start по связям в любом направлении.
+
+        exclude - пара узлов (a, b): все связи между ними, в обе стороны,
+        при обходе не учитываются.
+        """
+        start_id = self._ids.get(start)
+        if start_id is None:
+            return {start}
+        skip_a = skip_b = None
+        if exclude is not None:
+            skip_a, skip_b = self._ids.get(exclude[0]), self._ids.get(exclude[1])
+        visited = {start_id}
+        queue = deque([start_id])
+        while queue:
+            current = queue.popleft()
+            for other in self._out[current] | self._in[current]:
+                if other in visited:
+                    continue
+                if (current == skip_a and other == skip_b) or (current == skip_b and other == skip_a):
+                    continue
+                visited.add(other)
+                queue.append(other)
+        return {self._nodes[node_id] for node_id in visited}
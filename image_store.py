@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import base64
+import hashlib
+import os
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QImage, QPixmap
+from project_archive import ProjectArchive
+from sqlite_store import SqliteProjectStore, is_store_path
+
+
+class ImageStore:
+    """Хранилище изображений с адресацией по SHA-256.
+
+    Одинаковые изображения хранятся, декодируются и держатся в памяти один
+    раз; этапы ссылаются на них только по хэшу (stage_data['image_hash']).
+    Байты либо лежат в памяти, либо лениво читаются из архива проекта.
+    """
+
+    def __init__(self):
+        self._bytes = {}      # hash -> bytes (вставленные/импортированные изображения)
+        self._archives = {}   # hash -> ProjectArchive или SqliteProjectStore, из которого читать байты
+        self._formats = {}    # hash -> 'PNG' / 'JPG' / ...
+        self._images = {}     # hash -> декодированный QImage
+        self._pixmaps = {}    # (hash, width) -> QPixmap
+
+    @staticmethod
+    def hash_bytes(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def add_bytes(self, data, img_format='PNG'):
+        """Добавляет изображение из байтов и возвращает его хэш."""
+        image_hash = self.hash_bytes(data)
+        if image_hash not in self._bytes and image_hash not in self._archives:
+            self._bytes[image_hash] = data
+        self._formats.setdefault(image_hash, (img_format or 'PNG').upper())
+        return image_hash
+
+    def add_file(self, file_path):
+        """Добавляет изображение с диска и возвращает его хэш."""
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        return self.add_bytes(data, os.path.splitext(file_path)[1][1:] or 'PNG')
+
+    def adopt_stage_image(self, stage_data):
+        """Переводит этап со старыми image_path/image_data на ссылку image_hash."""
+        if stage_data.get('image_hash'):
+            return stage_data['image_hash']
+        image_hash = None
+        if stage_data.get('image_data'):
+            image_hash = self.add_bytes(base64.b64decode(stage_data['image_data']), stage_data.get('image_format', 'PNG'))
+        elif stage_data.get('image_path') and os.path.exists(stage_data['image_path']):
+            image_hash = self.add_file(stage_data['image_path'])
+        if image_hash:
+            stage_data['image_hash'] = image_hash
+            stage_data['image_format'] = self.image_format(image_hash)
+            stage_data.pop('image_data', None)
+            stage_data.pop('image_path', None)
+        return image_hash
+
+    def register_archive(self, archive):
+        """Подключает архив проекта как ленивый источник всех его изображений."""
+        for image_hash, info in archive.manifest.get('images', {}).items():
+            self._archives[image_hash] = archive
+            self._formats[image_hash] = info.get('format', 'PNG')
+            # Байты уже есть в архиве - копия в памяти больше не нужна
+            self._bytes.pop(image_hash, None)
+        for image_hash, info in archive.journal_images.items():
+            self.add_bytes(info['data'], info['format'])
+
+    def has(self, image_hash):
+        return image_hash in self._bytes or image_hash in self._archives
+
+    def image_format(self, image_hash):
+        return self._formats.get(image_hash, 'PNG')
+
+    def read_bytes(self, image_hash):
+        if image_hash in self._bytes:
+            return self._bytes[image_hash]
+        if image_hash in self._archives:
+            return self._archives[image_hash].read_image(image_hash)
+        raise KeyError(image_hash)
+
+    def release_handles(self):
+        """Закрывает открытые архивы (они переоткроются при следующем чтении)."""
+        for archive in set(self._archives.values()):
+            archive.close()
+
+    def snapshot(self):
+        """Неизменяемый снимок источников байтов для чтения из фонового потока."""
+        return ImageStoreSnapshot(
+            dict(self._bytes),
+            {image_hash: archive.file_path for image_hash, archive in self._archives.items()},
+            dict(self._formats))
+
+    def image(self, image_hash):
+        """Возвращает общий декодированный QImage (пустой, если хэш неизвестен)."""
+        image = self._images.get(image_hash)
+        if image is None:
+            try:
+                image = QImage.fromData(self.read_bytes(image_hash))
+            except KeyError:
+                return QImage()
+            self._images[image_hash] = image
+        return image
+
+    def pixmap(self, image_hash, width=None, cache=True):
+        """Возвращает QPixmap, при необходимости уменьшенный до ширины width.
+
+        Блоки с одинаковым изображением и шириной получают один и тот же
+        QPixmap. cache=False используется при интерактивном изменении
+        размера, чтобы промежуточные ширины не копились в памяти.
+        """
+        image = self.image(image_hash)
+        if image.isNull():
+            return QPixmap()
+        width = int(width) if width else image.width()
+        key = (image_hash, width)
+        pixmap = self._pixmaps.get(key)
+        if pixmap is None:
+            scaled = image if width == image.width() else image.scaledToWidth(width, Qt.SmoothTransformation)
+            pixmap = QPixmap.fromImage(scaled)
+            if not cache:
+                return pixmap
+            self._pixmaps[key] = pixmap
+        return pixmap
+
+    def prune(self, used_pixmaps):
+        """Освобождает декодированные изображения и масштабы, которые не используются блоками.
+
+        used_pixmaps - пары (hash, width) изображений, которые сейчас на сцене.
+        """
+        used_pixmaps = set(used_pixmaps)
+        used_hashes = {image_hash for image_hash, _ in used_pixmaps}
+        for image_hash in list(self._images):
+            if image_hash not in used_hashes:
+                del self._images[image_hash]
+        for key in list(self._pixmaps):
+            if key not in used_pixmaps:
+                del self._pixmaps[key]
+
+
+class ImageStoreSnapshot:
+    """Снимок ImageStore для фонового сохранения.
+
+    Архивы и базы открываются собственными дескрипторами при первом чтении,
+    поэтому снимок можно читать из рабочего потока, пока GUI-поток
+    пользуется хранилищем.
+    """
+
+    def __init__(self, data, archive_paths, formats):
+        self._bytes = data
+        self._archive_paths = archive_paths
+        self._formats = formats
+        self._sources = {}
+
+    def has(self, image_hash):
+        return image_hash in self._bytes or image_hash in self._archive_paths
+
+    def image_format(self, image_hash):
+        return self._formats.get(image_hash, 'PNG')
+
+    def read_bytes(self, image_hash):
+        if image_hash in self._bytes:
+            return self._bytes[image_hash]
+        path = self._archive_paths[image_hash]
+        if path not in self._sources:
+            self._sources[path] = SqliteProjectStore(path) if is_store_path(path) else ProjectArchive(path)
+        return self._sources[path].read_image(image_hash)
+
+    def release_handles(self):
+        for source in self._sources.values():
+            source.close()
+        self._sources.clear()
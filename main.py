@@ -6,8 +6,6 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QFileDialog, QMessageBox
 from PyQt5.QtCore import Qt, QTimer, QObject, QEvent
 from PyQt5.QtGui import QKeySequence
 
-import json
-import base64
 import os
 from app_settings import load_settings, save_settings
 
@@ -16,6 +14,14 @@ from file_manager import FileManager
 from glass_menu import GlassDialog
 from glass_sidebar_menu import GlassSidebarMenu
 from search_bar import GlassSearchBar
+from glass_progress import GlassProgressIndicator
+from project_loader import ProgressiveSceneLoader
+from project_archive import to_archive_path, new_checkpoint_id
+from project_journal import ProjectJournal, remove_journal
+from autosave import AutosaveScheduler
+from project_cache import load_recent_projects, add_recent_project, remove_recent_project
+from sqlite_store import SqliteProjectStore, is_store_path
+from tiled_export import DEFAULT_SCALE, DEFAULT_DPI
 
 MESSAGE_BOX_STYLESHEET = """
 QMessageBox {
@@ -48,6 +54,8 @@ QPushButton:pressed {
 """
 
 SETTINGS_PATH = 'settings.json'
+PROJECT_FILE_FILTER = 'Проекты RoadMap (*.rmap *.rmdb *.json);;RoadMap (*.rmap);;База RoadMap (*.rmdb);;JSON files (*.json)'
+SAVE_FILE_FILTER = 'RoadMap (*.rmap);;База RoadMap для больших карт (*.rmdb)'
 
 class LeftEdgeSensor(QWidget):
     def __init__(self, sidebar_menu, width=20, parent=None):
@@ -80,6 +88,8 @@ class GlobalHotkeyFilter(QObject):
                 self.main_window.roadmap_widget.toggle_grid()
                 return True
             if event.key() == Qt.Key_Escape:
+                if self.main_window.cancel_export():
+                    return True
                 search_bar = self.main_window.search_bar
                 # Скрываем только если реально видно
                 if search_bar.isVisible() and search_bar.windowOpacity() > 0.05:
@@ -107,6 +117,13 @@ class RoadMapApp(QMainWindow):
         
         self.sidebar = GlassSidebarMenu(self)
         self.search_bar = GlassSearchBar(self)
+        self.progress_indicator = GlassProgressIndicator(self)
+        self.project_loader = None
+        self.image_exporter = None  # Идущий экспорт в PNG
+        self.journal_mode = False  # Сохранять правки в журнал вместо перезаписи всего архива
+        self.autosave_scheduler = AutosaveScheduler(self.roadmap_widget, self)
+        self._recovery_record = None  # Копия восстановления, которая сейчас загружается
+        self._saved_generation = 0
         
         # --- Добавляем сенсор панели ---
         self.left_edge_sensor = LeftEdgeSensor(self.sidebar, width=20, parent=self)
@@ -121,6 +138,8 @@ class RoadMapApp(QMainWindow):
         self.load_settings_on_start()
         self.hotkey_filter = GlobalHotkeyFilter(self)
         QApplication.instance().installEventFilter(self.hotkey_filter)
+        # Предложение восстановить копию показываем, когда окно уже на экране
+        QTimer.singleShot(0, self._offer_recovery)
 
     def setup_hotkeys(self):
         QShortcut(QKeySequence("Shift+G"), self, self.roadmap_widget.toggle_grid)
@@ -132,9 +151,13 @@ class RoadMapApp(QMainWindow):
         # self.sidebar.add_txt_stage_button.clicked.connect(self.roadmap_widget.add_new_txt_stage)
         self.sidebar.save_project_requested.connect(self.save_project_as) # Используем save_as для кнопки
         self.sidebar.open_project_requested.connect(self.open_project)
+        self.sidebar.recent_project_selected.connect(self.open_recent_project)
         self.roadmap_widget.save_as_project_requested.connect(self.save_project_as)
         self.roadmap_widget.export_png_requested.connect(self.export_to_png)
         self.search_bar.search_triggered.connect(self.roadmap_widget.search_by_tag)
+        self.file_manager.project_saved.connect(self._on_project_saved)
+        self.file_manager.save_failed.connect(self._on_save_failed)
+        self.roadmap_widget.project_changed.connect(self.autosave_scheduler.mark_dirty)
         
     def load_settings_on_start(self):
         """
@@ -143,51 +166,247 @@ class RoadMapApp(QMainWindow):
         """
         if hasattr(self, 'sidebar') and hasattr(self.sidebar, 'avatar'):
             self.sidebar.avatar.load_avatar()
+        settings = load_settings()
+        self.journal_mode = settings.get('journal_mode', False)
+        # Для графов с десятками тысяч связей: все связи рисует один элемент сцены
+        self.roadmap_widget.set_connection_layer(settings.get('connection_layer', False))
+        self.sidebar.recent_projects.set_paths(load_recent_projects())
         
     def new_project(self):
         if self.confirm_action('Новый проект', 'Создать новый проект? Несохраненные изменения будут потеряны.'):
+            self.roadmap_widget.detach_journal()
             self.roadmap_widget.clear()
             self.current_file_path = None
+            self.autosave_scheduler.discard_recovery()
+            self.autosave_scheduler.source_path = None
+            self.autosave_scheduler.resume()
             
     def open_project(self):
-        file_path, _ = QFileDialog.getOpenFileName(self, 'Открыть проект', '', 'JSON files (*.json)')
+        file_path, _ = QFileDialog.getOpenFileName(self, 'Открыть проект', '', PROJECT_FILE_FILTER)
         if file_path:
-            self.current_file_path = file_path
-            with open(file_path, 'r', encoding='utf-8') as f:
-                project_data = json.load(f)
-                self.roadmap_widget.load_project(project_data)
+            self._load_project_file(file_path)
+
+    def open_recent_project(self, file_path):
+        if not os.path.exists(file_path):
+            QMessageBox.warning(self, 'Ошибка', f'Файл не найден: {file_path}')
+            self.sidebar.recent_projects.set_paths(remove_recent_project(file_path))
+            return
+        self._load_project_file(file_path)
+
+    def _remember_recent(self, file_path):
+        try:
+            self.sidebar.recent_projects.set_paths(add_recent_project(file_path))
+        except OSError as e:
+            print(f"Ошибка обновления списка недавних проектов: {str(e)}")
+
+    def _load_project_file(self, file_path):
+        if self.project_loader and self.project_loader.is_running():
+            self.project_loader.cancel()
+        self.roadmap_widget.detach_journal()
+        self.autosave_scheduler.suspend()
+        if is_store_path(file_path):
+            self._open_store(file_path)
+            return
+        # Файл разбирается в фоновом потоке, блоки появляются на сцене порциями
+        self.project_loader = ProgressiveSceneLoader(self.roadmap_widget, file_path, self)
+        self.project_loader.progress.connect(self.progress_indicator.set_progress)
+        self.project_loader.loaded.connect(self._on_project_loaded)
+        self.project_loader.failed.connect(self._on_project_load_failed)
+        self.progress_indicator.start('Загрузка проекта...')
+        self.project_loader.start()
+
+    def _on_project_loaded(self, archive_path):
+        self.progress_indicator.finish()
+        self.autosave_scheduler.resume()
+        record, self._recovery_record = self._recovery_record, None
+        if record is not None:
+            # Восстановленная копия сохраняется туда же, куда и исходный проект
+            self.current_file_path = record.get('source')
+            self.file_manager.current_file_path = self.current_file_path
+            self.autosave_scheduler.source_path = self.current_file_path
+            return
+        self.current_file_path = archive_path
+        self.file_manager.current_file_path = archive_path
+        self.autosave_scheduler.source_path = archive_path
+        self._remember_recent(archive_path)
+        checkpoint_id = self.project_loader.manifest.get('checkpoint_id')
+        if self.journal_mode and checkpoint_id:
+            self.roadmap_widget.attach_journal(ProjectJournal(
+                archive_path, checkpoint_id, self.roadmap_widget.get_project_data(), self.roadmap_widget.image_store))
+
+    def _open_store(self, file_path):
+        try:
+            store = SqliteProjectStore(file_path, self.roadmap_widget.image_store)
+            self.roadmap_widget.begin_load(store.project_header())
+            self.roadmap_widget.attach_store(store)
+        except Exception as e:
+            self._on_project_load_failed(f"Ошибка загрузки проекта: {str(e)}")
+            return
+        # Автосохранение остаётся выключенным: правки и так сразу пишутся в базу
+        self.current_file_path = file_path
+        self.file_manager.current_file_path = file_path
+        self.autosave_scheduler.source_path = file_path
+        self._remember_recent(file_path)
+
+    def _on_project_load_failed(self, message):
+        self.progress_indicator.finish()
+        self.autosave_scheduler.resume()
+        self._recovery_record = None
+        QMessageBox.critical(self, 'Ошибка', message)
+
+    def _finish_loading(self):
+        if self.project_loader and self.project_loader.is_running():
+            self.project_loader.finish_now()
                 
     def save_project(self):
         if self.current_file_path:
-            project_data = self.roadmap_widget.get_project_data()
-            with open(self.current_file_path, 'w', encoding='utf-8') as f:
-                json.dump(project_data, f, indent=2, ensure_ascii=False)
+            self._write_project(self.current_file_path)
         else:
             self.save_project_as()
                 
     def save_project_as(self):
-        file_path, _ = QFileDialog.getSaveFileName(self, 'Сохранить проект как', '', 'JSON files (*.json)')
+        file_path, _ = QFileDialog.getSaveFileName(self, 'Сохранить проект как', '', SAVE_FILE_FILTER)
         if file_path:
+            self._write_project(file_path)
+
+    def _write_project(self, file_path):
+        self._finish_loading()
+        store = self.roadmap_widget.store
+        if is_store_path(file_path):
+            self._write_store(file_path)
+            return
+        file_path = to_archive_path(file_path)
+        if store is not None:
+            # Из базы .rmap только экспортируется; открытой остаётся база
+            self.file_manager.save_project_async(file_path, self.roadmap_widget.get_project_data(), self.roadmap_widget.image_store)
+            self.file_manager.current_file_path = self.current_file_path
+            self.progress_indicator.start('Сохранение...')
+            return
+        journal = self.roadmap_widget.journal
+        self.roadmap_widget.flush_journal()
+        if journal is not None and journal.file_path == file_path and not journal.needs_compaction():
+            # Режим журнала: дописываем только изменения с прошлого сохранения
+            try:
+                journal.commit()
+                self.autosave_scheduler.discard_recovery()
+            except OSError as e:
+                self._on_save_failed(file_path, str(e))
             self.current_file_path = file_path
+            return
+        # На GUI-потоке только снимок данных; сжатие и запись идут в фоне
+        project_data = self.roadmap_widget.get_project_data()
+        if self.journal_mode:
+            self._begin_checkpoint(file_path, project_data)
+        self._saved_generation = self.autosave_scheduler.generation
+        self.current_file_path = self.file_manager.save_project_async(file_path, project_data, self.roadmap_widget.image_store)
+        self.autosave_scheduler.source_path = self.current_file_path
+        self.progress_indicator.start('Сохранение...')
+
+    def _write_store(self, file_path):
+        store = self.roadmap_widget.store
+        try:
+            if store is not None and os.path.abspath(store.file_path) == os.path.abspath(file_path):
+                # Правки уже в базе, дописываем только ещё не записанные
+                self.roadmap_widget.pager.write_through()
+                return
             project_data = self.roadmap_widget.get_project_data()
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(project_data, f, indent=2, ensure_ascii=False)
+            SqliteProjectStore.create(file_path, project_data, self.roadmap_widget.image_store)
+        except Exception as e:
+            self._on_save_failed(file_path, str(e))
+            return
+        # Дальше проект редактируется прямо в новой базе
+        self.autosave_scheduler.discard_recovery()
+        self._load_project_file(file_path)
+
+    def _begin_checkpoint(self, file_path, project_data):
+        # Полный архив становится новой контрольной точкой; правки, сделанные
+        # во время его записи, идут в журнал уже после метки
+        checkpoint_id = new_checkpoint_id()
+        project_data['checkpoint_id'] = checkpoint_id
+        journal = self.roadmap_widget.journal
+        try:
+            if journal is not None and journal.file_path == file_path:
+                journal.begin_checkpoint(checkpoint_id)
+            else:
+                self.roadmap_widget.attach_journal(ProjectJournal(file_path, checkpoint_id, project_data, self.roadmap_widget.image_store))
+        except OSError as e:
+            self.roadmap_widget.detach_journal()
+            print(f"Ошибка журнала проекта: {str(e)}")
+
+    def _on_project_saved(self, file_path):
+        if not self.file_manager.is_saving():
+            self.progress_indicator.finish()
+        self._remember_recent(file_path)
+        if self.autosave_scheduler.generation == self._saved_generation:
+            # Правок после снимка не было - копия восстановления больше не нужна
+            self.autosave_scheduler.discard_recovery()
+        journal = self.roadmap_widget.journal
+        try:
+            if journal is not None and journal.file_path == file_path:
+                journal.finish_checkpoint(self.file_manager.archive.manifest.get('checkpoint_id'))
+            else:
+                # Полный архив без журнала уже содержит все правки
+                remove_journal(file_path)
+        except OSError as e:
+            print(f"Ошибка сжатия журнала проекта: {str(e)}")
+
+    def _on_save_failed(self, file_path, message):
+        self.progress_indicator.finish()
+        QMessageBox.critical(self, 'Ошибка', f'Не удалось сохранить проект: {message}\nПредыдущая версия файла не изменена.')
                 
     def export_to_png(self):
         file_path, _ = QFileDialog.getSaveFileName(self, 'Экспорт в PNG', '', 'PNG файлы (*.png)')
         if file_path:
+            self.cancel_export()
+            settings = load_settings()
             try:
-                self.roadmap_widget.export_to_image(file_path, 'PNG')
+                exporter = self.roadmap_widget.export_to_image(
+                    file_path, settings.get('export_scale', DEFAULT_SCALE), settings.get('export_dpi', DEFAULT_DPI))
             except Exception as e:
                 QMessageBox.critical(self, 'Ошибка', f'Не удалось экспортировать: {str(e)}')
+                return
+            if exporter is None:
+                return
+            self.image_exporter = exporter
+            exporter.progress.connect(self.progress_indicator.set_progress)
+            exporter.finished.connect(self._on_export_finished)
+            exporter.failed.connect(self._on_export_failed)
+            self.progress_indicator.start('Экспорт в PNG... (Esc - отмена)')
+
+    def cancel_export(self):
+        """Отменяет идущий экспорт; возвращает True, если было что отменять."""
+        exporter, self.image_exporter = self.image_exporter, None
+        if exporter is None or not exporter.is_running():
+            return False
+        exporter.cancel()
+        exporter.deleteLater()
+        self.progress_indicator.finish()
+        return True
+
+    def _on_export_finished(self, file_path):
+        self.progress_indicator.finish()
+        self.image_exporter.deleteLater()
+        self.image_exporter = None
+
+    def _on_export_failed(self, message):
+        self.progress_indicator.finish()
+        self.image_exporter.deleteLater()
+        self.image_exporter = None
+        QMessageBox.critical(self, 'Ошибка', f'Не удалось экспортировать: {message}')
                 
-    def autosave(self):
-        if self.current_file_path:
-            try:
-                project_data = self.roadmap_widget.get_project_data()
-                self.file_manager.save_project(self.current_file_path, project_data)
-            except Exception:
-                pass 
+    def _offer_recovery(self):
+        record = self.autosave_scheduler.pending_recovery()
+        if record is None:
+            return
+        name = os.path.basename(record.get('source') or '') or 'без имени'
+        saved_at = record.get('saved_at', '').replace('T', ' ')
+        dlg = GlassDialog(f'Найдена автосохранённая копия проекта «{name}» от {saved_at}, более новая, чем сохранённый файл. Восстановить её?',
+                          [('Восстановить', 'yes'), ('Удалить', 'no')], parent=self)
+        if dlg.exec_() == 'yes':
+            self._recovery_record = record
+            self._load_project_file(record['path'])
+        else:
+            self.autosave_scheduler.discard_recovery()
     
     def confirm_action(self, title, text):
         dlg = GlassDialog(text, [('Да', 'yes'), ('Нет', 'no')], parent=self)
@@ -198,9 +417,21 @@ class RoadMapApp(QMainWindow):
         dlg = GlassDialog('Сохранить изменения перед выходом?', [('Сохранить', 'yes'), ('Не сохранять', 'no'), ('Отмена', 'cancel')], parent=self)
         result = dlg.exec_()
         if result == 'yes':
+            self.autosave_scheduler.suspend()
             self.save_project()
+            self.file_manager.wait_for_saves()
+            self.autosave_scheduler.wait()
+            self.cancel_export()
+            self.roadmap_widget.detach_journal()
+            self.sidebar.recent_projects.stop()
             event.accept()
         elif result == 'no':
+            self.autosave_scheduler.suspend()
+            self.autosave_scheduler.wait()
+            self.autosave_scheduler.discard_recovery()
+            self.cancel_export()
+            self.roadmap_widget.detach_journal()
+            self.sidebar.recent_projects.stop()
             event.accept()
         else:
             event.ignore()
@@ -224,6 +455,8 @@ class RoadMapApp(QMainWindow):
         # --- Обновляем высоту сенсора при изменении размера окна ---
         if hasattr(self, 'left_edge_sensor'):
             self.left_edge_sensor.setFixedHeight(self.height())
+        if hasattr(self, 'progress_indicator') and self.progress_indicator.isVisible():
+            self.progress_indicator._reposition()
 
 def main():
     app = QApplication(sys.argv)
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Контейнер проекта RoadMap (.rmap).
+
+Проект хранится как zip-архив:
+    header.json        - первый член архива без сжатия: имя, даты, счётчики, версия
+    thumbnail.png      - необязательная миниатюра, сразу за заголовком
+    manifest.json      - небольшой JSON с информацией о проекте и счётчиками
+    stages.jsonl       - по одному этапу на строку
+    connections.jsonl  - по одной связи на строку
+    images/<sha256>    - сырые байты изображений, каждое хранится один раз
+
+Изображения не декодируются при открытии архива: байты читаются только
+тогда, когда блок изображения их запрашивает через ImageStore.
+
+Заголовок лежит по фиксированному смещению 0, поэтому read_archive_header()
+читает только первые килобайты файла, не открывая zip целиком.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import struct
+import time
+import uuid
+import zipfile
+import zlib
+from datetime import datetime
+
+ARCHIVE_EXTENSION = '.rmap'
+ARCHIVE_FORMAT = 'roadmap-archive'
+ARCHIVE_VERSION = 2
+HEADER_NAME = 'header.json'
+THUMBNAIL_NAME = 'thumbnail.png'
+MANIFEST_NAME = 'manifest.json'
+STAGES_NAME = 'stages.jsonl'
+CONNECTIONS_NAME = 'connections.jsonl'
+IMAGES_DIR = 'images/'
+
+_LOCAL_FILE_HEADER = struct.Struct('<4sHHHHHIIIHH')  # Локальный заголовок члена zip (30 байт)
+_LOCAL_FILE_SIGNATURE = b'PK\x03\x04'
+
+
+def is_archive_path(file_path):
+    return os.path.splitext(file_path)[1].lower() == ARCHIVE_EXTENSION
+
+
+def to_archive_path(file_path):
+    """Путь, под которым проект будет сохранён (с расширением .rmap)."""
+    if is_archive_path(file_path):
+        return file_path
+    return os.path.splitext(file_path)[0] + ARCHIVE_EXTENSION
+
+
+def new_checkpoint_id():
+    return uuid.uuid4().hex
+
+
+class ProjectArchive:
+    """Открытый на чтение архив проекта с ленивым доступом к изображениям."""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._zip = None
+        self.journal_images = {}  # Изображения, добавленные журналом после записи архива
+        self.manifest = self._read_json(MANIFEST_NAME)
+        if self.manifest.get('format') != ARCHIVE_FORMAT:
+            raise ValueError(f"Файл не является архивом RoadMap: {file_path}")
+
+    def _archive(self):
+        if self._zip is None:
+            self._zip = zipfile.ZipFile(self.file_path, 'r')
+        return self._zip
+
+    def _read_json(self, name):
+        return json.loads(self._archive().read(name).decode('utf-8'))
+
+    def _iter_jsonl(self, name):
+        with self._archive().open(name) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line.decode('utf-8'))
+
+    def iter_stages(self):
+        return self._iter_jsonl(STAGES_NAME)
+
+    def iter_connections(self):
+        return self._iter_jsonl(CONNECTIONS_NAME)
+
+    def has_image(self, image_hash):
+        try:
+            self._archive().getinfo(IMAGES_DIR + image_hash)
+            return True
+        except KeyError:
+            return False
+
+    def read_image(self, image_hash):
+        """Читает байты изображения из архива по его SHA-256."""
+        return self._archive().read(IMAGES_DIR + image_hash)
+
+    def load_project_data(self):
+        """Собирает словарь проекта в формате RoadMapWidget.get_project_data().
+
+        Правки из журнала (.journal), сделанные после записи архива,
+        накладываются поверх него.
+        """
+        from project_journal import JournalOverlay, read_journal
+        overlay = JournalOverlay(read_journal(self.file_path, self.manifest.get('checkpoint_id')))
+        manifest = overlay.apply_manifest(self.manifest)
+        self.journal_images = overlay.images
+        project_data = {
+            'stages': list(overlay.iter_stages(self.iter_stages())),
+            'connections': list(overlay.iter_connections(self.iter_connections())),
+            'color_history': manifest.get('color_history', []),
+        }
+        project_data.update(manifest.get('project_info', {}))
+        if manifest.get('scene_rect'):
+            project_data['scene_rect'] = manifest['scene_rect']
+        return project_data
+
+    def reopen(self):
+        self.close()
+        self.manifest = self._read_json(MANIFEST_NAME)
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+
+
+def _read_stored_member(f, offset, name):
+    """Читает несжатый член zip по смещению его локального заголовка.
+
+    Возвращает (данные, смещение следующего члена) или (None, offset),
+    если по смещению лежит что-то другое.
+    """
+    f.seek(offset)
+    fixed = f.read(_LOCAL_FILE_HEADER.size)
+    if len(fixed) < _LOCAL_FILE_HEADER.size:
+        return None, offset
+    signature, _, flags, method, _, _, crc, compressed_size, _, name_len, extra_len = _LOCAL_FILE_HEADER.unpack(fixed)
+    # Бит 3: размеры записаны после данных, тогда заголовок так не прочитать
+    if signature != _LOCAL_FILE_SIGNATURE or method != zipfile.ZIP_STORED or flags & 0x08:
+        return None, offset
+    if f.read(name_len).decode('utf-8', 'replace') != name:
+        return None, offset
+    f.seek(extra_len, os.SEEK_CUR)
+    data = f.read(compressed_size)
+    if len(data) != compressed_size or zlib.crc32(data) != crc:
+        raise ValueError(f"Повреждён заголовок проекта: {name}")
+    return data, offset + _LOCAL_FILE_HEADER.size + name_len + extra_len + compressed_size
+
+
+def read_archive_header(file_path, with_thumbnail=False):
+    """Читает заголовок архива (и миниатюру), не разбирая остальной файл.
+
+    Возвращает None для архивов без заголовка - их сведения есть только в manifest.json.
+    """
+    with open(file_path, 'rb') as f:
+        data, next_offset = _read_stored_member(f, 0, HEADER_NAME)
+        if data is None:
+            return None
+        header = json.loads(data.decode('utf-8'))
+        if header.get('format') != ARCHIVE_FORMAT:
+            raise ValueError(f"Файл не является архивом RoadMap: {file_path}")
+        if with_thumbnail:
+            header['thumbnail'] = None
+            if header.get('has_thumbnail'):
+                header['thumbnail'], _ = _read_stored_member(f, next_offset, THUMBNAIL_NAME)
+    return header
+
+
+def write_project_archive(file_path, project_data, image_store, thumbnail=None):
+    """Записывает проект в архив .rmap.
+
+    Этапы-изображения ссылаются на image_store по image_hash; каждое
+    изображение попадает в архив один раз, сколько бы этапов его ни
+    использовали. Архив сначала пишется во временный файл рядом с целевым
+    и затем подменяет его, поэтому можно сохранять поверх открытого
+    архива, из которого читаются изображения.
+
+    thumbnail - необязательные байты PNG-миниатюры для быстрого просмотра.
+    """
+    stages = []
+    image_hashes = []
+    for stage in project_data.get('stages', []):
+        stage = dict(stage)
+        image_hash = stage.get('image_hash')
+        if image_hash and image_hash not in image_hashes and image_store.has(image_hash):
+            image_hashes.append(image_hash)
+        stages.append(stage)
+    connections = project_data.get('connections', [])
+    project_info = {
+        'name': project_data.get('name', 'Новый проект'),
+        'description': project_data.get('description', ''),
+        'created_date': project_data.get('created_date', ''),
+        'modified_date': project_data.get('modified_date') or datetime.now().isoformat(timespec='seconds'),
+    }
+    # Журнал изменений (.journal) привязывается к конкретной записи архива
+    checkpoint_id = project_data.get('checkpoint_id') or new_checkpoint_id()
+
+    header = dict(project_info)
+    header.update({
+        'format': ARCHIVE_FORMAT,
+        'version': ARCHIVE_VERSION,
+        'stages_count': len(stages),
+        'connections_count': len(connections),
+        'images_count': len(image_hashes),
+        'checkpoint_id': checkpoint_id,
+        'has_thumbnail': bool(thumbnail),
+    })
+    manifest = {
+        'format': ARCHIVE_FORMAT,
+        'version': ARCHIVE_VERSION,
+        'project_info': project_info,
+        'checkpoint_id': checkpoint_id,
+        'scene_rect': project_data.get('scene_rect'),
+        'color_history': project_data.get('color_history', []),
+        'stages_count': len(stages),
+        'connections_count': len(connections),
+        'images': {h: {'format': image_store.image_format(h)} for h in image_hashes},
+    }
+
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, temp_path = tempfile.mkstemp(prefix='.roadmap-', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as raw:
+            with zipfile.ZipFile(raw, 'w', zipfile.ZIP_DEFLATED) as zf:
+                # Заголовок и миниатюра идут первыми и без сжатия - их читают по смещению
+                zf.writestr(HEADER_NAME, json.dumps(header, ensure_ascii=False), compress_type=zipfile.ZIP_STORED)
+                if thumbnail:
+                    zf.writestr(THUMBNAIL_NAME, thumbnail, compress_type=zipfile.ZIP_STORED)
+                zf.writestr(MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False))
+                zf.writestr(STAGES_NAME, ''.join(json.dumps(s, ensure_ascii=False) + '\n' for s in stages))
+                zf.writestr(CONNECTIONS_NAME, ''.join(json.dumps(c, ensure_ascii=False) + '\n' for c in connections))
+                # Изображения уже сжаты (PNG/JPEG), повторно их не сжимаем
+                for image_hash in image_hashes:
+                    zf.writestr(IMAGES_DIR + image_hash, image_store.read_bytes(image_hash), compress_type=zipfile.ZIP_STORED)
+            # Источник изображений мог держать открытым тот же файл проекта
+            image_store.release_handles()
+            # Данные должны оказаться на диске до того, как файл подменит старый проект
+            raw.flush()
+            os.fsync(raw.fileno())
+        replace_file(temp_path, file_path)
+        fsync_directory(directory)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return manifest
+
+
+def replace_file(temp_path, file_path, attempts=5):
+    # mkstemp создаёт файл с правами 0600; сохраняем права прежнего файла
+    if os.path.exists(file_path):
+        shutil.copymode(file_path, temp_path)
+    else:
+        os.chmod(temp_path, 0o644)
+    # В Windows подмена не удаётся, пока целевой файл кем-то открыт на чтение
+    for attempt in range(attempts):
+        try:
+            os.replace(temp_path, file_path)
+            return
+        except PermissionError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.1 * (attempt + 1))
+
+
+def fsync_directory(directory):
+    if os.name != 'posix':
+        return
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def read_legacy_json(json_path, image_store):
+    """Читает проект старого формата .json (как из FileManager, так и из RoadMapApp).
+
+    Встроенные base64-изображения и файлы по image_path переносятся в image_store.
+    """
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    project_data = {
+        'stages': data.get('stages', []),
+        'connections': data.get('connections', []),
+        'color_history': data.get('color_history', []),
+    }
+    project_data.update(data.get('project_info', {}))
+    if data.get('scene_rect'):
+        project_data['scene_rect'] = data['scene_rect']
+    for stage in project_data['stages']:
+        if stage.get('type') == 'image':
+            image_store.adopt_stage_image(stage)
+    return project_data
+
+
+def convert_legacy_json(json_path, archive_path=None):
+    """Конвертирует старый .json проект в архив .rmap и возвращает путь к архиву.
+
+    Исходный .json не изменяется. Если рядом уже есть архив, записанный
+    после последнего изменения .json (прошлая конвертация), он и
+    возвращается - повторное открытие не плодит копии name_N.rmap.
+    """
+    from image_store import ImageStore
+    if archive_path is None:
+        base = os.path.splitext(json_path)[0]
+        archive_path = base + ARCHIVE_EXTENSION
+        counter = 1
+        while os.path.exists(archive_path):
+            if _is_converted_archive(archive_path, json_path):
+                return archive_path
+            archive_path = f"{base}_{counter}{ARCHIVE_EXTENSION}"
+            counter += 1
+    image_store = ImageStore()
+    write_project_archive(archive_path, read_legacy_json(json_path, image_store), image_store)
+    return archive_path
+
+
+def _is_converted_archive(archive_path, json_path):
+    # Архив RoadMap не старше .json - конвертировать заново нечего
+    try:
+        if os.path.getmtime(archive_path) < os.path.getmtime(json_path):
+            return False
+        if read_archive_header(archive_path) is not None:
+            return True
+        # Архив без заголовка (старая версия формата) узнаём по manifest.json
+        with zipfile.ZipFile(archive_path) as archive:
+            return MANIFEST_NAME in archive.namelist()
+    except (OSError, ValueError, zipfile.BadZipFile) as e:
+        print(f"Ошибка чтения архива {archive_path}: {str(e)}")
+        return False
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Кэш сведений о проектах для списка недавних проектов.
+
+Для каждого файла хранятся имя, счётчики и миниатюра из заголовка архива;
+запись действительна, пока у файла те же mtime и размер. Кэш лежит на
+диске (cache/index.json + миниатюры), ограничен по числу записей и объёму
+и вытесняет давно не использованные записи (LRU).
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from PyQt5.QtCore import QThread, pyqtSignal
+from app_settings import load_settings, save_settings
+from project_archive import ProjectArchive, is_archive_path, read_archive_header, replace_file
+from sqlite_store import is_store_path, read_store_header
+
+CACHE_DIR = 'cache'
+INDEX_NAME = 'index.json'
+MAX_ENTRIES = 200
+MAX_THUMBNAIL_BYTES = 16 * 1024 * 1024
+MAX_RECENT = 15
+
+
+def load_recent_projects():
+    return [path for path in load_settings().get('recent_projects', []) if isinstance(path, str)]
+
+
+def add_recent_project(file_path):
+    """Поднимает файл в начало списка недавних проектов и возвращает новый список."""
+    file_path = os.path.abspath(file_path)
+    recent = [file_path] + [path for path in load_recent_projects() if path != file_path]
+    settings = load_settings()
+    settings['recent_projects'] = recent[:MAX_RECENT]
+    save_settings(settings)
+    return settings['recent_projects']
+
+
+def remove_recent_project(file_path):
+    settings = load_settings()
+    settings['recent_projects'] = [path for path in load_recent_projects() if path != file_path]
+    save_settings(settings)
+    return settings['recent_projects']
+
+
+def file_signature(file_path):
+    """(mtime, size) файла или None, если его нет."""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+
+class ProjectInfoCache:
+    """Дисковый LRU-кэш сведений о проектах. Используется только из GUI-потока."""
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self._index_path = os.path.join(self.cache_dir, INDEX_NAME)
+        self._entries = OrderedDict()   # путь -> запись; в конце - недавно использованные
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self._index_path, 'r', encoding='utf-8') as f:
+                self._entries = OrderedDict(json.load(f))
+        except (OSError, ValueError):
+            self._entries = OrderedDict()
+
+    def lookup(self, file_path):
+        """Возвращает (info, thumbnail bytes) или None, если записи нет или файл изменился."""
+        entry = self._entries.get(file_path)
+        signature = file_signature(file_path)
+        if entry is None or signature is None or (entry['mtime'], entry['size']) != signature:
+            return None
+        self._entries.move_to_end(file_path)
+        thumbnail = None
+        if entry.get('thumbnail'):
+            try:
+                with open(os.path.join(self.cache_dir, entry['thumbnail']), 'rb') as f:
+                    thumbnail = f.read()
+            except OSError:
+                thumbnail = None
+        return entry['info'], thumbnail
+
+    def store(self, file_path, signature, info, thumbnail):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        thumbnail_name = None
+        if thumbnail:
+            thumbnail_name = hashlib.sha1(file_path.encode('utf-8')).hexdigest() + '.png'
+            with open(os.path.join(self.cache_dir, thumbnail_name), 'wb') as f:
+                f.write(thumbnail)
+        self._entries.pop(file_path, None)
+        self._entries[file_path] = {'mtime': signature[0], 'size': signature[1], 'info': info,
+                                    'thumbnail': thumbnail_name, 'thumbnail_size': len(thumbnail or b'')}
+        self._evict()
+        self._save()
+
+    def _evict(self):
+        total = sum(entry.get('thumbnail_size', 0) for entry in self._entries.values())
+        while self._entries and (len(self._entries) > MAX_ENTRIES or total > MAX_THUMBNAIL_BYTES):
+            _, entry = self._entries.popitem(last=False)
+            total -= entry.get('thumbnail_size', 0)
+            if entry.get('thumbnail'):
+                try:
+                    os.remove(os.path.join(self.cache_dir, entry['thumbnail']))
+                except OSError:
+                    pass
+
+    def _save(self):
+        fd, temp_path = tempfile.mkstemp(prefix='.index-', suffix='.tmp', dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            replace_file(temp_path, self._index_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+
+def read_project_info(file_path):
+    """Читает сведения о проекте для списка, не загружая проект.
+
+    Возвращает (info, thumbnail bytes или None). Для архивов читается
+    только заголовок, для баз .rmdb - таблица meta; старые .json целиком не разбираются - для них
+    показывается лишь имя файла.
+    """
+    info = {'name': os.path.splitext(os.path.basename(file_path))[0], 'stages_count': None, 'modified_date': ''}
+    if is_store_path(file_path):
+        header = read_store_header(file_path)
+    elif is_archive_path(file_path):
+        header = read_archive_header(file_path, with_thumbnail=True)
+    else:
+        return info, None
+    if header is None:
+        archive = ProjectArchive(file_path)
+        try:
+            header = dict(archive.manifest.get('project_info', {}))
+            header['stages_count'] = archive.manifest.get('stages_count')
+        finally:
+            archive.close()
+    if header.get('name') and header['name'] != 'Новый проект':
+        info['name'] = header['name']
+    info['stages_count'] = header.get('stages_count')
+    info['modified_date'] = header.get('modified_date', '')
+    return info, header.get('thumbnail')
+
+
+class ProjectInfoWorker(QThread):
+    """Читает заголовки проектов, которых нет в кэше, в фоновом потоке."""
+
+    info_ready = pyqtSignal(str, object, dict, bytes)   # путь, (mtime, size), сведения, миниатюра
+    info_failed = pyqtSignal(str, str)
+
+    def __init__(self, file_paths, parent=None):
+        super().__init__(parent)
+        self.file_paths = list(file_paths)
+
+    def run(self):
+        for file_path in self.file_paths:
+            if self.isInterruptionRequested():
+                return
+            signature = file_signature(file_path)
+            if signature is None:
+                self.info_failed.emit(file_path, "Файл не найден")
+                continue
+            try:
+                info, thumbnail = read_project_info(file_path)
+                self.info_ready.emit(file_path, signature, info, thumbnail or b'')
+            except Exception as e:
+                self.info_failed.emit(file_path, str(e))
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Журнал изменений проекта (<проект>.rmap.journal).
+
+В режиме журнала сохранение не переписывает весь архив: правки блоков
+дописываются в конец журнала небольшими JSON-строками, а полный архив
+(контрольная точка) пишется в фоне лишь время от времени. Формат строк:
+
+    {"op": "checkpoint", "id": ...}              - начало правок после архива с этим checkpoint_id
+    {"op": "add", "stage": {...}}                - новый этап целиком
+    {"op": "update", "id": ..., "fields": {...}, "unset": [...]}
+    {"op": "delete", "id": ...}
+    {"op": "connect" / "disconnect", "from": ..., "to": ...}
+    {"op": "meta", "fields": {...}}              - scene_rect, color_history
+    {"op": "image", "hash": ..., "format": ..., "data": base64}
+
+При загрузке применяются только записи после последней метки с
+checkpoint_id архива; журнал от чужой записи архива игнорируется.
+"""
+
+import base64
+import json
+import os
+import shutil
+import tempfile
+from project_archive import replace_file, fsync_directory
+
+JOURNAL_SUFFIX = '.journal'
+CHECKPOINT_OP = 'checkpoint'
+COMPACT_RECORDS = 5000               # После стольких записей пишется новая контрольная точка
+COMPACT_BYTES = 8 * 1024 * 1024      # ... или после стольких байт журнала
+
+
+def journal_path(archive_path):
+    return archive_path + JOURNAL_SUFFIX
+
+
+def remove_journal(archive_path):
+    path = journal_path(archive_path)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def read_journal(archive_path, checkpoint_id):
+    """Возвращает записи журнала, относящиеся к архиву с данным checkpoint_id."""
+    path = journal_path(archive_path)
+    if not checkpoint_id or not os.path.exists(path):
+        return []
+    records = None
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                record = json.loads(line.decode('utf-8'))
+            except ValueError:
+                break  # Оборванная при сбое последняя строка
+            if record.get('op') == CHECKPOINT_OP:
+                if record.get('id') == checkpoint_id:
+                    records = []
+                continue
+            if records is not None:
+                records.append(record)
+    return records or []
+
+
+def _stage_snapshot(stage):
+    stage = dict(stage)
+    pos = stage.get('position')
+    if isinstance(pos, dict):
+        stage['position'] = {'x': round(pos.get('x', 0), 2), 'y': round(pos.get('y', 0), 2)}
+    return stage
+
+
+def _project_meta(project_data):
+    return {'scene_rect': project_data.get('scene_rect'), 'color_history': list(project_data.get('color_history', []))}
+
+
+class JournalOverlay:
+    """Свёрнутые записи журнала, накладываемые на поток этапов и связей архива."""
+
+    def __init__(self, records):
+        self._stages = {}        # id -> ('stage', этап) | ('patch', поля, удалённые ключи) | None (удалён)
+        self._connections = {}   # (from, to) -> True (добавлена) / False (удалена)
+        self.meta = {}
+        self.images = {}         # hash -> {'format': ..., 'data': bytes}
+        for record in records:
+            self._apply(record)
+
+    def __bool__(self):
+        return bool(self._stages or self._connections or self.meta or self.images)
+
+    def _apply(self, record):
+        op = record.get('op')
+        if op == 'add':
+            stage = record['stage']
+            self._stages[stage['id']] = ('stage', dict(stage))
+        elif op == 'update':
+            stage_id = record['id']
+            fields, unset = record.get('fields', {}), record.get('unset', [])
+            state = self._stages.get(stage_id, ('patch', {}, set()))
+            if state is None:
+                return
+            if state[0] == 'patch':
+                state[2].difference_update(fields)
+                state[2].update(unset)
+            state[1].update(fields)
+            for key in unset:
+                state[1].pop(key, None)
+            self._stages[stage_id] = state
+        elif op == 'delete':
+            self._stages[record['id']] = None
+        elif op in ('connect', 'disconnect'):
+            self._connections[(record['from'], record['to'])] = op == 'connect'
+        elif op == 'meta':
+            self.meta.update(record.get('fields', {}))
+        elif op == 'image':
+            self.images[record['hash']] = {'format': record.get('format', 'PNG'),
+                                           'data': base64.b64decode(record['data'])}
+
+    def apply_manifest(self, manifest):
+        manifest = dict(manifest)
+        manifest.update(self.meta)
+        return manifest
+
+    def iter_stages(self, stages):
+        seen = set()
+        for stage in stages:
+            stage_id = stage.get('id')
+            seen.add(stage_id)
+            if stage_id not in self._stages:
+                yield stage
+                continue
+            state = self._stages[stage_id]
+            if state is None:
+                continue
+            if state[0] == 'stage':
+                yield dict(state[1])
+            else:
+                stage = dict(stage)
+                stage.update(state[1])
+                for key in state[2]:
+                    stage.pop(key, None)
+                yield stage
+        for stage_id, state in self._stages.items():
+            if stage_id not in seen and state is not None and state[0] == 'stage':
+                yield dict(state[1])
+
+    def iter_connections(self, connections):
+        seen = set()
+        for conn in connections:
+            key = (conn.get('from'), conn.get('to'))
+            if self._connections.get(key) is False:
+                continue
+            seen.add(key)
+            yield conn
+        for key, present in self._connections.items():
+            if present and key not in seen:
+                yield {'from': key[0], 'to': key[1]}
+
+
+class ProjectJournal:
+    """Журнал, открытый на дописывание для архива file_path.
+
+    Хранит последнее записанное состояние каждого этапа, поэтому в журнал
+    попадают только действительно изменившиеся поля. Записи копятся в
+    памяти и попадают на диск при commit() - это и есть сохранение в
+    режиме журнала.
+    """
+
+    def __init__(self, file_path, checkpoint_id, project_data, image_store):
+        self.file_path = file_path
+        self.path = journal_path(file_path)
+        self.checkpoint_id = checkpoint_id
+        self.image_store = image_store
+        self._stages = {stage['id']: _stage_snapshot(stage) for stage in project_data.get('stages', [])}
+        self._connections = {(conn['from'], conn['to']) for conn in project_data.get('connections', [])}
+        self._meta = _project_meta(project_data)
+        self._images = {stage['image_hash'] for stage in self._stages.values() if stage.get('image_hash')}
+        self._pending = []
+        self._marker_offsets = {}   # checkpoint_id -> смещение метки в файле
+        self.records_since_checkpoint = 0
+        self.bytes_since_checkpoint = 0
+        self._scan()
+        self._file = open(self.path, 'ab')
+        if checkpoint_id not in self._marker_offsets:
+            self._write_marker(checkpoint_id)
+
+    def _scan(self):
+        """Находит метку текущей контрольной точки и отрезает оборванный хвост."""
+        if not os.path.exists(self.path):
+            return
+        offset = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                if record.get('op') == CHECKPOINT_OP and record.get('id') == self.checkpoint_id:
+                    self._marker_offsets = {self.checkpoint_id: offset}
+                    self.records_since_checkpoint = 0
+                    self.bytes_since_checkpoint = 0
+                elif self._marker_offsets:
+                    self.records_since_checkpoint += 1
+                    self.bytes_since_checkpoint += len(line)
+                offset += len(line)
+        if os.path.getsize(self.path) > offset:
+            with open(self.path, 'r+b') as f:
+                f.truncate(offset)
+
+    def _write_marker(self, checkpoint_id):
+        self._marker_offsets[checkpoint_id] = self._file.tell()
+        self._file.write(self._encode({'op': CHECKPOINT_OP, 'id': checkpoint_id}))
+        self._sync()
+
+    @staticmethod
+    def _encode(record):
+        return (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    # --- Запись изменений ---
+
+    def stage_changed(self, stage):
+        snapshot = _stage_snapshot(stage)
+        stage_id = snapshot['id']
+        previous = self._stages.get(stage_id)
+        image_hash = snapshot.get('image_hash')
+        if image_hash and image_hash not in self._images and self.image_store.has(image_hash):
+            # Новое изображение попадает в журнал один раз, дальше на него ссылаются по хэшу
+            self._images.add(image_hash)
+            self._pending.append({'op': 'image', 'hash': image_hash, 'format': self.image_store.image_format(image_hash),
+                                  'data': base64.b64encode(self.image_store.read_bytes(image_hash)).decode('ascii')})
+        if previous is None:
+            self._pending.append({'op': 'add', 'stage': snapshot})
+        else:
+            fields = {key: value for key, value in snapshot.items() if previous.get(key) != value or key not in previous}
+            unset = [key for key in previous if key not in snapshot]
+            if fields or unset:
+                record = {'op': 'update', 'id': stage_id, 'fields': fields}
+                if unset:
+                    record['unset'] = unset
+                self._pending.append(record)
+        self._stages[stage_id] = snapshot
+
+    def stage_deleted(self, stage_id):
+        if self._stages.pop(stage_id, None) is not None:
+            self._pending.append({'op': 'delete', 'id': stage_id})
+
+    def connection_added(self, start_id, end_id):
+        if (start_id, end_id) not in self._connections:
+            self._connections.add((start_id, end_id))
+            self._pending.append({'op': 'connect', 'from': start_id, 'to': end_id})
+
+    def connection_removed(self, start_id, end_id):
+        if (start_id, end_id) in self._connections:
+            self._connections.discard((start_id, end_id))
+            self._pending.append({'op': 'disconnect', 'from': start_id, 'to': end_id})
+
+    def meta_changed(self, project_data):
+        meta = _project_meta(project_data)
+        fields = {key: value for key, value in meta.items() if self._meta.get(key) != value}
+        if fields:
+            self._meta.update(fields)
+            self._pending.append({'op': 'meta', 'fields': fields})
+
+    def has_pending(self):
+        return bool(self._pending)
+
+    def commit(self):
+        """Дописывает накопленные записи на диск. Возвращает их количество."""
+        if not self._pending:
+            return 0
+        data = b''.join(self._encode(record) for record in self._pending)
+        self._file.write(data)
+        self._sync()
+        count = len(self._pending)
+        self.records_since_checkpoint += count
+        self.bytes_since_checkpoint += len(data)
+        self._pending = []
+        return count
+
+    # --- Контрольные точки ---
+
+    def needs_compaction(self):
+        return self.records_since_checkpoint >= COMPACT_RECORDS or self.bytes_since_checkpoint >= COMPACT_BYTES
+
+    def begin_checkpoint(self, checkpoint_id):
+        """Отмечает место, с которого начнутся правки после нового полного архива.
+
+        Вызывается сразу после снимка проекта для фонового сохранения.
+        """
+        self.commit()
+        self._write_marker(checkpoint_id)
+        self.checkpoint_id = checkpoint_id
+        self.records_since_checkpoint = 0
+        self.bytes_since_checkpoint = 0
+
+    def finish_checkpoint(self, checkpoint_id):
+        """Сворачивает журнал после того, как архив с checkpoint_id записан на диск.
+
+        Всё, что было до метки, уже содержится в архиве, поэтому журнал
+        переписывается начиная с неё.
+        """
+        offset = self._marker_offsets.get(checkpoint_id)
+        if offset is None:
+            return
+        self._file.close()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(prefix='.roadmap-journal-', suffix='.tmp', dir=directory)
+        try:
+            with open(self.path, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+                src.seek(offset)
+                shutil.copyfileobj(src, dst)
+                dst.flush()
+                os.fsync(dst.fileno())
+            replace_file(temp_path, self.path)
+            fsync_directory(directory)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        finally:
+            self._file = open(self.path, 'ab')
+        self._marker_offsets = {key: value - offset for key, value in self._marker_offsets.items() if value >= offset}
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import heapq
+import itertools
+import math
+import time
+from collections import defaultdict
+from PyQt5.QtCore import QObject, QThread, QTimer, QCoreApplication, QEvent, pyqtSignal
+from project_archive import ProjectArchive, is_archive_path, convert_legacy_json
+from project_journal import JournalOverlay, read_journal
+
+STAGE_BATCH_SIZE = 500      # Сколько этапов поток разбора отдаёт за один сигнал
+FRAME_BUDGET = 0.012        # Сколько секунд за кадр GUI-поток тратит на создание блоков
+
+
+class ProjectLoadWorker(QThread):
+    """Разбирает проект построчно в отдельном потоке и отдаёт этапы пачками."""
+
+    header_loaded = pyqtSignal(str, dict, dict)   # путь к архиву, manifest, изображения из журнала
+    stages_parsed = pyqtSignal(list)
+    connections_parsed = pyqtSignal(list)
+    failed = pyqtSignal(str)
+
+    def __init__(self, file_path, parent=None):
+        super().__init__(parent)
+        self.file_path = file_path
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        try:
+            archive_path = self.file_path
+            if not is_archive_path(archive_path):
+                # Старый .json конвертируется здесь же, не блокируя интерфейс
+                archive_path = convert_legacy_json(archive_path)
+            archive = ProjectArchive(archive_path)
+            try:
+                # Правки из журнала накладываются на поток этапов без чтения архива целиком
+                overlay = JournalOverlay(read_journal(archive_path, archive.manifest.get('checkpoint_id')))
+                self.header_loaded.emit(archive_path, overlay.apply_manifest(archive.manifest), overlay.images)
+                self._emit_batches(overlay.iter_stages(archive.iter_stages()), self.stages_parsed)
+                self._emit_batches(overlay.iter_connections(archive.iter_connections()), self.connections_parsed)
+            finally:
+                archive.close()
+        except Exception as e:
+            self.failed.emit(f"Ошибка загрузки проекта: {str(e)}")
+
+    def _emit_batches(self, records, signal):
+        batch = []
+        for record in records:
+            if self._cancelled:
+                return
+            batch.append(record)
+            if len(batch) >= STAGE_BATCH_SIZE:
+                signal.emit(batch)
+                batch = []
+        if batch and not self._cancelled:
+            signal.emit(batch)
+
+
+class ProgressiveSceneLoader(QObject):
+    """Наполняет RoadMapWidget этапами по мере разбора файла.
+
+    Этапы создаются порциями, укладывающимися в FRAME_BUDGET, начиная с
+    ближайших к центру видимой области, так что первый экран появляется
+    задолго до конца загрузки. Связи создаются, как только на сцене есть
+    оба их конца.
+    """
+
+    progress = pyqtSignal(int, int)   # создано этапов, всего этапов
+    loaded = pyqtSignal(str)          # путь к открытому архиву
+    failed = pyqtSignal(str)
+
+    def __init__(self, widget, file_path, parent=None):
+        super().__init__(parent)
+        self.widget = widget
+        self.archive_path = None
+        self.manifest = {}
+        self._heap = []
+        self._order = itertools.count()
+        self._items_by_id = {}
+        self._pending_connections = defaultdict(list)
+        self._center = (0.0, 0.0)
+        self._total = 0
+        self._done = 0
+        self._failed = False
+        self._finished = False
+        self._worker_done = False   # Сигнал finished доставлен: все пачки этапов и связей уже пришли
+        self._pump_timer = QTimer(self)
+        self._pump_timer.setInterval(0)
+        self._pump_timer.timeout.connect(self._pump)
+        self.worker = ProjectLoadWorker(file_path)
+        self.worker.header_loaded.connect(self._on_header)
+        self.worker.stages_parsed.connect(self._on_stages)
+        self.worker.connections_parsed.connect(self._on_connections)
+        self.worker.failed.connect(self._on_failed)
+        self.worker.finished.connect(self._on_worker_finished)
+
+    def start(self):
+        # Блоки загрузки - не правки пользователя: клик по сцене во время загрузки не должен открыть шаг отмены с ними
+        self.widget.undo_engine.suspend()
+        self.worker.start()
+
+    def is_running(self):
+        return not self._finished and not self._failed
+
+    def cancel(self):
+        self._finished = True
+        self.worker.cancel()
+        self.worker.wait()
+        self._pump_timer.stop()
+        self._heap.clear()
+        self.widget.undo_engine.resume()
+
+    def finish_now(self):
+        """Синхронно дозагружает проект (например, перед сохранением)."""
+        self.worker.wait()
+        # Доставляем сигналы потока, которые ещё стоят в очереди
+        QCoreApplication.sendPostedEvents(None, QEvent.MetaCall)
+        self._worker_done = True
+        with self.widget.batch_update():
+            while self._heap:
+                self._materialize_next()
+        self._pump()
+
+    def _on_header(self, archive_path, manifest, journal_images):
+        if self._finished:
+            return
+        self.archive_path = archive_path
+        self.manifest = manifest
+        header = dict(manifest.get('project_info', {}))
+        header['scene_rect'] = manifest.get('scene_rect')
+        header['color_history'] = manifest.get('color_history', [])
+        self.widget.begin_load(header)
+        archive = ProjectArchive(archive_path)
+        archive.journal_images = journal_images
+        self.widget.image_store.register_archive(archive)
+        self._total = manifest.get('stages_count', 0)
+        center = self.widget.mapToScene(self.widget.viewport().rect().center())
+        self._center = (center.x(), center.y())
+        self.progress.emit(0, self._total)
+
+    def _on_stages(self, stages):
+        if self._finished:
+            return
+        cx, cy = self._center
+        for stage in stages:
+            pos = stage.get('position') or {}
+            distance = math.hypot(pos.get('x', 0) - cx, pos.get('y', 0) - cy)
+            heapq.heappush(self._heap, (distance, next(self._order), stage))
+        self._pump_timer.start()
+
+    def _on_connections(self, connections):
+        if self._finished:
+            return
+        for conn in connections:
+            start_id, end_id = conn.get('from'), conn.get('to')
+            if start_id in self._items_by_id and end_id in self._items_by_id:
+                self._connect(start_id, end_id)
+            else:
+                missing_id = end_id if start_id in self._items_by_id else start_id
+                self._pending_connections[missing_id].append((start_id, end_id))
+
+    def _on_worker_finished(self):
+        # finished ставится в очередь после всех сигналов с данными, поэтому загрузка завершается только отсюда
+        self._worker_done = True
+        if not self._finished:
+            self._pump_timer.start()
+
+    def _on_failed(self, message):
+        self._failed = True
+        self._pump_timer.stop()
+        self.widget.undo_engine.resume()
+        self.failed.emit(message)
+
+    def _connect(self, start_id, end_id):
+        self.widget.add_connection(self._items_by_id[start_id], self._items_by_id[end_id], save_state=False)
+
+    def _materialize_next(self):
+        _, _, stage = heapq.heappop(self._heap)
+        item = self.widget.materialize_stage(stage)
+        stage_id = item.stage_data['id']
+        self._items_by_id[stage_id] = item
+        self._done += 1
+        for start_id, end_id in self._pending_connections.pop(stage_id, []):
+            if start_id in self._items_by_id and end_id in self._items_by_id:
+                self._connect(start_id, end_id)
+            else:
+                missing_id = end_id if start_id in self._items_by_id else start_id
+                self._pending_connections[missing_id].append((start_id, end_id))
+
+    def _pump(self):
+        deadline = time.perf_counter() + FRAME_BUDGET
+        # Порция кадра - один пакет: project_changed и реакция на выделение один раз, а не на каждый блок
+        with self.widget.batch_update():
+            while self._heap and time.perf_counter() < deadline:
+                self._materialize_next()
+        self.progress.emit(self._done, max(self._total, self._done))
+        if self._heap:
+            return
+        # Очередь пуста: таймер снова запустят следующая пачка этапов или завершение потока
+        self._pump_timer.stop()
+        if not self._worker_done:
+            return
+        if not self._failed and not self._finished and self.archive_path:
+            self._finished = True
+            self._pending_connections.clear()
+            self.widget.undo_engine.resume()
+            self.loaded.emit(self.archive_path)
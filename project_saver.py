@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+from PyQt5.QtCore import QObject, QThread, QCoreApplication, QEvent, pyqtSignal
+from project_archive import write_project_archive
+from project_thumbnail import render_thumbnail
+
+
+def snapshot_project_data(project_data):
+    """Дешёвый снимок get_project_data(), не разделяющий изменяемые словари со сценой.
+
+    Значения этапов - строки и числа, поэтому достаточно поверхностной
+    копии каждого словаря и его позиции.
+    """
+    snapshot = dict(project_data)
+    stages = []
+    for stage in project_data.get('stages', []):
+        stage = dict(stage)
+        if isinstance(stage.get('position'), dict):
+            stage['position'] = dict(stage['position'])
+        stages.append(stage)
+    snapshot['stages'] = stages
+    snapshot['connections'] = [dict(conn) for conn in project_data.get('connections', [])]
+    snapshot['color_history'] = list(project_data.get('color_history', []))
+    return snapshot
+
+
+class ProjectSaveWorker(QThread):
+    """Сериализует, сжимает и атомарно записывает снимок проекта вне GUI-потока."""
+
+    saved = pyqtSignal(str)
+    failed = pyqtSignal(str, str)   # путь, текст ошибки
+
+    def __init__(self, file_path, project_data, images, parent=None):
+        super().__init__(parent)
+        self.file_path = file_path
+        self.project_data = project_data
+        self.images = images
+
+    def run(self):
+        try:
+            try:
+                thumbnail = render_thumbnail(self.project_data)
+            except Exception as e:
+                # Без миниатюры проект всё равно сохраняется
+                print(f"Ошибка создания миниатюры: {str(e)}")
+                thumbnail = None
+            write_project_archive(self.file_path, self.project_data, self.images, thumbnail)
+            self.saved.emit(self.file_path)
+        except Exception as e:
+            self.failed.emit(self.file_path, str(e))
+        finally:
+            self.images.release_handles()
+
+
+class BackgroundSaver(QObject):
+    """Очередь фоновых сохранений.
+
+    Одновременно пишется только один файл; если во время записи приходят
+    новые запросы, для каждого пути сохраняется только самый свежий снимок.
+    Неудачная запись не трогает предыдущую версию файла.
+    """
+
+    saved = pyqtSignal(str)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._worker = None
+        self._pending = OrderedDict()   # путь -> (снимок проекта, снимок изображений)
+
+    def save(self, file_path, project_data, image_store):
+        # Снимок берётся сразу, чтобы дальнейшие правки не попали в этот файл
+        job = (snapshot_project_data(project_data), image_store.snapshot())
+        image_store.release_handles()
+        if self._worker is not None:
+            self._pending.pop(file_path, None)
+            self._pending[file_path] = job
+            return
+        self._start(file_path, job)
+
+    def discard(self, file_path):
+        """Отменяет ещё не начатое сохранение в file_path."""
+        self._pending.pop(file_path, None)
+
+    def is_busy(self):
+        return self._worker is not None
+
+    def wait(self):
+        """Дожидается окончания всех сохранений (например, при закрытии окна)."""
+        while self._worker is not None:
+            self._worker.wait()
+            QCoreApplication.sendPostedEvents(None, QEvent.MetaCall)
+
+    def _start(self, file_path, job):
+        project_data, images = job
+        self._worker = ProjectSaveWorker(file_path, project_data, images)
+        self._worker.saved.connect(self.saved)
+        self._worker.failed.connect(self.failed)
+        self._worker.finished.connect(self._on_worker_finished)
+        self._worker.start()
+
+    def _on_worker_finished(self):
+        if self._worker is None:
+            return
+        self._worker.deleteLater()
+        self._worker = None
+        if self._pending:
+            file_path, job = self._pending.popitem(last=False)
+            self._start(file_path, job)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from PyQt5.QtCore import Qt, QRectF, QBuffer, QByteArray, QIODevice
+from PyQt5.QtGui import QImage, QPainter, QColor, QPen
+
+THUMBNAIL_SIZE = 256   # Длинная сторона миниатюры в пикселях
+
+
+def render_thumbnail(project_data, size=THUMBNAIL_SIZE):
+    """Рисует схематичную миниатюру проекта (рамки этапов и связи) и возвращает PNG.
+
+    Рисование идёт только по данным проекта в QImage, без сцены, поэтому
+    функцию можно вызывать из потока сохранения. Возвращает None для
+    пустого проекта.
+    """
+    rects = {}
+    for stage in project_data.get('stages', []):
+        pos = stage.get('position')
+        if isinstance(pos, dict):
+            rects[stage.get('id')] = (QRectF(pos.get('x', 0), pos.get('y', 0),
+                                             stage.get('width', 220), stage.get('height', 100)),
+                                      stage.get('border_color', '#BDBDBD'))
+    if not rects:
+        return None
+    bounds = QRectF()
+    for rect, _ in rects.values():
+        bounds = bounds.united(rect)
+    bounds.adjust(-20, -20, 20, 20)
+    scale = size / max(bounds.width(), bounds.height())
+    image = QImage(max(1, int(bounds.width() * scale)), max(1, int(bounds.height() * scale)), QImage.Format_ARGB32)
+    image.fill(Qt.white)
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.Antialiasing)
+    painter.scale(scale, scale)
+    painter.translate(-bounds.topLeft())
+    painter.setPen(QPen(QColor('#9E9E9E'), 1.5 / scale))
+    for conn in project_data.get('connections', []):
+        start, end = rects.get(conn.get('from')), rects.get(conn.get('to'))
+        if start and end:
+            painter.drawLine(start[0].center(), end[0].center())
+    painter.setBrush(QColor('#FFFFFF'))
+    for rect, color in rects.values():
+        painter.setPen(QPen(QColor(color), 2 / scale))
+        painter.drawRoundedRect(rect, 10, 10)
+    painter.end()
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    image.save(buffer, 'PNG')
+    buffer.close()
+    return bytes(data)
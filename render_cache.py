@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Общий кэш отрисовки текста блоков.
+
+Разбор тегов, перевод разметки в HTML и вёрстка QTextDocument повторялись
+в каждом paint() и заново для каждого блока после отмены (load_project
+пересоздаёт элементы). Кэш живёт на уровне процесса и не привязан к
+элементам: разбор хранится по тексту, свёрстанный документ - по
+(HTML, шрифт, ширина переноса). Обе части - LRU; документы дополнительно
+ограничены примерной занятой памятью. Используется только из GUI-потока.
+"""
+
+import re
+from collections import OrderedDict
+from PyQt5.QtGui import QTextDocument
+
+MAX_MARKUP_ENTRIES = 20000
+MAX_DOCUMENT_BYTES = 32 * 1024 * 1024
+DOCUMENT_OVERHEAD = 4096     # Примерный размер пустого QTextDocument с вёрсткой
+BYTES_PER_CHAR = 64          # ... и прибавка на символ (фрагменты, блоки, строки вёрстки)
+
+
+def parse_tags_from_text(text):
+    tags = []
+    cleaned_text = text
+    # Ищем все вхождения блоков с тегами вида [тег1, тег2, тег3]
+    tag_blocks = re.findall(r'\[([^\]]+)\]', text)
+    for block in tag_blocks:
+        potential_tags = [t.strip() for t in block.split(',')]
+        found_tags = [t for t in potential_tags if t]
+        if found_tags:
+            tags.extend(found_tags)
+            # Удаляем блок с тегами из текста
+            cleaned_text = re.sub(r'\[' + re.escape(block) + r'\]', '', cleaned_text, count=1)
+    return list(set(tags)), cleaned_text.strip()
+
+
+def parse_discord_to_html(text):
+    # Сначала моноширинный, потом зачёркнутый, потом жирный+курсив, потом жирный, потом курсив
+    text = re.sub(r'`([^`]+)`', r'<span style="font-family:Consolas; background:#f4f4f4;">\1</span>', text)
+    text = re.sub(r'~~([^~]+)~~', r'<s>\1</s>', text)
+    text = re.sub(r'\*\*\*([^*]+)\*\*\*', r'<b><i>\1</i></b>', text)
+    text = re.sub(r'\*\*([^*]+)\*\*', r'<b>\1</b>', text)
+    text = re.sub(r'\*([^*]+)\*', r'<i>\1</i>', text)
+    text = re.sub(r'_([^_]+)_', r'<i>\1</i>', text)
+    # --- Фикс начальных пробелов ---
+    def replace_leading_spaces(line):
+        return re.sub(r'^ +', lambda m: '&nbsp;' * len(m.group(0)), line)
+    text = '\n'.join(replace_leading_spaces(line) for line in text.split('\n'))
+    return text.replace('\n', '<br>')
+
+
+class TextMarkup:
+    """Результат разбора текста блока: теги, текст без тегов и HTML."""
+
+    __slots__ = ('tags', 'cleaned_text', 'html', '_plain')
+
+    def __init__(self, text, with_tags):
+        if with_tags:
+            tags, self.cleaned_text = parse_tags_from_text(text)
+            self.tags = tuple(tags)
+        else:
+            self.tags, self.cleaned_text = (), text
+        self.html = parse_discord_to_html(self.cleaned_text)
+        self._plain = None
+
+    def plain_text(self):
+        """Текст без тегов и символов разметки (для упрощённой отрисовки)."""
+        if self._plain is None:
+            self._plain = re.sub(r'[*_~`|]', '', self.cleaned_text).strip()
+        return self._plain
+
+
+class RenderCache:
+    def __init__(self, max_markup_entries=MAX_MARKUP_ENTRIES, max_document_bytes=MAX_DOCUMENT_BYTES):
+        self.max_markup_entries = max_markup_entries
+        self.max_document_bytes = max_document_bytes
+        self._markup = OrderedDict()      # (текст, с тегами) -> TextMarkup
+        self._documents = OrderedDict()   # (html, font.key(), ширина) -> (QTextDocument, байт)
+        self.document_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def markup(self, text, with_tags=True):
+        key = (text, with_tags)
+        entry = self._markup.get(key)
+        if entry is not None:
+            self._markup.move_to_end(key)
+            return entry
+        entry = TextMarkup(text, with_tags)
+        self._markup[key] = entry
+        if len(self._markup) > self.max_markup_entries:
+            self._markup.popitem(last=False)
+        return entry
+
+    def document(self, html, font, width):
+        """Свёрстанный документ для HTML. Документ общий - менять его нельзя."""
+        key = (html, font.key(), width)
+        entry = self._documents.get(key)
+        if entry is not None:
+            self._documents.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        doc = QTextDocument()
+        doc.setDefaultFont(font)
+        doc.setHtml(html)
+        doc.setTextWidth(width)
+        size = DOCUMENT_OVERHEAD + BYTES_PER_CHAR * doc.characterCount() + 2 * len(html)
+        self._documents[key] = (doc, size)
+        self.document_bytes += size
+        # Только что добавленный документ не вытесняется, даже если он один больше лимита
+        while self.document_bytes > self.max_document_bytes and len(self._documents) > 1:
+            _, (_, evicted_size) = self._documents.popitem(last=False)
+            self.document_bytes -= evicted_size
+        return doc
+
+    def text_document(self, text, font, width, with_tags=True):
+        return self.document(self.markup(text, with_tags).html, font, width)
+
+    def clear(self):
+        self._markup.clear()
+        self._documents.clear()
+        self.document_bytes = 0
+
+
+_shared_cache = None
+
+
+def shared_render_cache():
+    """Кэш процесса, общий для всех блоков и переживающий их пересоздание."""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = RenderCache()
+    return _shared_cache
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Модель форматированного текста без Qt.
+
+Текст хранится списком фрагментов с наборами форматов (bold, italic,
+strike, underline). Модель переводит фрагменты в текст с маркерами
+(**жирный**, *курсив*, ~~зачёркнутый~~, __подчёркнутый__) и обратно и
+читает/пишет JSON из редактора. Блокам на сцене нужен только этот
+перевод, поэтому виджет редактора создаётся лишь в открытом диалоге.
+"""
+
+import json
+import re
+
+_MARKERS = {'bold': '**', 'italic': '*', 'strike': '~~', 'underline': '__'}
+# Порядок важен: *** раньше **, ** раньше *
+_MARKER_PATTERNS = [
+    (re.compile(r'\*\*\*([^*]+)\*\*\*'), ['bold', 'italic']),
+    (re.compile(r'__([^_]+)__'), ['underline']),
+    (re.compile(r'\*\*([^*]+)\*\*'), ['bold']),
+    (re.compile(r'\*([^*]+)\*'), ['italic']),
+    (re.compile(r'~~([^~]+)~~'), ['strike']),
+]
+
+
+class TextFragment:
+    def __init__(self, text, formats=None):
+        self.text = text
+        self.formats = formats or []
+
+
+def combined_markers(formats):
+    """Открывающие и закрывающие маркеры набора форматов. Для bold+italic - ***."""
+    if set(formats) == {'bold', 'italic'}:
+        return '***', '***'
+    markers = ''.join(_MARKERS.get(fmt, '') for fmt in formats)
+    closing = ''.join(_MARKERS.get(fmt, '') for fmt in reversed(formats))
+    return markers, closing
+
+
+def fragments_to_raw(fragments):
+    """Текст с маркерами форматирования."""
+    parts = []
+    for frag in fragments:
+        markers, closing = combined_markers(frag.formats) if frag.formats else ('', '')
+        parts.append(markers + frag.text + closing)
+    return ''.join(parts)
+
+
+def fragments_to_json(fragments):
+    return json.dumps([{"text": frag.text, "formats": frag.formats} for frag in fragments], ensure_ascii=False)
+
+
+def fragments_from_json(json_str):
+    """Фрагменты из JSON редактора; строка, которая не разбирается, считается обычным текстом."""
+    try:
+        return [TextFragment(item["text"], item["formats"]) for item in json.loads(json_str)]
+    except Exception:
+        return [TextFragment(json_str)]
+
+
+def parse_markers(text, active_formats=None):
+    """Разбирает маркеры в тексте. Возвращает (фрагменты, найден ли хоть один маркер)."""
+    if active_formats is None:
+        active_formats = []
+    fragments = []
+    found_marker = False
+    i = 0
+    while i < len(text):
+        nearest, nearest_fmts = None, None
+        for pattern, fmts in _MARKER_PATTERNS:
+            m = pattern.search(text, i)
+            if m and (nearest is None or m.start() < nearest.start()):
+                nearest, nearest_fmts = m, fmts
+        if nearest is None:
+            # Нет больше маркеров - добавляем остаток текста
+            fragments.append(TextFragment(text[i:], active_formats.copy()))
+            break
+        if nearest.start() > i:
+            fragments.append(TextFragment(text[i:nearest.start()], active_formats.copy()))
+        found_marker = True
+        fragments.extend(parse_markers(nearest.group(1), active_formats + nearest_fmts)[0])
+        i = nearest.end()
+    return fragments, found_marker
+
+
+class RichTextModel:
+    """Фрагменты текста с тем же интерфейсом сериализации, что у редактора."""
+
+    def __init__(self, fragments=None):
+        self.fragments = fragments or [TextFragment('')]
+
+    @classmethod
+    def from_raw_text(cls, text):
+        return cls(parse_markers(text)[0] or [TextFragment('')])
+
+    def from_json(self, json_str):
+        self.fragments = fragments_from_json(json_str)
+
+    def to_json(self):
+        return fragments_to_json(self.fragments)
+
+    def get_raw_text(self):
+        return fragments_to_raw(self.fragments)
+
+    def get_display_text(self):
+        return ''.join(frag.text for frag in self.fragments)
+
+
+def raw_text_from_json(json_str):
+    """Текст с маркерами из JSON редактора (то, что блок хранит в stage_data)."""
+    return fragments_to_raw(fragments_from_json(json_str))
@@ -5,18 +5,90 @@ from PyQt5.QtWidgets import (QMenu, QColorDialog, QGraphicsView, QGraphicsScene,
                              QGraphicsObject, QGraphicsItem, QFileDialog, QGraphicsTextItem,
                              QGraphicsLineItem, QGraphicsBlurEffect, QInputDialog, QGraphicsProxyWidget, QLabel, QVBoxLayout, QWidget, QGraphicsDropShadowEffect, QApplication, QDialog, QPushButton, QShortcut,
                              QTextEdit)
-from PyQt5.QtCore import (Qt, QPointF, QRectF, pyqtSignal, pyqtProperty, 
-                          QPropertyAnimation, QSequentialAnimationGroup, QTimer, QEasingCurve)
+from PyQt5.QtCore import (Qt, QObject, QPointF, QRectF, QLineF, pyqtSignal, pyqtProperty, 
+                          QTimer, QEasingCurve)
 from PyQt5.QtGui import (QPainter, QPen, QColor, QBrush, QFont, QTextOption, 
                        QPainterPath, QLinearGradient, QPainterPathStroker, QPixmap, QImage, QFontMetrics, QKeySequence, QCursor, QTextDocument, QMouseEvent)
+import itertools
 import math
 import uuid
+from contextlib import contextmanager, nullcontext
 from color_picker import ColorPickerDialog
 from glass_menu import GlassMenu
 from timeline_guide import TimelineGuideItem, TimelineLabelItem, TickItem
-from custom_rich_text_editor import ScrollableRichTextEditor, TextFragment, CustomTextEditDialog, TxtFileEditDialog
+from custom_rich_text_editor import CustomTextEditDialog, TxtFileEditDialog
+from rich_text_model import raw_text_from_json
 import re
 from search_glow_graphics_item import SearchGlowGraphicsItem
+from image_store import ImageStore
+from sqlite_store import ScenePager
+from tiled_export import TiledImageExporter, DEFAULT_SCALE, DEFAULT_DPI
+from render_cache import shared_render_cache, parse_tags_from_text
+from animation_clock import AnimationTrack, shared_animation_clock
+from curve_geometry import CurveLUT
+from spatial_index import QuadTree, BoundsTracker
+from graph_index import GraphIndex
+from graph_analysis import GraphAnalysis
+from undo_engine import UndoEngine
+
+# --- Уровни детализации при отдалении (option.levelOfDetailFromTransform) ---
+LOD_FULL = 0.6          # От этого масштаба блоки и связи рисуются полностью
+LOD_TITLE = 0.3         # От этого - рамка и заголовок без разметки; ниже - прямоугольник цвета рамки
+LOD_EDGE_MIN_PX = 2     # Связи короче стольких пикселей на экране не рисуются
+
+# --- Сетка ---
+GRID_SIZE = 40          # Шаг сетки и магнита в единицах сцены
+MIN_GRID_PX = 8         # Линии сетки ближе стольких пикселей сливаются (шаг удваивается)
+
+# --- Общий слой связей (ConnectionLayerItem) ---
+EDGE_CELL_SIZE = 512    # Сторона ячейки сетки, по которой слой ищет связи
+EDGE_HIT_DISTANCE = 5   # Насколько близко к линии связи срабатывает наведение (как shape() связи)
+
+# --- Границы сцены ---
+SCENE_MARGIN = 1500       # Запас вокруг блоков, в пределах которого сцена не растёт
+SCENE_GROW_STEP = 5000    # Сцена растёт не меньше чем на столько, чтобы не менять её на каждый сдвиг
+ZOOM_OUT_PADDING = 2000   # Запас вокруг содержимого при отдалении
+
+
+class _ConnectionGeometryQueue(QObject):
+    """Откладывает пересчёт геометрии связей до конца прохода цикла событий.
+
+    Пока тянут блок или группу, update_path вызывается на каждый сдвиг
+    каждого конца; связь попадает в очередь один раз и пересчитывается
+    один раз - до следующей перерисовки.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._pending = {}
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(0)
+        self._timer.timeout.connect(self.flush)
+
+    def schedule(self, connection):
+        self._pending[connection] = None
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self):
+        pending, self._pending = self._pending, {}
+        for connection in pending:
+            try:
+                connection.ensure_geometry()
+            except RuntimeError:
+                pass   # Связь уже удалена вместе со сценой
+
+
+_geometry_queue = None
+
+
+def connection_geometry_queue():
+    global _geometry_queue
+    if _geometry_queue is None:
+        _geometry_queue = _ConnectionGeometryQueue()
+    return _geometry_queue
+
 
 class ConnectionGraphicsItem(QGraphicsObject):
     """Графический элемент для отрисовки 'умных', кликабельных соединительных линий."""
@@ -32,27 +104,47 @@ class ConnectionGraphicsItem(QGraphicsObject):
         self.setZValue(-1)
         self.setAcceptHoverEvents(True)
         self._last_hovered_half = None
-        self.update_path()
+        self._start_pos = self._end_pos = None
+        self._anchor_keys = None   # Положение и размер обоих блоков при последнем пересчёте
+        self._shape = None
+        self._curve = None
+        self._geometry_dirty = False
+        self.layer = None   # ConnectionLayerItem, если связь рисуется общим слоем, а не сама
+        self._rebuild_geometry()
+
+    def is_attached(self):
+        """Показана ли связь: сама на сцене или в общем слое."""
+        return self.layer is not None or self.scene() is not None
+
+    def update(self, *args):
+        # В режиме слоя элемента нет на сцене - перерисовывает (и переиндексирует) слой
+        if self.layer is not None:
+            self.layer.edge_changed(self)
+        else:
+            super().update(*args)
 
     def boundingRect(self):
-        extra = 3.0
-        return self.path.boundingRect().adjusted(-extra, -extra, extra, extra)
+        # Вид спрашивает рамку связи много раз за кадр - она считается в update_path
+        return self._bounds
 
     def shape(self):
-        stroker = QPainterPathStroker()
-        stroker.setWidth(10)
-        return stroker.createStroke(self.path)
+        self.ensure_geometry()
+        if self._shape is None:
+            stroker = QPainterPathStroker()
+            stroker.setWidth(10)
+            self._shape = stroker.createStroke(self.path)
+        return self._shape
+
+    def curve(self):
+        """Таблица длины дуги пути связи; строится при первом запросе после изменения пути."""
+        self.ensure_geometry()
+        if self._curve is None:
+            self._curve = CurveLUT.from_path(self.path)
+        return self._curve
 
     def _get_hovered_half(self, scene_pos):
-        min_dist_sq = float('inf')
-        closest_t = 0
-        for i in range(101):
-            t = i / 100.0
-            p = self.mapToScene(self.path.pointAtPercent(t))
-            dist_sq = (p - scene_pos).manhattanLength()
-            if dist_sq < min_dist_sq:
-                min_dist_sq = dist_sq
-                closest_t = t
+        pos = self.mapFromScene(scene_pos)
+        closest_t = self.curve().project(pos.x(), pos.y())[0]
         return 'start' if closest_t < 0.5 else 'end'
 
     def hoverMoveEvent(self, event):
@@ -83,8 +175,32 @@ class ConnectionGraphicsItem(QGraphicsObject):
             super().mousePressEvent(event)
     
     def update_path(self):
-        self.prepareGeometryChange()
+        """Помечает геометрию устаревшей; пересчёт - один раз до следующей перерисовки."""
+        if not self._geometry_dirty:
+            self._geometry_dirty = True
+            connection_geometry_queue().schedule(self)
+
+    def ensure_geometry(self):
+        if self._geometry_dirty:
+            self._rebuild_geometry()
+
+    def _rebuild_geometry(self, keys=None):
+        # keys - (anchor_key() начала, anchor_key() конца), если вызывающий их уже посчитал
+        self._geometry_dirty = False
+        keys = keys or (self.start_item.anchor_key(), self.end_item.anchor_key())
+        old_keys, self._anchor_keys = self._anchor_keys, keys
+        if keys == old_keys:
+            return
+        if old_keys is not None and keys[0][2:] == old_keys[0][2:] and keys[1][2:] == old_keys[1][2:]:
+            # Оба блока сдвинуты на одно и то же (групповое перемещение) - путь просто переносится
+            dx, dy = keys[0][0] - old_keys[0][0], keys[0][1] - old_keys[0][1]
+            if dx == keys[1][0] - old_keys[1][0] and dy == keys[1][1] - old_keys[1][1]:
+                self._translate_geometry(dx, dy)
+                return
         start_pos, end_pos = self._get_optimal_points()
+        if start_pos == self._start_pos and end_pos == self._end_pos:
+            return   # Точки крепления не сдвинулись - путь, рамка и форма прежние
+        self.prepareGeometryChange()
         dx, dy = end_pos.x() - start_pos.x(), end_pos.y() - start_pos.y()
         ctrl1 = QPointF(start_pos.x() + dx * 0.5, start_pos.y())
         ctrl2 = QPointF(end_pos.x() - dx * 0.5, end_pos.y())
@@ -92,9 +208,34 @@ class ConnectionGraphicsItem(QGraphicsObject):
         new_path.moveTo(start_pos)
         new_path.cubicTo(ctrl1, ctrl2, end_pos)
         self.path = new_path
+        self._start_pos, self._end_pos = start_pos, end_pos
+        extra = 3.0
+        self._bounds = new_path.boundingRect().adjusted(-extra, -extra, extra, extra)
+        self._shape = None
+        self._curve = None
+        self.update()
+
+    def _translate_geometry(self, dx, dy):
+        self.prepareGeometryChange()
+        self.path.translate(dx, dy)
+        offset = QPointF(dx, dy)
+        self._start_pos, self._end_pos = self._start_pos + offset, self._end_pos + offset
+        self._bounds = self._bounds.translated(dx, dy)
+        self._shape = self._shape.translated(dx, dy) if self._shape is not None else None
+        self._curve = None
         self.update()
 
     def paint(self, painter, option, widget=None):
+        lod = option.levelOfDetailFromTransform(painter.worldTransform())
+        if lod < LOD_FULL:
+            self._paint_reduced(painter, lod)
+            return
+        start_color, end_color = self.end_colors()
+        painter.setPen(self.gradient_pen(start_color, end_color))
+        painter.drawPath(self.path)
+
+    def end_colors(self):
+        """Цвета концов связи: цвет рамки блока (пульсирующий у выделенного) с учётом прозрачности блока."""
         if self.start_item.isSelected(): start_color_base = self.start_item.animatedBorderColor
         else: start_color_base = QColor(self.start_item.stage_data.get('border_color', '#BDBDBD'))
         if self.end_item.isSelected(): end_color_base = self.end_item.animatedBorderColor
@@ -103,40 +244,290 @@ class ConnectionGraphicsItem(QGraphicsObject):
         start_color.setAlphaF(start_color.alphaF() * self.start_item.opacity())
         end_color = QColor(end_color_base)
         end_color.setAlphaF(end_color.alphaF() * self.end_item.opacity())
-        start_point, end_point = self.path.pointAtPercent(0), self.path.pointAtPercent(1)
-        gradient = QLinearGradient(start_point, end_point)
+        return start_color, end_color
+
+    def gradient_pen(self, start_color, end_color):
+        gradient = QLinearGradient(self._start_pos, self._end_pos)
         gradient.setColorAt(0.0, start_color)
         gradient.setColorAt(1.0, end_color)
-        pen = QPen(QBrush(gradient), 3, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
-        painter.setPen(pen)
-        painter.drawPath(self.path)
+        return QPen(QBrush(gradient), 3, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
+
+    def _paint_reduced(self, painter, lod):
+        # При отдалении - одноцветная линия без градиента; совсем мелкие связи не рисуются
+        delta = self._end_pos - self._start_pos
+        if delta.manhattanLength() * lod < LOD_EDGE_MIN_PX:
+            return
+        color = self.start_item._border_color()
+        if lod < LOD_TITLE:
+            painter.setRenderHint(QPainter.Antialiasing, False)
+            painter.setPen(QPen(color, 0))
+            painter.drawLine(self._start_pos, self._end_pos)
+        else:
+            painter.setPen(QPen(color, 3, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin))
+            painter.drawPath(self.path)
 
     def _get_optimal_points(self):
-        start_anchors = self.start_item.get_anchor_points()
-        end_anchors = self.end_item.get_anchor_points()
+        # Ближайшая пара точек крепления; сравниваем квадраты расстояний на числах, без QPointF
+        end_anchors = self.end_item.anchor_coords()
         min_dist = float('inf')
-        best_pair = (QPointF(), QPointF())
-        for p1 in start_anchors:
-            for p2 in end_anchors:
-                dist = math.hypot(p1.x() - p2.x(), p1.y() - p2.y())
+        best_pair = None
+        for x1, y1 in self.start_item.anchor_coords():
+            for x2, y2 in end_anchors:
+                dist = (x1 - x2) * (x1 - x2) + (y1 - y2) * (y1 - y2)
                 if dist < min_dist:
                     min_dist = dist
-                    best_pair = (p1, p2)
-        return best_pair
-
-def parse_tags_from_text(text):
-    tags = []
-    cleaned_text = text
-    # Ищем все вхождения блоков с тегами вида [тег1, тег2, тег3]
-    tag_blocks = re.findall(r'\[([^\]]+)\]', text)
-    for block in tag_blocks:
-        potential_tags = [t.strip() for t in block.split(',')]
-        found_tags = [t for t in potential_tags if t]
-        if found_tags:
-            tags.extend(found_tags)
-            # Удаляем блок с тегами из текста
-            cleaned_text = re.sub(r'\[' + re.escape(block) + r'\]', '', cleaned_text, count=1)
-    return list(set(tags)), cleaned_text.strip()
+                    best_pair = (x1, y1, x2, y2)
+        return QPointF(best_pair[0], best_pair[1]), QPointF(best_pair[2], best_pair[3])
+
+class ConnectionLayerItem(QGraphicsItem):
+    """Один элемент сцены, который хранит и рисует все связи.
+
+    Для графов с десятками тысяч связей отдельный QGraphicsObject на связь
+    стоит дорого: индекс BSP сцены, обход при отрисовке, hover-события и
+    shape() каждой связи. В режиме слоя ConnectionGraphicsItem остаётся
+    объектом связи (путь, сигналы, геометрия), но на сцену не добавляется:
+    слой раскладывает связи по сетке ячеек, рисует видимые пачками по цвету
+    общими перьями и сам ищет связь под курсором для Shift-наведения и
+    Shift-клика по половине связи.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setZValue(-1)
+        self.setAcceptHoverEvents(True)
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption, True)
+        self._bounds = QRectF()
+        self._bounds_stale = False
+        self._edges = {}           # связь -> рамка, по которой она разложена в сетке
+        self._edge_cells = {}      # связь -> ячейки сетки
+        self._cells = {}           # (столбец, строка) -> связи
+        self._pens = {}            # (rgba, ширина) -> QPen
+        self._gradient_pens = {}   # связь -> (концы и цвета, QPen)
+        self._hovered = None       # (связь, половина) под курсором с Shift
+
+    # --- Состав слоя ---
+    def add_edge(self, connection):
+        connection.layer = self
+        self._index(connection, connection.boundingRect())
+        self.update(connection.boundingRect())
+
+    def remove_edge(self, connection):
+        bounds = self._edges.get(connection)
+        if bounds is None:
+            return
+        self._unindex(connection)
+        self._gradient_pens.pop(connection, None)
+        connection.layer = None
+        if self._hovered is not None and self._hovered[0] is connection:
+            self._hovered = None
+        self.update(bounds)
+        # Рамка слоя сужается один раз после пачки удалений, а не на каждой связи
+        if not self._bounds_stale:
+            self._bounds_stale = True
+            QTimer.singleShot(0, self._refresh_bounds)
+
+    def edge_changed(self, connection):
+        """Связь сдвинулась или сменила цвет: переиндексировать при новой рамке и перерисовать."""
+        bounds = self._edges.get(connection)
+        if bounds is None:
+            return
+        if bounds is not connection.boundingRect():
+            # Рамка связи пересоздаётся при каждом пересчёте пути, поэтому хватает сравнения объектов
+            self._unindex(connection)
+            self._index(connection, connection.boundingRect())
+            self.update(bounds)
+        self.update(connection.boundingRect())
+
+    def edges(self):
+        return list(self._edges)
+
+    def clear(self):
+        for connection in self._edges:
+            connection.layer = None
+        self.prepareGeometryChange()
+        self._bounds = QRectF()
+        self._edges.clear()
+        self._edge_cells.clear()
+        self._cells.clear()
+        self._gradient_pens.clear()
+        self._hovered = None
+
+    def _index(self, connection, bounds):
+        self._edges[connection] = bounds
+        cells = self._cells_in(bounds)
+        self._edge_cells[connection] = cells
+        for cell in cells:
+            self._cells.setdefault(cell, set()).add(connection)
+        if not self._bounds.contains(bounds):
+            self.prepareGeometryChange()
+            self._bounds = self._bounds.united(bounds)
+
+    def _unindex(self, connection):
+        del self._edges[connection]
+        for cell in self._edge_cells.pop(connection):
+            edges = self._cells[cell]
+            edges.discard(connection)
+            if not edges:
+                del self._cells[cell]
+
+    def _refresh_bounds(self):
+        try:
+            self._bounds_stale = False
+            bounds = QRectF()
+            for rect in self._edges.values():
+                bounds = bounds.united(rect)
+            if bounds != self._bounds:
+                self.prepareGeometryChange()
+                self._bounds = bounds
+        except RuntimeError:
+            pass   # Слой удалён вместе со сценой
+
+    @staticmethod
+    def _cells_in(rect):
+        left, top = math.floor(rect.left() / EDGE_CELL_SIZE), math.floor(rect.top() / EDGE_CELL_SIZE)
+        right, bottom = math.floor(rect.right() / EDGE_CELL_SIZE), math.floor(rect.bottom() / EDGE_CELL_SIZE)
+        return [(x, y) for x in range(left, right + 1) for y in range(top, bottom + 1)]
+
+    # --- Поиск связей ---
+    def edges_in(self, rect):
+        """Связи, рамка которых пересекает rect (координаты сцены)."""
+        if rect.contains(self._bounds):
+            return list(self._edges)
+        found = set()
+        for cell in self._cells_in(rect):
+            edges = self._cells.get(cell)
+            if edges:
+                found.update(edges)
+        return [connection for connection in found if rect.intersects(self._edges[connection])]
+
+    def edge_at(self, pos, distance=EDGE_HIT_DISTANCE):
+        """Ближайшая к pos связь не дальше distance: (связь, доля длины 0..1) или None."""
+        x, y = pos.x(), pos.y()
+        best, best_dist = None, distance
+        for connection in self.edges_in(QRectF(x - distance, y - distance, 2 * distance, 2 * distance)):
+            t, _, _, dist = connection.curve().project(x, y)
+            if dist <= best_dist:
+                best, best_dist = (connection, t), dist
+        return best
+
+    def _half_at(self, pos):
+        hit = self.edge_at(pos)
+        if hit is None:
+            return None
+        return hit[0], 'start' if hit[1] < 0.5 else 'end'
+
+    # --- Геометрия элемента ---
+    def boundingRect(self):
+        return self._bounds
+
+    def shape(self):
+        # Слой не должен перекрывать рамку выделения и клики мимо связей
+        return QPainterPath()
+
+    def contains(self, point):
+        return self.edge_at(point) is not None
+
+    def collidesWithPath(self, path, mode=Qt.IntersectsItemShape):
+        # Вид ищет элемент под курсором прямоугольником в один пиксель экрана
+        rect = path.boundingRect()
+        if rect.width() > EDGE_CELL_SIZE or rect.height() > EDGE_CELL_SIZE:
+            return bool(self.edges_in(rect))   # Рамка выделения: слой не выделяется, точность не нужна
+        return self.edge_at(rect.center(), EDGE_HIT_DISTANCE + max(rect.width(), rect.height()) / 2) is not None
+
+    # --- События ---
+    def hoverMoveEvent(self, event):
+        hit = self._half_at(event.scenePos()) if event.modifiers() == Qt.ShiftModifier else None
+        self._set_hovered(hit)
+        super().hoverMoveEvent(event)
+
+    def hoverLeaveEvent(self, event):
+        self._set_hovered(None)
+        super().hoverLeaveEvent(event)
+
+    def _set_hovered(self, hit):
+        if hit == self._hovered:
+            return
+        if self._hovered is not None:
+            connection, half = self._hovered
+            connection.half_hovered.emit(connection, half, False)
+        self._hovered = hit
+        if hit is not None:
+            hit[0].half_hovered.emit(hit[0], hit[1], True)
+
+    def mousePressEvent(self, event):
+        hit = self._half_at(event.scenePos()) if event.modifiers() == Qt.ShiftModifier else None
+        if hit is not None:
+            hit[0].half_clicked.emit(hit[0], hit[1])
+        else:
+            super().mousePressEvent(event)
+
+    # --- Отрисовка ---
+    def _pen(self, color, width):
+        key = (color.rgba(), width)
+        pen = self._pens.get(key)
+        if pen is None:
+            pen = QPen(QColor(color), width, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
+            self._pens[key] = pen
+        return pen
+
+    def _gradient_pen(self, connection, start_color, end_color):
+        key = (connection._start_pos, connection._end_pos, start_color.rgba(), end_color.rgba())
+        cached = self._gradient_pens.get(connection)
+        if cached is None or cached[0] != key:
+            cached = (key, connection.gradient_pen(start_color, end_color))
+            self._gradient_pens[connection] = cached
+        return cached[1]
+
+    def paint(self, painter, option, widget=None):
+        lod = option.levelOfDetailFromTransform(painter.worldTransform())
+        rect = option.exposedRect
+        if painter.hasClipping():
+            # render()/экспорт отдают рамку всего слоя - рисуем только то, что попадёт в полосу
+            rect = rect.intersected(painter.clipBoundingRect())
+        edges = self.edges_in(rect)
+        if lod < LOD_FULL:
+            self._paint_reduced(painter, edges, lod)
+            return
+        # Одноцветные связи собираются в один путь на цвет; с градиентом - рисуются по одной
+        paths = {}
+        for connection in edges:
+            start_color, end_color = connection.end_colors()
+            if start_color.rgba() == end_color.rgba():
+                entry = paths.get(start_color.rgba())
+                if entry is None:
+                    entry = paths[start_color.rgba()] = (start_color, QPainterPath())
+                entry[1].addPath(connection.path)
+            else:
+                painter.setPen(self._gradient_pen(connection, start_color, end_color))
+                painter.drawPath(connection.path)
+        for color, path in paths.values():
+            painter.setPen(self._pen(color, 3))
+            painter.drawPath(path)
+
+    def _paint_reduced(self, painter, edges, lod):
+        # Как ConnectionGraphicsItem._paint_reduced, но одной командой на цвет
+        groups = {}
+        for connection in edges:
+            delta = connection._end_pos - connection._start_pos
+            if delta.manhattanLength() * lod < LOD_EDGE_MIN_PX:
+                continue
+            color = connection.start_item._border_color()
+            entry = groups.get(color.rgba())
+            if entry is None:
+                entry = groups[color.rgba()] = (color, [] if lod < LOD_TITLE else QPainterPath())
+            if lod < LOD_TITLE:
+                entry[1].append(QLineF(connection._start_pos, connection._end_pos))
+            else:
+                entry[1].addPath(connection.path)
+        if lod < LOD_TITLE:
+            painter.setRenderHint(QPainter.Antialiasing, False)
+            for color, lines in groups.values():
+                painter.setPen(self._pen(color, 0))
+                painter.drawLines(lines)
+        else:
+            for color, path in groups.values():
+                painter.setPen(self._pen(color, 3))
+                painter.drawPath(path)
 
 class StageGraphicsItem(QGraphicsObject):
     stage_edit_requested = pyqtSignal(object)
@@ -146,7 +537,6 @@ class StageGraphicsItem(QGraphicsObject):
 
     def __init__(self, stage_data, _recalculate=True):
         super().__init__()
-        self.rich_text_editor = ScrollableRichTextEditor()  # Для поддержки форматирования
         self.stage_data = stage_data
         if 'id' not in self.stage_data:
             self.stage_data['id'] = str(uuid.uuid4())
@@ -156,7 +546,6 @@ class StageGraphicsItem(QGraphicsObject):
         self.font = QFont('Finlandica', 12)
         self.connections = []
         self._animated_border_color = QColor(self.stage_data.get('border_color', '#BDBDBD'))
-        self.animation = self._create_animation()
         self.is_locked = False
         self.setFlag(QGraphicsObject.ItemSendsGeometryChanges, True)
         self.setAcceptHoverEvents(True)
@@ -164,8 +553,6 @@ class StageGraphicsItem(QGraphicsObject):
         self.resizing = False
         self.resize_handle_size = 15
         self.last_mouse_pos = QPointF()
-        self._cached_doc = None
-        self._cached_html = None
         self.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
         if _recalculate:
             self.recalculate_size()
@@ -177,14 +564,13 @@ class StageGraphicsItem(QGraphicsObject):
 
         self.tags = [] # Для хранения тегов
         self._highlight_opacity = 0.0
-        self.highlight_animation_group = None
         self.search_glow_opacity = 0.0
-        self._search_glow_anim = None
-        self._search_glow_pulse = None
 
         self.title = stage_data.get('title', '')
         self.description = stage_data.get('description', '')
         self.position = stage_data.get('position', QPointF(50, 50))
+        if isinstance(self.position, dict):
+            self.position = QPointF(self.position.get('x', 0), self.position.get('y', 0))
         self.color = QColor(stage_data.get('border_color', '#BDBDBD'))
 
         self.setPos(self.position)
@@ -197,44 +583,61 @@ class StageGraphicsItem(QGraphicsObject):
     def animatedBorderColor(self, color):
         self._animated_border_color = color
         self.update()
-        for conn in self.connections:
-            conn.update()
-
-    def _create_animation(self):
-        anim1 = QPropertyAnimation(self, b"animatedBorderColor")
-        anim1.setDuration(800)
-        anim2 = QPropertyAnimation(self, b"animatedBorderColor")
-        anim2.setDuration(800)
-        seq_group = QSequentialAnimationGroup(self)
-        seq_group.addAnimation(anim1)
-        seq_group.addAnimation(anim2)
-        seq_group.setLoopCount(-1)
-        self.anim1, self.anim2 = anim1, anim2
-        return seq_group
+        self._update_connections()
 
+    # --- Анимации идут через общие часы сцены (animation_clock) ---
     def _start_pulsing_animation(self):
         base_color = QColor(self.stage_data.get('border_color', '#BDBDBD'))
         dark_color = base_color.darker(140)
         light_color = base_color.lighter(125)
-        self.anim1.setStartValue(dark_color)
-        self.anim1.setEndValue(light_color)
-        self.anim2.setStartValue(light_color)
-        self.anim2.setEndValue(dark_color)
-        self.animation.start()
-        self.animatedBorderColor = dark_color
+        shared_animation_clock().start(self, 'pulse', AnimationTrack(self._set_pulse_color, dark_color, light_color, 800, loop='pingpong'))
+        # Пульсирующий цвет виден только у выделенного блока: остальные (подсветка фокуса) не перерисовываем
+        if self.isSelected():
+            self.animatedBorderColor = dark_color
+        else:
+            self._animated_border_color = dark_color
+
+    def _stop_pulsing_animation(self):
+        shared_animation_clock().stop(self, 'pulse')
+
+    def _set_pulse_color(self, color):
+        self._animated_border_color = color
+        # Пульсирующий цвет рисуется только у выделенного блока и его связей
+        return [self] + self.connections if self.isSelected() else ()
 
     def add_connection(self, connection):
         self.connections.append(connection)
 
+    def _roadmap_view(self):
+        views = self.scene().views() if self.scene() else []
+        return views[0] if views and isinstance(views[0], RoadMapWidget) else None
+
+    def _update_connections(self):
+        view = self._roadmap_view()
+        if view is not None and view.in_batch():
+            view.defer_connection_repaint(self.connections)
+            return
+        for conn in list(self.connections):
+            if conn.is_attached():
+                conn.update()
+
+    def _batch_update(self):
+        view = self._roadmap_view()
+        return view.batch_update() if view is not None else nullcontext()
+
     def itemChange(self, change, value):
         res = super().itemChange(change, value)
         if change == QGraphicsItem.ItemPositionHasChanged:
+            view = self._roadmap_view()
+            if view is not None and view.in_batch():
+                # Связи, направляющие и границы сцены обновятся один раз при завершении пакета
+                view.defer_stage_moved(self)
+                return res
             for conn in self.connections:
                 conn.update_path()
-            if self.scene() and self.scene().views():
-                view = self.scene().views()[0]
-                if isinstance(view, RoadMapWidget):
-                    view.check_and_expand_scene(self)
+            if view is not None:
+                view.check_and_expand_scene(self)
+                view.mark_stage_dirty(self)
             self.block_moved.emit()
         if change == QGraphicsItem.ItemSelectedChange:
             if value: self.item_selected.emit(self)
@@ -242,11 +645,24 @@ class StageGraphicsItem(QGraphicsObject):
         return res
         
     def get_anchor_points(self):
-        center = self.scenePos() + self.rect.center()
-        return [
-            center + QPointF(0, -self.rect.height()/2), center + QPointF(0, self.rect.height()/2),
-            center + QPointF(-self.rect.width()/2, 0), center + QPointF(self.rect.width()/2, 0),
-        ]
+        return [QPointF(x, y) for x, y in self.anchor_coords()]
+
+    def anchor_key(self):
+        pos, rect = self.scenePos(), self.rect
+        return (pos.x(), pos.y(), rect.x(), rect.y(), rect.width(), rect.height())
+
+    def anchor_coords(self):
+        """Точки крепления связей (верх, низ, лево, право) в координатах сцены.
+
+        Кэшируются, пока блок не сдвинут и не изменён в размере: у блока с
+        сотнями связей они считаются один раз, а не для каждой связи.
+        """
+        key = self.anchor_key()
+        if getattr(self, '_anchor_key', None) != key:
+            cx, cy = key[0] + key[2] + key[4] / 2, key[1] + key[3] + key[5] / 2
+            self._anchor_coords = ((cx, cy - key[5] / 2), (cx, cy + key[5] / 2), (cx - key[4] / 2, cy), (cx + key[4] / 2, cy))
+            self._anchor_key = key
+        return self._anchor_coords
 
     def get_stage_data(self):
         pos = self.pos()
@@ -275,6 +691,14 @@ class StageGraphicsItem(QGraphicsObject):
         self.rect = QRectF(0, 0, new_width, new_height)
         self.update()
         for conn in self.connections: conn.update_path()
+        self._mark_dirty()
+
+    def _mark_dirty(self):
+        # Сообщаем виду, что этап нужно записать в журнал изменений
+        if self.scene() and self.scene().views():
+            view = self.scene().views()[0]
+            if isinstance(view, RoadMapWidget):
+                view.mark_stage_dirty(self)
 
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton and self._is_hovered and self.get_resize_handle_rect().contains(event.pos()):
@@ -295,8 +719,9 @@ class StageGraphicsItem(QGraphicsObject):
                 for item in selected:
                     item._group_drag_start_pos = item.pos()
                     item._group_offset = mouse_scene_pos - item.pos()
-                # --- Явно сохраняем ведущий блок ---
+                # --- Явно сохраняем ведущий блок и группу (не спрашиваем выделение на каждом движении) ---
                 self.scene()._group_leader = self
+                self._group_items = selected
         if event.button() == Qt.RightButton:
             # --- Новая логика выделения для перекраски ---
             selected = self.scene().selectedItems() if self.scene() else []
@@ -318,8 +743,9 @@ class StageGraphicsItem(QGraphicsObject):
                     view = self.scene().views()[0]
                     view.save_undo_state()
                     items_to_delete = self.scene().selectedItems() or [self]
-                    for item in items_to_delete:
-                        if isinstance(item, StageGraphicsItem): view.delete_stage(item, save_state=False)
+                    with view.batch_update():
+                        for item in items_to_delete:
+                            if isinstance(item, StageGraphicsItem): view.delete_stage(item, save_state=False)
             if item_type == 'text': actions.append(('Редактировать текст', edit_action))
             elif item_type == 'image': actions.append(('Редактировать описание', edit_action))
             actions.append(('Изменить цвет рамки', color_action))
@@ -352,7 +778,7 @@ class StageGraphicsItem(QGraphicsObject):
             # --- Привязка размеров к сетке, если сетка включена ---
             view = self.scene().views()[0] if self.scene() and self.scene().views() else None
             if view and getattr(view, 'show_grid', False):
-                grid_size = 40
+                grid_size = GRID_SIZE
                 magnet_radius = 5
                 grid_w = round(new_width / grid_size) * grid_size
                 grid_h = round(new_height / grid_size) * grid_size
@@ -378,10 +804,10 @@ class StageGraphicsItem(QGraphicsObject):
         view = self.scene().views()[0] if self.scene() and self.scene().views() else None
         offset = getattr(self, '_drag_offset', QPointF(0, 0))
         new_pos = self.mapToScene(event.pos() - offset)
-        selected = self.scene().selectedItems() if self.isSelected() else []
+        selected = getattr(self, '_group_items', None) or (self.scene().selectedItems() if self.isSelected() else [])
         group_leader = getattr(self.scene(), '_group_leader', None)
         if view and getattr(view, 'show_grid', False):
-            grid_size = 40
+            grid_size = GRID_SIZE
             magnet_radius = 5
             if len(selected) > 1:
                 # --- Только ведущий блок двигает остальных ---
@@ -405,11 +831,12 @@ class StageGraphicsItem(QGraphicsObject):
                             snap_y = grid_y - cy
                     x += snap_x
                     y += snap_y
-                    self.setPos(QPointF(x, y))
-                    # --- Двигаем остальные выделенные блоки синхронно ---
-                    for item in selected:
-                        if item is not self and hasattr(item, '_group_drag_start_pos') and hasattr(item, '_group_offset'):
-                            item.setPos(event.scenePos() - item._group_offset)
+                    with self._batch_update():
+                        self.setPos(QPointF(x, y))
+                        # --- Двигаем остальные выделенные блоки синхронно ---
+                        for item in selected:
+                            if item is not self and hasattr(item, '_group_drag_start_pos') and hasattr(item, '_group_offset'):
+                                item.setPos(event.scenePos() - item._group_offset)
                 else:
                     # Остальные не двигаются
                     pass
@@ -441,11 +868,12 @@ class StageGraphicsItem(QGraphicsObject):
         else:
             if len(selected) > 1:
                 if self is group_leader:
-                    self.setPos(QPointF(new_pos.x(), new_pos.y()))
-                    # --- Двигаем остальные выделенные блоки синхронно ---
-                    for item in selected:
-                        if item is not self and hasattr(item, '_group_drag_start_pos') and hasattr(item, '_group_offset'):
-                            item.setPos(event.scenePos() - item._group_offset)
+                    with self._batch_update():
+                        self.setPos(QPointF(new_pos.x(), new_pos.y()))
+                        # --- Двигаем остальные выделенные блоки синхронно ---
+                        for item in selected:
+                            if item is not self and hasattr(item, '_group_drag_start_pos') and hasattr(item, '_group_offset'):
+                                item.setPos(event.scenePos() - item._group_offset)
                 else:
                     # Остальные не двигаются
                     pass
@@ -473,6 +901,8 @@ class StageGraphicsItem(QGraphicsObject):
             # --- Очищаем ведущий блок ---
             if hasattr(self.scene(), '_group_leader'):
                 del self.scene()._group_leader
+            if hasattr(self, '_group_items'):
+                del self._group_items
         if self.resizing:
             self.resizing = False
             if not self.is_locked:
@@ -491,11 +921,50 @@ class StageGraphicsItem(QGraphicsObject):
     def boundingRect(self):
         return self.rect
 
+    def _border_color(self):
+        return self._animated_border_color if self.isSelected() else QColor(self.stage_data.get('border_color', '#BDBDBD'))
+
+    def _plain_title(self):
+        """Заголовок без тегов и разметки для упрощённой отрисовки."""
+        return shared_render_cache().markup(self.stage_data.get('title', '')).plain_text()
+
+    def _paint_reduced(self, painter, lod):
+        """Отрисовка при отдалении: без HTML, тегов, значков и многослойного свечения.
+
+        На уровне LOD_TITLE..LOD_FULL - рамка и заголовок, ниже - прямоугольник
+        цвета рамки. Найденные и подсвеченные блоки обводятся одной толстой
+        рамкой, чтобы их было видно и на обзорном масштабе.
+        """
+        rect = self.boundingRect()
+        painter.setRenderHint(QPainter.Antialiasing, False)
+        if self._highlight_opacity > 0:
+            highlight_color = QColor(getattr(self, '_highlight_color', None) or QColor(255, 0, 0))
+            highlight_color.setAlphaF(self._highlight_opacity)
+            painter.fillRect(rect.adjusted(-12, -12, 12, 12), highlight_color)
+        elif self.search_glow_opacity > 0.01:
+            painter.fillRect(rect.adjusted(-12, -12, 12, 12), QColor(0, 0, 0, int(120 * self.search_glow_opacity)))
+        if lod < LOD_TITLE:
+            painter.fillRect(rect, self._border_color())
+            return
+        painter.setBrush(QColor('#FFFFFF'))
+        painter.setPen(QPen(self._border_color(), 3))
+        painter.drawRect(rect)
+        self._paint_reduced_content(painter, rect)
+
+    def _paint_reduced_content(self, painter, rect):
+        painter.setPen(QColor('#222222'))
+        painter.setFont(self.font)
+        painter.drawText(rect.adjusted(8, 8, -8, -8), Qt.AlignLeft | Qt.AlignTop, self._plain_title().split('\n', 1)[0])
+
     def paint(self, painter, option, widget=None):
+        lod = option.levelOfDetailFromTransform(painter.worldTransform())
+        if lod < LOD_FULL:
+            self._paint_reduced(painter, lod)
+            return
         painter.setRenderHint(QPainter.Antialiasing)
         bg_color = QColor("#FFFFFF")
         border_width = 3
-        border_color = self._animated_border_color if self.isSelected() else QColor(self.stage_data.get('border_color', '#BDBDBD'))
+        border_color = self._border_color()
         
         # Сначала рисуем красную рамку, если нужно
         if self._highlight_opacity > 0:
@@ -516,20 +985,8 @@ class StageGraphicsItem(QGraphicsObject):
         painter.setPen(QColor("#222222"))
         painter.setFont(self.font)
         
-        # Используем только очищенный текст без тегов
-        raw_text = self.stage_data.get('title', '')
-        tags, cleaned_text = parse_tags_from_text(raw_text)
-        html = parse_discord_to_html(cleaned_text)
-        
-        if self._cached_doc is None or self._cached_html != html or self._cached_doc.textWidth() != self.boundingRect().width() - 16:
-            doc = QTextDocument()
-            doc.setDefaultFont(self.font)
-            doc.setHtml(html)
-            doc.setTextWidth(self.boundingRect().width() - 16)
-            self._cached_doc = doc
-            self._cached_html = html
-            
-        doc = self._cached_doc
+        # Используем только очищенный текст без тегов; разбор и вёрстка берутся из общего кэша
+        doc = shared_render_cache().text_document(self.stage_data.get('title', ''), self.font, self.boundingRect().width() - 16)
         painter.save()
         painter.translate(self.boundingRect().left() + 8, self.boundingRect().top() + 8)
         clip = QRectF(0, 0, self.boundingRect().width() - 16, self.boundingRect().height() - 16)
@@ -614,27 +1071,24 @@ class StageGraphicsItem(QGraphicsObject):
                 view.color_history = color_dialog._history_colors.copy()
                 view.save_undo_state()
                 selected = self.scene().selectedItems() or [self]
-                for item in selected:
-                    if isinstance(item, StageGraphicsItem):
-                        item.update_color(color.name())
-                        if item.animation:
+                with view.batch_update():
+                    for item in selected:
+                        if isinstance(item, StageGraphicsItem):
+                            item.update_color(color.name())
                             item._start_pulsing_animation()
 
     def update_color(self, color_name):
         self.stage_data['border_color'] = color_name
         self._animated_border_color = QColor(color_name)
-        if self.animation:
-            self.animation.stop()
+        self._stop_pulsing_animation()
         self.update()
+        self._mark_dirty()
         if self.scene():
-            for conn in list(self.connections):
-                if conn.scene():
-                    conn.update()
+            self._update_connections()
 
     def update_data(self, new_data):
         if 'formatted_title' in new_data:
-            self.rich_text_editor.from_json(new_data['formatted_title'])
-            self.stage_data['title'] = self.rich_text_editor.get_raw_text()
+            self.stage_data['title'] = raw_text_from_json(new_data['formatted_title'])
         else:
             self.stage_data['title'] = new_data.get('title', self.stage_data.get('title', ''))
         self.stage_data.pop('width', None)
@@ -651,46 +1105,24 @@ class StageGraphicsItem(QGraphicsObject):
             return
         super().mouseDoubleClickEvent(event)
 
-    @pyqtProperty(float)
-    def highlightOpacity(self):
-        return self._highlight_opacity
-
-    @highlightOpacity.setter
-    def highlightOpacity(self, value):
+    def _set_highlight_opacity(self, value):
         self._highlight_opacity = value
-        self.update()
+        return (self,)
 
     def start_highlight(self, color=None):
-        if self.highlight_animation_group and self.highlight_animation_group.state() == QPropertyAnimation.Running:
+        clock = shared_animation_clock()
+        if clock.is_running(self, 'highlight'):
             return
 
         self.setZValue(1) # Выносим на передний план при подсветке
 
         self._highlight_color = color if color is not None else QColor(255, 0, 0)
-
-        self.highlight_animation_group = QSequentialAnimationGroup(self)
-        
-        anim1 = QPropertyAnimation(self, b'highlightOpacity', self)
-        anim1.setDuration(700)
-        anim1.setStartValue(1.0)
-        anim1.setEndValue(0.3)
-        anim1.setEasingCurve(QEasingCurve.InOutSine)
-
-        anim2 = QPropertyAnimation(self, b'highlightOpacity', self)
-        anim2.setDuration(700)
-        anim2.setStartValue(0.3)
-        anim2.setEndValue(1.0)
-        anim2.setEasingCurve(QEasingCurve.InOutSine)
-        
-        self.highlight_animation_group.addAnimation(anim1)
-        self.highlight_animation_group.addAnimation(anim2)
-        self.highlight_animation_group.setLoopCount(-1)
-        self.highlight_animation_group.start()
+        self._highlight_opacity = 1.0
+        clock.start(self, 'highlight', AnimationTrack(self._set_highlight_opacity, 1.0, 0.3, 700, QEasingCurve.InOutSine, loop='pingpong'))
+        self.update()
 
     def stop_highlight(self):
-        if self.highlight_animation_group:
-            self.highlight_animation_group.stop()
-            self.highlight_animation_group = None
+        shared_animation_clock().stop(self, 'highlight')
         self._highlight_opacity = 0
         self._highlight_color = None
         self.setZValue(0) # Возвращаем обычный Z-индекс
@@ -704,74 +1136,41 @@ class StageGraphicsItem(QGraphicsObject):
         self.recalculate_size()
         self.update()
 
-    @pyqtProperty(float)
-    def searchGlowOpacity(self):
-        return self.search_glow_opacity
-    @searchGlowOpacity.setter
-    def searchGlowOpacity(self, value):
+    def _set_search_glow_opacity(self, value):
         self.search_glow_opacity = value
-        self.update()
+        return (self,)
 
     def show_search_glow(self):
-        # Запускаем пульсацию
-        if self._search_glow_anim:
-            self._search_glow_anim.stop()
-        if self._search_glow_pulse:
-            self._search_glow_pulse.stop()
-        self._search_glow_anim = QPropertyAnimation(self, b'searchGlowOpacity')
-        self._search_glow_anim.setDuration(200)
-        self._search_glow_anim.setStartValue(self.search_glow_opacity)
-        self._search_glow_anim.setEndValue(1.0)
-        self._search_glow_anim.setEasingCurve(QEasingCurve.OutCubic)
-        self._search_glow_anim.finished.connect(self._start_glow_pulse)
-        self._search_glow_anim.start()
+        # Быстрое появление, затем пульсация
+        shared_animation_clock().start(self, 'search_glow', AnimationTrack(
+            self._set_search_glow_opacity, self.search_glow_opacity, 1.0, 200, QEasingCurve.OutCubic,
+            on_finished=self._start_glow_pulse))
 
     def _start_glow_pulse(self):
-        self._search_glow_pulse = QPropertyAnimation(self, b'searchGlowOpacity')
-        self._search_glow_pulse.setDuration(900)
-        self._search_glow_pulse.setStartValue(1.0)
-        self._search_glow_pulse.setEndValue(0.3)
-        self._search_glow_pulse.setEasingCurve(QEasingCurve.InOutSine)
-        self._search_glow_pulse.setLoopCount(-1)
-        self._search_glow_pulse.setDirection(QPropertyAnimation.Backward)
-        self._search_glow_pulse.start()
+        shared_animation_clock().start(self, 'search_glow', AnimationTrack(
+            self._set_search_glow_opacity, 0.3, 1.0, 900, QEasingCurve.InOutSine, loop='repeat'))
 
     def hide_search_glow(self):
-        if self._search_glow_anim:
-            self._search_glow_anim.stop()
-        if self._search_glow_pulse:
-            self._search_glow_pulse.stop()
-        self._search_glow_anim = QPropertyAnimation(self, b'searchGlowOpacity')
-        self._search_glow_anim.setDuration(250)
-        self._search_glow_anim.setStartValue(self.search_glow_opacity)
-        self._search_glow_anim.setEndValue(0.0)
-        self._search_glow_anim.setEasingCurve(QEasingCurve.OutCubic)
-        self._search_glow_anim.start()
+        shared_animation_clock().start(self, 'search_glow', AnimationTrack(
+            self._set_search_glow_opacity, self.search_glow_opacity, 0.0, 250, QEasingCurve.OutCubic))
 
 class ImageStageGraphicsItem(StageGraphicsItem):
     """Специализированный блок для отображения изображения и описания под ним с возможностью изменения размера."""
-    def __init__(self, stage_data):
+    def __init__(self, stage_data, image_store=None):
         super().__init__(stage_data, _recalculate=False)
-        self.rich_text_editor = ScrollableRichTextEditor()  # Для поддержки форматирования
-        from PyQt5.QtGui import QImage
-        self.original_image = QImage(self.stage_data.get('image_path'))
-        self.pixmap = QPixmap.fromImage(self.original_image)
-        if 'image_width' in self.stage_data and not self.original_image.isNull():
-            new_w = self.stage_data['image_width']
-            self.pixmap = QPixmap.fromImage(self.original_image.scaledToWidth(new_w, Qt.SmoothTransformation))
+        # Блок хранит только ссылку на изображение; байты и QImage живут в общем хранилище
+        self.image_store = image_store if image_store is not None else ImageStore()
+        self.image_hash = self.image_store.adopt_stage_image(self.stage_data)
+        self.pixmap = self.image_store.pixmap(self.image_hash, self.stage_data.get('image_width'))
         self.padding = 15
         self.text_margin_top = 10
         self.description_font = QFont('Finlandica Bold', 9)
-        self._cached_desc = None
-        self._cached_desc_html = None
-        self._cached_desc_width = None
         self.recalculate_size()
 
     def recalculate_size(self, new_image_width=None):
-        from PyQt5.QtGui import QImage
         self.prepareGeometryChange()
-        if not self.original_image.isNull() and new_image_width is not None:
-            self.pixmap = QPixmap.fromImage(self.original_image.scaledToWidth(int(new_image_width), Qt.SmoothTransformation))
+        if new_image_width is not None and not self.pixmap.isNull():
+            self.pixmap = self.image_store.pixmap(self.image_hash, new_image_width, cache=False)
         image_width = self.pixmap.width()
         image_height = self.pixmap.height()
         fm = QFontMetrics(self.description_font)
@@ -784,12 +1183,22 @@ class ImageStageGraphicsItem(StageGraphicsItem):
         self.update()
         for conn in self.connections:
             conn.update_path()
+        self._mark_dirty()
+
+    def _paint_reduced_content(self, painter, rect):
+        # Только само изображение, без описания
+        if not self.pixmap.isNull():
+            painter.drawPixmap(int((self.rect.width() - self.pixmap.width()) / 2), int(self.padding), self.pixmap)
 
     def paint(self, painter, option, widget=None):
+        lod = option.levelOfDetailFromTransform(painter.worldTransform())
+        if lod < LOD_FULL:
+            self._paint_reduced(painter, lod)
+            return
         painter.setRenderHint(QPainter.Antialiasing)
         bg_color = QColor("#FFFFFF")
         border_width = 3
-        border_color = self._animated_border_color if self.isSelected() else QColor(self.stage_data.get('border_color', '#BDBDBD'))
+        border_color = self._border_color()
         painter.setBrush(QBrush(bg_color))
         painter.setPen(QPen(border_color, border_width))
         painter.drawRoundedRect(self.boundingRect(), 10, 10)
@@ -804,21 +1213,9 @@ class ImageStageGraphicsItem(StageGraphicsItem):
         description_rect = QRectF(text_x, text_y, text_wrap_width, remaining_height)
         painter.setPen(QColor("#222"))
         painter.setFont(self.description_font)
-        desc = self.stage_data.get('description', '')
-        desc_html = parse_discord_to_html(desc)
-        if (
-            self._cached_desc is None or
-            self._cached_desc_html != desc_html or
-            self._cached_desc_width != text_wrap_width
-        ):
-            doc = QTextDocument()
-            doc.setDefaultFont(self.description_font)
-            doc.setHtml(desc_html)
-            doc.setTextWidth(text_wrap_width)
-            self._cached_desc = doc
-            self._cached_desc_html = desc_html
-            self._cached_desc_width = text_wrap_width
-        doc = self._cached_desc
+        # В описании теги не выделяются - разметка переводится в HTML как есть
+        doc = shared_render_cache().text_document(self.stage_data.get('description', ''), self.description_font,
+                                                  text_wrap_width, with_tags=False)
         painter.save()
         painter.translate(description_rect.left(), description_rect.top())
         doc.drawContents(painter, QRectF(0, 0, description_rect.width(), description_rect.height()))
@@ -871,6 +1268,7 @@ class ImageStageGraphicsItem(StageGraphicsItem):
             if not self.is_locked:
                 self.setFlag(QGraphicsItem.ItemIsMovable, True)
             self.stage_data['image_width'] = self.pixmap.width()
+            self.pixmap = self.image_store.pixmap(self.image_hash, self.pixmap.width())
             self.recalculate_size()
             event.accept()
             return
@@ -891,7 +1289,6 @@ class ImageStageGraphicsItem(StageGraphicsItem):
 class TxtStageGraphicsItem(StageGraphicsItem):
     def __init__(self, stage_data):
         super().__init__(stage_data, _recalculate=False)
-        self.rich_text_editor = ScrollableRichTextEditor()  # Для поддержки форматирования
         self.icon = QPixmap(32, 32)
         self.icon.fill(Qt.transparent)
         painter = QPainter(self.icon)
@@ -983,8 +1380,28 @@ class TxtStageGraphicsItem(StageGraphicsItem):
         self.update()
         for conn in self.connections:
             conn.update_path()
+        self._mark_dirty()
+
+    def _paint_reduced(self, painter, lod):
+        # Упрощённый ярлык: лист без уголка и надписи TXT, под ним первая строка названия
+        painter.setRenderHint(QPainter.Antialiasing, False)
+        paper_rect = QRectF(self.rect.left() + (self.rect.width() - 40) / 2, self.rect.top(), 40, 40)
+        if lod < LOD_TITLE:
+            painter.fillRect(paper_rect, QColor('#CCCCCC'))
+            return
+        painter.setBrush(QColor('#FFFFFF'))
+        painter.setPen(QPen(QColor('#CCCCCC'), 1.5))
+        painter.drawRect(paper_rect)
+        painter.setFont(self.font)
+        painter.setPen(QColor('#222'))
+        painter.drawText(QRectF(self.rect.left() + 6, self.rect.top() + 44, self.rect.width() - 12, self.rect.height() - 44),
+                         Qt.AlignHCenter | Qt.AlignTop, self.stage_data.get('title', 'Новый txt-файл'))
 
     def paint(self, painter, option, widget=None):
+        lod = option.levelOfDetailFromTransform(painter.worldTransform())
+        if lod < LOD_FULL:
+            self._paint_reduced(painter, lod)
+            return
         painter.setRenderHint(QPainter.Antialiasing)
         # Нет рамки и фона блока
         # Рисуем иконку-ярлык (лист с уголком)
@@ -1059,9 +1476,10 @@ class TxtStageGraphicsItem(StageGraphicsItem):
                     view = self.scene().views()[0]
                     view.save_undo_state()
                     items_to_delete = self.scene().selectedItems() or [self]
-                    for item in items_to_delete:
-                        if isinstance(item, StageGraphicsItem):
-                            view.delete_stage(item, save_state=False)
+                    with view.batch_update():
+                        for item in items_to_delete:
+                            if isinstance(item, StageGraphicsItem):
+                                view.delete_stage(item, save_state=False)
             actions.append(('Редактировать txt', edit_action))
             actions.append(('Удалить', delete_action))
             menu = GlassMenu(actions, parent=self.scene().views()[0] if self.scene() and self.scene().views() else None)
@@ -1077,8 +1495,7 @@ class TxtStageGraphicsItem(StageGraphicsItem):
 
     def update_data(self, new_data):
         if 'formatted_note_text' in new_data:
-            self.rich_text_editor.from_json(new_data['formatted_note_text'])
-            self.stage_data['note_text'] = self.rich_text_editor.get_raw_text()
+            self.stage_data['note_text'] = raw_text_from_json(new_data['formatted_note_text'])
         else:
             self.stage_data['note_text'] = new_data.get('note_text', self.stage_data.get('note_text', ''))
         self.stage_data['title'] = new_data.get('title', self.stage_data.get('title', ''))
@@ -1110,31 +1527,63 @@ class TxtStageGraphicsItem(StageGraphicsItem):
     def contains(self, point):
         return self.shape().contains(point)
 
-class GridGraphicsItem(QGraphicsItem):
-    def __init__(self, scene_rect, grid_size=40, parent=None):
-        super().__init__(parent)
-        self.setZValue(-100)
+class GridBackground:
+    """Фоновая сетка, которую вид рисует в drawBackground.
+
+    Рисуются только линии в открытой области, поэтому стоимость не зависит
+    от размера сцены. При отдалении шаг удваивается, пока линии не станут
+    реже MIN_GRID_PX пикселей: промежуточные линии перед слиянием
+    постепенно бледнеют. Сдвиг вида обходится без перерисовки сетки -
+    вид держит фон в кэше (QGraphicsView.CacheBackground) и дорисовывает
+    только открывшиеся полосы.
+    """
+
+    def __init__(self, grid_size=GRID_SIZE, color=QColor(220, 220, 220)):
         self.grid_size = grid_size
-        self.scene_rect = scene_rect
-        self.setFlag(QGraphicsItem.ItemIgnoresTransformations, False)
-        self.setAcceptedMouseButtons(Qt.NoButton)
-    def boundingRect(self):
-        return self.scene_rect
-    def paint(self, painter, option, widget=None):
-        painter.setPen(QPen(QColor(220,220,220), 1))
-        left = int(self.scene_rect.left())
-        right = int(self.scene_rect.right())
-        top = int(self.scene_rect.top())
-        bottom = int(self.scene_rect.bottom())
-        for x in range(left - left % self.grid_size, right, self.grid_size):
-            painter.drawLine(x, top, x, bottom)
-        for y in range(top - top % self.grid_size, bottom, self.grid_size):
-            painter.drawLine(left, y, right, y)
+        self.color = QColor(color)
+        self._pens = {}   # прозрачность -> косметическое перо
+
+    def step_for_scale(self, scale):
+        step = self.grid_size
+        while step * scale < MIN_GRID_PX:
+            step *= 2
+        return step
+
+    def _pen(self, alpha):
+        pen = self._pens.get(alpha)
+        if pen is None:
+            color = QColor(self.color)
+            color.setAlpha(alpha)
+            pen = self._pens[alpha] = QPen(color, 0)
+        return pen
+
+    def paint(self, painter, rect):
+        transform = painter.worldTransform()
+        scale = math.hypot(transform.m11(), transform.m12())
+        step = self.step_for_scale(scale)
+        # Нечётные линии сольются при следующем удвоении шага - они бледнеют заранее
+        fade = min(1.0, (step * scale - MIN_GRID_PX) / MIN_GRID_PX)
+        major, minor = [], []
+        for k in range(math.floor(rect.left() / step), math.ceil(rect.right() / step) + 1):
+            (minor if k % 2 else major).append(QLineF(k * step, rect.top(), k * step, rect.bottom()))
+        for k in range(math.floor(rect.top() / step), math.ceil(rect.bottom() / step) + 1):
+            (minor if k % 2 else major).append(QLineF(rect.left(), k * step, rect.right(), k * step))
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing, False)
+        painter.setPen(self._pen(self.color.alpha()))
+        painter.drawLines(major)
+        alpha = round(self.color.alpha() * fade)
+        if alpha > 0:
+            painter.setPen(self._pen(alpha))
+            painter.drawLines(minor)
+        painter.restore()
 
 class RoadMapWidget(QGraphicsView):
     stage_edit_requested = pyqtSignal(object); new_project_requested = pyqtSignal()
     open_project_requested = pyqtSignal(); save_project_requested = pyqtSignal()
     save_as_project_requested = pyqtSignal(); export_png_requested = pyqtSignal()
+    project_changed = pyqtSignal()  # Любая правка сцены (для автосохранения)
+    viewport_changed = pyqtSignal()  # Прокрутка, масштаб или размер видимой области
     
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -1147,8 +1596,8 @@ class RoadMapWidget(QGraphicsView):
         self._drag_mode_before_arrow_draw = QGraphicsView.ScrollHandDrag
         self.focused_on_sources = []
         self.preview_items = set()
-        self.undo_stack = []
-        self.redo_stack = []
+        self.undo_engine = UndoEngine()  # Шаги отмены: изменения блоков и связей между контрольными точками
+        self._stages_by_id = {}          # id этапа -> блок на сцене
         self._is_dragging = False
         self._eyedropper_mode = False
         self._eyedropper_dialog = None
@@ -1156,7 +1605,25 @@ class RoadMapWidget(QGraphicsView):
         self.color_history = []
         self.timelines = []
         self.show_grid = False
-        self.grid_item = None
+        self.grid = GridBackground()
+        self.image_store = ImageStore()  # Общие изображения блоков по SHA-256
+        self.journal = None              # ProjectJournal или SqliteProjectStore, куда пишутся правки
+        self.store = None                # SqliteProjectStore, если проект открыт из базы .rmdb
+        self.pager = None                # ScenePager, подгружающий блоки базы по видимой области
+        self.connection_layer = None     # ConnectionLayerItem, если связи рисуются одним слоем
+        self.stage_index = QuadTree()    # Рамки блоков на сцене для запросов по области и точке
+        self.content_bounds = BoundsTracker()   # Общая рамка блоков без обхода сцены (отдаление, рост сцены)
+        self._stack_counter = itertools.count()  # Порядок добавления блоков (наложение при равном Z)
+        self.graph = GraphIndex()        # Блоки и связи между ними для поиска связей и обхода
+        self.graph_analysis = GraphAnalysis(self.graph)  # Мосты и стороны связей для фокуса
+        self._dimmed = None              # Затемнённые фокусом блоки (None - фокус не применён)
+        self._pulsing_selection = set()  # Выделенные блоки, у которых запущена пульсация
+        self._batch_depth = 0            # Вложенность batch_update()
+        self._batch_moved = set()        # Этапы, сдвинутые внутри пакета
+        self._batch_repaint = set()      # Связи, которые нужно перерисовать по завершении пакета
+        self._batch_changed = False      # Была ли правка (project_changed) внутри пакета
+        self._batch_selection_changed = False
+        self._journal_dirty = set()      # Этапы, изменённые с последней записи в журнал
         self.setup_ui()
         self.scene.selectionChanged.connect(self.handle_selection_changed)
         self._search_glows = {}  # block: glow
@@ -1192,86 +1659,121 @@ class RoadMapWidget(QGraphicsView):
         connection = ConnectionGraphicsItem(start_item, end_item)
         start_item.add_connection(connection)
         end_item.add_connection(connection)
-        self.scene.addItem(connection)
+        self.graph.add_edge(connection)
+        self._attach_connection(connection)
+        if self.store is None:
+            self.undo_engine.connection_changed(start_item.stage_data['id'], end_item.stage_data['id'], True)
         connection.half_clicked.connect(self.handle_half_click)
         connection.half_hovered.connect(self.handle_half_hover)
+        if self.journal is not None:
+            self.journal.connection_added(start_item.stage_data['id'], end_item.stage_data['id'])
+        self._notify_changed()
 
-    def delete_connection(self, connection):
-        self.save_undo_state()
+    def delete_connection(self, connection, save_state=True):
+        if save_state: self.save_undo_state()
         if connection in connection.start_item.connections:
             connection.start_item.connections.remove(connection)
         if connection in connection.end_item.connections:
             connection.end_item.connections.remove(connection)
-        self.scene.removeItem(connection)
+        self.graph.remove_edge(connection)
+        self._detach_connection(connection)
+        if self.store is None:
+            self.undo_engine.connection_changed(connection.start_item.stage_data['id'], connection.end_item.stage_data['id'], False)
+        if self.journal is not None:
+            self.journal.connection_removed(connection.start_item.stage_data['id'], connection.end_item.stage_data['id'])
+        self._notify_changed()
+
+    def _attach_connection(self, connection):
+        if self.connection_layer is not None:
+            self.connection_layer.add_edge(connection)
+        else:
+            self.scene.addItem(connection)
+
+    def _detach_connection(self, connection):
+        if connection.layer is not None:
+            connection.layer.remove_edge(connection)
+        elif connection.scene():
+            self.scene.removeItem(connection)
+
+    def connection_items(self):
+        return self.graph.connections()
+
+    def set_connection_layer(self, enabled):
+        """Переключает отрисовку связей: отдельные элементы сцены или один общий слой."""
+        if enabled == (self.connection_layer is not None):
+            return
+        connections = self.connection_items()
+        for conn in connections:
+            self._detach_connection(conn)
+        if enabled:
+            self.connection_layer = ConnectionLayerItem()
+            self.scene.addItem(self.connection_layer)
+        else:
+            self.scene.removeItem(self.connection_layer)
+            self.connection_layer = None
+        for conn in connections:
+            self._attach_connection(conn)
 
     def toggle_connection(self, item1, item2):
-        for conn in list(item1.connections):
-            if (conn.start_item == item1 and conn.end_item == item2) or \
-               (conn.start_item == item2 and conn.end_item == item1):
-                self.delete_connection(conn)
-                return
-        self.add_connection(item1, item2)
+        conn = self.graph.edge_between(item1, item2)
+        if conn is not None:
+            self.delete_connection(conn)
+        else:
+            self.add_connection(item1, item2)
         
     def check_and_expand_scene(self, item):
-        margin = 1500
-        item_rect_in_scene = item.mapToScene(item.boundingRect()).boundingRect()
-        required_rect = item_rect_in_scene.adjusted(-margin, -margin, margin, margin)
+        self._expand_scene_to(item.sceneBoundingRect())
+
+    def _expand_scene_to(self, rect):
         current_rect = self.sceneRect()
-        new_scene_rect = current_rect.united(required_rect)
-        if new_scene_rect != current_rect:
-            self.setSceneRect(new_scene_rect)
+        if current_rect.contains(rect.adjusted(-SCENE_MARGIN, -SCENE_MARGIN, SCENE_MARGIN, SCENE_MARGIN)):
+            return
+        # Растём крупным шагом: при перетаскивании к краю сцена меняется раз в несколько тысяч единиц, а не на каждый сдвиг
+        step = max(SCENE_GROW_STEP, current_rect.width() / 4, current_rect.height() / 4)
+        left = min(current_rect.left(), rect.left() - SCENE_MARGIN - (step if rect.left() - SCENE_MARGIN < current_rect.left() else 0))
+        top = min(current_rect.top(), rect.top() - SCENE_MARGIN - (step if rect.top() - SCENE_MARGIN < current_rect.top() else 0))
+        right = max(current_rect.right(), rect.right() + SCENE_MARGIN + (step if rect.right() + SCENE_MARGIN > current_rect.right() else 0))
+        bottom = max(current_rect.bottom(), rect.bottom() + SCENE_MARGIN + (step if rect.bottom() + SCENE_MARGIN > current_rect.bottom() else 0))
+        self.setSceneRect(QRectF(left, top, right - left, bottom - top))
             
     def handle_selection_changed(self):
+        if self._batch_depth:
+            self._batch_selection_changed = True
+            return
         if self.focused_on_sources: return
-        selected_items = self.scene.selectedItems()
-        for item in self.scene.items():
-            if isinstance(item, StageGraphicsItem):
-                if item in selected_items: item._start_pulsing_animation()
-                else: item.animation.stop()
-
-    def _get_reachable_nodes_undirected_excluding_edge(self, from_node, exclude_a, exclude_b):
-        nodes = set()
-        queue = [from_node]
-        visited = {from_node}
-        while queue:
-            current = queue.pop(0)
-            nodes.add(current)
-            for conn in self.scene.items():
-                if isinstance(conn, ConnectionGraphicsItem):
-                    if ((conn.start_item == exclude_a and conn.end_item == exclude_b) or
-                        (conn.start_item == exclude_b and conn.end_item == exclude_a)):
-                        continue
-                    if conn.start_item == current and conn.end_item not in visited:
-                        visited.add(conn.end_item)
-                        queue.append(conn.end_item)
-                    if conn.end_item == current and conn.start_item not in visited:
-                        visited.add(conn.start_item)
-                        queue.append(conn.start_item)
-        return nodes
+        # Пульсация переключается только у блоков, выделение которых изменилось
+        selected = {item for item in self.scene.selectedItems() if isinstance(item, StageGraphicsItem)}
+        previous = self._pulsing_selection
+        for item in previous - selected:
+            item._stop_pulsing_animation()
+        for item in selected - previous:
+            item._start_pulsing_animation()
+        self._pulsing_selection = selected
 
     def _calculate_nodes_to_hide(self, connection, half):
+        # Блоки по ту сторону связи без связей между её концами - компонента или сторона моста
         start_node, end_node = connection.start_item, connection.end_item
-        if half == 'start':
-            return self._get_reachable_nodes_undirected_excluding_edge(end_node, start_node, end_node)
-        else:
-            return self._get_reachable_nodes_undirected_excluding_edge(start_node, start_node, end_node)
+        from_node = end_node if half == 'start' else start_node
+        return self.graph_analysis.far_side(from_node, start_node, end_node)
 
     def handle_half_hover(self, connection, half, is_active):
-        for item in self.preview_items:
+        nodes = set()
+        if is_active and not self.focused_on_sources:
+            nodes = set(self._calculate_nodes_to_hide(connection, half))
+        # Пульсация переключается только у блоков, которые вошли в подсветку или вышли из неё
+        for item in self.preview_items - nodes - self._pulsing_selection:
             if isinstance(item, StageGraphicsItem) and item.scene():
-                item.animation.stop()
-        self.preview_items.clear()
-        if not is_active or self.focused_on_sources: return
-        nodes_to_hide = self._calculate_nodes_to_hide(connection, half)
-        self.preview_items = nodes_to_hide
-        for node in nodes_to_hide:
+                item._stop_pulsing_animation()
+        for node in nodes - self.preview_items:
             if node.scene():
                 node._start_pulsing_animation()
+        self.preview_items = nodes
 
     def _reset_preview(self):
         for item in list(self.preview_items):
             if isinstance(item, StageGraphicsItem) and item.scene():
-                if item.animation: item.animation.stop()
+                if item not in self._pulsing_selection:   # Выделенный блок пульсирует и без подсветки
+                    item._stop_pulsing_animation()
             elif isinstance(item, QGraphicsLineItem) and item.scene() == self.scene:
                 self.scene.removeItem(item)
         self.preview_items.clear()
@@ -1292,46 +1794,61 @@ class RoadMapWidget(QGraphicsView):
 
         all_nodes_to_hide = set()
         # Фильтруем неактуальные источники фокуса (если связь была удалена)
-        self.focused_on_sources = [s for s in self.focused_on_sources if s[0].scene()]
+        self.focused_on_sources = [s for s in self.focused_on_sources if s[0].is_attached()]
         
         for conn, h in self.focused_on_sources:
             nodes_to_hide_for_source = self._calculate_nodes_to_hide(conn, h)
             all_nodes_to_hide.update(nodes_to_hide_for_source)
 
-        all_nodes = {item for item in self.scene.items() if isinstance(item, StageGraphicsItem)}
-        active_nodes = all_nodes - all_nodes_to_hide
-        self._apply_focus(active_nodes)
+        self._apply_focus(all_nodes_to_hide)
 
     def reset_focus(self):
         self.focused_on_sources.clear()
         self._reset_preview()
-        all_items = list(self.scene.items())
-        for item in all_items:
-            if isinstance(item, StageGraphicsItem):
-                item.setOpacity(1.0)
-                if item.animation: item.animation.stop()
-        for item in all_items:
-            if isinstance(item, ConnectionGraphicsItem) and item.scene(): item.update()
+        restored = [item for item in self._dimmed or () if item.scene() is self.scene]
+        for item in restored:
+            item.setOpacity(1.0)
+        self._repaint_connections_of(restored)
+        self._dimmed = None
+        for item in self.stage_items():
+            item._stop_pulsing_animation()
+        self._pulsing_selection = set()
         self.handle_selection_changed()
-        self.scene.update()
 
-    def _apply_focus(self, active_nodes):
-        all_items = list(self.scene.items())
-        for item in all_items:
-            if isinstance(item, StageGraphicsItem):
-                is_lonely = len(item.connections) == 0
-                is_active = item in active_nodes or is_lonely
-                item.setOpacity(1.0 if is_active else 0.3)
-                if item.animation: item.animation.stop()
-                if is_active: item._start_pulsing_animation()
-        for item in all_items:
-            if isinstance(item, ConnectionGraphicsItem) and item.scene(): item.update()
-        self.scene.update()
+    def _apply_focus(self, hidden_nodes):
+        # Блоки без связей не затемняются. Прозрачность и связи обновляются
+        # только у блоков, состояние которых изменилось с прошлого фокуса.
+        dimmed = {item for item in hidden_nodes if item.connections and item.scene() is self.scene}
+        previous = self._dimmed
+        if previous is None:
+            brighten = [item for item in self.stage_items() if item not in dimmed]
+            darken = dimmed
+            changed = darken   # До фокуса все блоки непрозрачны
+        else:
+            brighten = [item for item in previous - dimmed if item.scene() is self.scene]
+            darken = dimmed - previous
+            changed = list(darken) + brighten
+        for item in darken:
+            item.setOpacity(0.3)
+            item._stop_pulsing_animation()
+        for item in brighten:
+            item.setOpacity(1.0)
+            item._start_pulsing_animation()
+        self._dimmed = dimmed
+        self._repaint_connections_of(changed)
+
+    def _repaint_connections_of(self, items):
+        # Цвет связи зависит от прозрачности её концов; общая связь двух блоков перерисовывается один раз
+        connections = set()
+        for item in items:
+            connections.update(item.connections)
+        for conn in connections:
+            conn.update()
 
     def mousePressEvent(self, event):
         self.setFocus()
         if self._eyedropper_mode:
-            item_at_pos = self.itemAt(event.pos())
+            item_at_pos = self.stage_at(self.mapToScene(event.pos()))
             color_to_set = None
 
             if isinstance(item_at_pos, StageGraphicsItem):
@@ -1365,7 +1882,10 @@ class RoadMapWidget(QGraphicsView):
             # Не вызываем super, чтобы не было лишних событий
             return
         else:
-            if event.button() == Qt.LeftButton: self._is_dragging = True
+            if event.button() == Qt.LeftButton:
+                # Перетаскивание или изменение размера - отдельный шаг отмены
+                self.save_undo_state()
+                self._is_dragging = True
             super().mousePressEvent(event)
 
     def mouseReleaseEvent(self, event):
@@ -1382,9 +1902,43 @@ class RoadMapWidget(QGraphicsView):
         if stage_data is None:
             stage_data = {'id': str(uuid.uuid4()), 'title': 'Новый этап', 'border_color': '#BDBDBD',
                           'position': self.mapToScene(position) if position else QPointF(50, 50)}
+        item = self.materialize_stage(stage_data)
+        self.scene.clearSelection()
+        item.setSelected(True)
+        return item
+
+    def materialize_stage(self, stage_data):
+        """Создаёт блок этапа и добавляет его на сцену, не трогая выделение и undo."""
+        item = self._create_stage_item(stage_data)
+        self._add_stage_item(item)
+        return item
+
+    def materialize_stages(self, stages, connections=()):
+        """Создаёт много блоков и связей одним пакетом (загрузка, подкачка, отмена удаления).
+
+        Блоки не выделяются, поэтому selectionChanged не срабатывает; связи -
+        пары (id начала, id конца) - создаются после всех блоков. Рамка сцены
+        расширяется и project_changed отправляется один раз. Возвращает
+        блоки в порядке stages.
+        """
+        with self.batch_update():
+            items = [self._create_stage_item(stage_data) for stage_data in stages]
+            bounds = QRectF()
+            for item in items:
+                self._add_stage_item(item)
+                bounds = bounds.united(item.sceneBoundingRect())
+            for start_id, end_id in connections:
+                start_item, end_item = self._stages_by_id.get(start_id), self._stages_by_id.get(end_id)
+                if start_item is not None and end_item is not None:
+                    self.add_connection(start_item, end_item, save_state=False)
+            if items:
+                self._expand_scene_to(bounds)
+        return items
+
+    def _create_stage_item(self, stage_data):
         item_type = stage_data.get('type', 'text')
         if item_type == 'image':
-            item = ImageStageGraphicsItem(stage_data)
+            item = ImageStageGraphicsItem(stage_data, image_store=self.image_store)
         elif item_type == 'txt':
             item = TxtStageGraphicsItem(stage_data)
         else:
@@ -1392,24 +1946,41 @@ class RoadMapWidget(QGraphicsView):
         pos_data = stage_data.get('position')
         pos = QPointF(pos_data.get('x', 0), pos_data.get('y', 0)) if isinstance(pos_data, dict) else pos_data
         item.setPos(pos)
-        self.scene.addItem(item)
-        self.scene.clearSelection()
-        item.setSelected(True)
         return item
+
+    def _add_stage_item(self, item):
+        item._stack_order = next(self._stack_counter)
+        self.scene.addItem(item)
+        self.graph.add_node(item)
+        self._stages_by_id[item.stage_data['id']] = item
+        self.mark_stage_dirty(item)
         
     def delete_stage(self, item, save_state=True):
         if save_state: self.save_undo_state()
         if self.focused_on_sources: self.reset_focus()
-        connections_to_remove = list(item.connections)
-        for conn in connections_to_remove:
-            if conn.scene():
-                if conn in conn.start_item.connections: conn.start_item.connections.remove(conn)
-                if conn in conn.end_item.connections: conn.end_item.connections.remove(conn)
-                self.scene.removeItem(conn)
+        for conn in self.graph.remove_node(item):
+            # Список связей удаляемого блока очищается целиком, а не по одной связи
+            other = conn.end_item if conn.start_item is item else conn.start_item
+            if conn in other.connections: other.connections.remove(conn)
+            self._detach_connection(conn)
+            if self.store is None:
+                self.undo_engine.connection_changed(conn.start_item.stage_data['id'], conn.end_item.stage_data['id'], False)
+            if self.journal is not None:
+                self.journal.connection_removed(conn.start_item.stage_data['id'], conn.end_item.stage_data['id'])
+        item.connections.clear()
         for timeline in list(self.timelines):
             if hasattr(timeline, 'associated_items') and item in timeline.associated_items:
                 timeline.on_block_deleted(item)
+        self._unindex_stage(item)
+        if self._stages_by_id.get(item.stage_data['id']) is item:
+            del self._stages_by_id[item.stage_data['id']]
+            if self.store is None:
+                self.undo_engine.stage_removed(item.stage_data['id'])
         if item.scene(): self.scene.removeItem(item)
+        if self.journal is not None:
+            self._journal_dirty.discard(item)
+            self.journal.stage_deleted(item.stage_data['id'])
+        self._notify_changed()
 
     def edit_stage(self, stage_item):
         self.save_undo_state()
@@ -1418,7 +1989,7 @@ class RoadMapWidget(QGraphicsView):
         stage_type = data.get('type', '')
         if stage_type == 'txt':
             # Собираем все существующие названия txt-файлов (кроме текущего)
-            all_titles = [item.stage_data.get('title', '') for item in self.scene.items() if hasattr(item, 'stage_data') and item.stage_data.get('type') == 'txt' and item is not stage_item]
+            all_titles = [item.stage_data.get('title', '') for item in self.stage_items() if item.stage_data.get('type') == 'txt' and item is not stage_item]
             initial_title = data.get('title', '')
             if initial_title == 'Новый txt-файл':
                 initial_title = ''
@@ -1490,13 +2061,22 @@ class RoadMapWidget(QGraphicsView):
         else: # Zoom Out
             if current_zoom < 0.05: # Предел минимального отдаления
                 return
-            items_rect = self.scene.itemsBoundingRect()
-            padding = 2000
-            padded_rect = items_rect.adjusted(-padding, -padding, padding, padding)
-            new_scene_rect = self.sceneRect().united(padded_rect)
-            if new_scene_rect != self.sceneRect():
-                self.setSceneRect(new_scene_rect)
+            items_rect = self.content_rect()
+            if not items_rect.isNull():
+                padded_rect = items_rect.adjusted(-ZOOM_OUT_PADDING, -ZOOM_OUT_PADDING, ZOOM_OUT_PADDING, ZOOM_OUT_PADDING)
+                new_scene_rect = self.sceneRect().united(padded_rect)
+                if new_scene_rect != self.sceneRect():
+                    self.setSceneRect(new_scene_rect)
             self.scale(zoom_out_factor, zoom_out_factor)
+        self.viewport_changed.emit()
+
+    def scrollContentsBy(self, dx, dy):
+        super().scrollContentsBy(dx, dy)
+        self.viewport_changed.emit()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.viewport_changed.emit()
         
     def keyPressEvent(self, event):
         if event.modifiers() & Qt.ShiftModifier and event.key() == Qt.Key_G:
@@ -1525,15 +2105,9 @@ class RoadMapWidget(QGraphicsView):
             self.setCursor(Qt.CrossCursor)
         elif event.key() == Qt.Key_Z and (event.modifiers() & Qt.ControlModifier):
             if event.modifiers() & Qt.ShiftModifier:
-                if self.redo_stack:
-                    state = self.redo_stack.pop()
-                    self.undo_stack.append(self.get_project_data())
-                    self.load_project(state)
+                self.redo()
             else:
-                if self.undo_stack:
-                    state = self.undo_stack.pop()
-                    self.redo_stack.append(self.get_project_data())
-                    self.load_project(state)
+                self.undo()
             return
         elif event.key() == Qt.Key_Delete:
             self.delete_selected()
@@ -1595,25 +2169,40 @@ class RoadMapWidget(QGraphicsView):
         
     def clear(self): 
         self.reset_focus()
+        self._journal_dirty.clear()
+        if self.connection_layer is not None:
+            # Слой переживает очистку сцены: снимаем его, чтобы scene.clear() его не удалил
+            self.scene.removeItem(self.connection_layer)
+            self.connection_layer.clear()
         self.scene.clear()
+        self._pulsing_selection = set()
+        self.stage_index.clear()
+        self.content_bounds.clear()
+        self.graph.clear()
+        self._stages_by_id.clear()
+        self.undo_engine.clear()   # История относится к прежнему набору блоков
+        if self.connection_layer is not None:
+            self.scene.addItem(self.connection_layer)
         self.timelines.clear()
         
     def get_project_data(self):
+        if self.store is not None:
+            # На сцене только часть блоков - полный проект собирается из базы
+            self.flush_journal()
+            return self.store.load_project_data()
         stages = []
         connections = []
-        for item in self.scene.items():
-            if isinstance(item, StageGraphicsItem):
-                stage_data = item.get_stage_data()
-                pos = stage_data.get('position', {})
-                if isinstance(pos, dict):
-                    pos['x'] = round(pos.get('x', 0), 2)
-                    pos['y'] = round(pos.get('y', 0), 2)
-                stages.append(stage_data)
+        for item in self.stage_items():
+            stage_data = item.get_stage_data()
+            pos = stage_data.get('position', {})
+            if isinstance(pos, dict):
+                pos['x'] = round(pos.get('x', 0), 2)
+                pos['y'] = round(pos.get('y', 0), 2)
+            stages.append(stage_data)
         stages.sort(key=lambda x: x.get('id', ''))
-        for item in self.scene.items():
-            if isinstance(item, ConnectionGraphicsItem):
-                conn_data = {'from': item.start_item.stage_data['id'], 'to': item.end_item.stage_data['id']}
-                connections.append(conn_data)
+        for conn in self.connection_items():
+            conn_data = {'from': conn.start_item.stage_data['id'], 'to': conn.end_item.stage_data['id']}
+            connections.append(conn_data)
         connections.sort(key=lambda x: (x['from'], x['to']))
         scene_rect = self.sceneRect()
         return {
@@ -1626,23 +2215,273 @@ class RoadMapWidget(QGraphicsView):
             'color_history': [color.name() for color in self.color_history]
         }
 
-    def states_are_equal(self, state1, state2):
-        if not state1 or not state2: return False
-        if len(state1.get('stages', [])) != len(state2.get('stages', [])): return False
-        if len(state1.get('connections', [])) != len(state2.get('connections', [])): return False
-        if state1.get('stages', []) != state2.get('stages', []): return False
-        if state1.get('connections', []) != state2.get('connections', []): return False
-        return True
-
+    # --- Отмена и повтор ---
     def save_undo_state(self):
-        current_state = self.get_project_data()
-        if not self.undo_stack or not self.states_are_equal(current_state, self.undo_stack[-1]):
-            self.undo_stack.append(current_state)
-            if len(self.undo_stack) > 20:
-                self.undo_stack.pop(0)
-            self.redo_stack.clear()
+        """Контрольная точка: правки с прошлой точки становятся одним шагом отмены."""
+        if self.store is not None:
+            # В базе блоки подгружаются и выгружаются по видимой области; правки и так сразу записаны
+            return
+        self.undo_engine.checkpoint(self._stage_state_by_id)
+
+    def undo(self):
+        if self.store is None:
+            self.undo_engine.undo(self._stage_state_by_id, self._apply_undo_delta)
+
+    def redo(self):
+        if self.store is None:
+            self.undo_engine.redo(self._stage_state_by_id, self._apply_undo_delta)
+
+    @staticmethod
+    def _stage_state(item):
+        # Снимок для отмены: копия данных в том виде, в каком они сохраняются в проект, и теги
+        data = dict(item.get_stage_data())
+        data['position'] = dict(data['position'])
+        return data, tuple(item.tags)
+
+    def _stage_state_by_id(self, stage_id):
+        item = self._stages_by_id.get(stage_id)
+        return self._stage_state(item) if item is not None else None
+
+    def _apply_stage_state(self, item, state):
+        data, tags = state
+        old_color = item.stage_data.get('border_color')
+        item.stage_data.clear()
+        item.stage_data.update(data)
+        item.stage_data['position'] = dict(data['position'])
+        item.tags = list(tags)
+        item.setPos(QPointF(data['position']['x'], data['position']['y']))
+        if data.get('border_color') != old_color:
+            item.update_color(data.get('border_color', '#BDBDBD'))
+            if 'border_color' not in data:
+                item.stage_data.pop('border_color', None)   # Цвет по умолчанию, как до правки
+        if isinstance(item, ImageStageGraphicsItem) and item.pixmap.width() != data.get('image_width'):
+            # Ширину изображения get_stage_data берёт из pixmap, поэтому масштаб пересобирается
+            item.pixmap = item.image_store.pixmap(item.image_hash, data.get('image_width'))
+        item.recalculate_size()
+
+    def _apply_undo_delta(self, states, connections):
+        """Приводит блоки и связи к состояниям шага отмены, не пересобирая сцену."""
+        if self.focused_on_sources: self.reset_focus()
+        with self.batch_update():
+            removed, created = [], []
+            for stage_id, state in states.items():
+                item = self._stages_by_id.get(stage_id)
+                if state is None:
+                    if item is not None: removed.append(item)
+                elif item is None:
+                    created.append(state)
+                else:
+                    self._apply_stage_state(item, state)
+            items = self.materialize_stages([{**state[0], 'position': dict(state[0]['position'])} for state in created])
+            for item, state in zip(items, created):
+                item.tags = list(state[1])
+            for (start_id, end_id), present in connections.items():
+                start_item, end_item = self._stages_by_id.get(start_id), self._stages_by_id.get(end_id)
+                if start_item is None or end_item is None:
+                    continue
+                connection = self.graph.edge(start_item, end_item)
+                if present and connection is None:
+                    self.add_connection(start_item, end_item, save_state=False)
+                elif not present and connection is not None:
+                    self.delete_connection(connection, save_state=False)
+            for item in removed:
+                self.delete_stage(item, save_state=False)
+
+    # --- Журнал изменений ---
+
+    def attach_journal(self, journal):
+        self.detach_journal()
+        self.journal = journal
+
+    def attach_store(self, store):
+        """Переключает вид на базу .rmdb: блоки подгружаются по видимой области, правки пишутся сразу."""
+        self.detach_journal()
+        self.journal = self.store = store
+        self.undo_engine.clear()
+        # Изображения удалённых блоков чистятся при открытии, пока на них никто не ссылается
+        store.remove_unused_images()
+        self.image_store.register_archive(store)
+        bounds = store.bounds()
+        if bounds:
+            self.setSceneRect(self.sceneRect().united(QRectF(bounds[0], bounds[1], bounds[2] - bounds[0], bounds[3] - bounds[1])
+                                                      .adjusted(-SCENE_MARGIN, -SCENE_MARGIN, SCENE_MARGIN, SCENE_MARGIN)))
+        self.pager = ScenePager(self, store, self)
+        self.pager.update_region()
+
+    def detach_journal(self):
+        if self.pager is not None:
+            # Всё, что ещё не записано в базу, пишется перед закрытием
+            self.pager.stop()
+            self.pager.deleteLater()
+            self.pager = None
+            self.store = None
+        if self.journal is not None:
+            self.journal.close()
+        self.journal = None
+        self._journal_dirty.clear()
+
+    @contextmanager
+    def unrecorded(self):
+        """Изменения сцены внутри блока не записываются в журнал/базу и не вызывают project_changed."""
+        journal, self.journal = self.journal, None
+        signals_blocked = self.blockSignals(True)
+        try:
+            yield
+        finally:
+            self.journal = journal
+            self.blockSignals(signals_blocked)
+
+    # --- Пространственный индекс блоков ---
+    def stage_items(self):
+        return list(self.stage_index)
+
+    def stages_in(self, rect):
+        """Блоки, рамки которых пересекают прямоугольник сцены."""
+        return self.stage_index.query(rect.left(), rect.top(), rect.right(), rect.bottom())
+
+    def stage_at(self, pos):
+        """Верхний видимый блок под точкой сцены (как itemAt, но без связей и подсветок поверх)."""
+        hits = [item for item in self.stage_index.at(pos.x(), pos.y())
+                if item.isVisible() and item.contains(item.mapFromScene(pos))]
+        # При равном Z сцена кладёт сверху блок, добавленный позже
+        return max(hits, key=lambda item: (item.zValue(), item._stack_order), default=None)
+
+    def nearest_stages(self, pos, k=1, max_distance=None, exclude=()):
+        """До k блоков, ближайших к точке сцены: список (расстояние до рамки, блок)."""
+        accept = (lambda item: item not in exclude) if exclude else None
+        return self.stage_index.nearest(pos.x(), pos.y(), k, max_distance, accept)
+
+    def content_rect(self):
+        """Общая рамка блоков на сцене (пустой QRectF, если блоков нет)."""
+        bounds = self.content_bounds.bounds()
+        if bounds is None:
+            return QRectF()
+        return QRectF(bounds[0], bounds[1], bounds[2] - bounds[0], bounds[3] - bounds[1])
+
+    def _index_stage(self, item):
+        rect = item.sceneBoundingRect()
+        rect = (rect.left(), rect.top(), rect.right(), rect.bottom())
+        self.stage_index.update(item, rect)
+        self.content_bounds.update(item, rect)
+
+    def _unindex_stage(self, item):
+        self.stage_index.remove(item)
+        self.content_bounds.remove(item)
+
+    def can_unload(self, item):
+        """Можно ли снять блок со сцены при подкачке (с ним сейчас ничего не делают)."""
+        if item.isSelected() or item in self._search_glows or item in self.preview_items:
+            return False
+        return not any(item in getattr(timeline, 'associated_items', ()) for timeline in self.timelines)
+
+    def unload_stages(self, items):
+        """Снимает блоки и их связи со сцены, не записывая удаление (они остаются в базе)."""
+        for item in items:
+            for conn in self.graph.remove_node(item):
+                other = conn.end_item if conn.start_item is item else conn.start_item
+                if conn in other.connections: other.connections.remove(conn)
+                self._detach_connection(conn)
+            item.connections.clear()
+            self._journal_dirty.discard(item)
+            self._unindex_stage(item)
+            if self._stages_by_id.get(item.stage_data['id']) is item:
+                del self._stages_by_id[item.stage_data['id']]
+            if item.scene(): self.scene.removeItem(item)
+
+    def mark_stage_dirty(self, item):
+        # Вызывается при добавлении, сдвиге и изменении размера блока - заодно обновляем индекс
+        if item.scene() is self.scene:
+            self._index_stage(item)
+            if self.store is None:
+                self.undo_engine.stage_changed(item.stage_data['id'], lambda: self._stage_state(item))
+        if self.journal is not None:
+            self._journal_dirty.add(item)
+        self._notify_changed()
+
+    def _notify_changed(self):
+        # Внутри пакета project_changed отправляется один раз при завершении
+        if self._batch_depth:
+            self._batch_changed = True
+        else:
+            self.project_changed.emit()
+
+    # --- Пакетные изменения ---
+    @contextmanager
+    def batch_update(self):
+        """Групповое перемещение, перекраска или удаление блоков.
+
+        Внутри пакета сдвинутые блоки только запоминаются: связи, направляющие,
+        границы сцены, реакция на смену выделения и project_changed
+        обрабатываются один раз при выходе из внешнего batch_update().
+        block_moved внутри пакета не отправляется - направляющие с
+        затронутыми блоками пересчитываются сразу целиком.
+        """
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._commit_batch()
+
+    def in_batch(self):
+        return self._batch_depth > 0
+
+    def defer_stage_moved(self, item):
+        self._batch_moved.add(item)
+        self.mark_stage_dirty(item)
+
+    def defer_connection_repaint(self, connections):
+        self._batch_repaint.update(connections)
+
+    def _commit_batch(self):
+        moved, self._batch_moved = self._batch_moved, set()
+        repaint, self._batch_repaint = self._batch_repaint, set()
+        selection_changed, self._batch_selection_changed = self._batch_selection_changed, False
+        changed, self._batch_changed = self._batch_changed, False
+        moved = {item for item in moved if item.scene() is self.scene}
+        if moved:
+            bounds = QRectF()
+            paths = set()
+            keys = {}
+            for item in moved:
+                bounds = bounds.united(item.sceneBoundingRect())
+                paths.update(item.connections)
+                keys[item] = item.anchor_key()
+            # Пути пересчитываются сразу: положение каждого блока берётся один раз на пакет
+            for conn in paths:
+                if conn.is_attached():
+                    conn._rebuild_geometry((keys.get(conn.start_item) or conn.start_item.anchor_key(),
+                                            keys.get(conn.end_item) or conn.end_item.anchor_key()))
+            repaint -= paths   # Пересчёт пути сам перерисует связь
+            self._expand_scene_to(bounds)
+            for timeline in list(self.timelines):
+                if not moved.isdisjoint(getattr(timeline, 'associated_items', ())):
+                    timeline.update_line()
+        for conn in repaint:
+            if conn.is_attached():
+                conn.update()
+        if selection_changed:
+            self.handle_selection_changed()
+        if changed:
+            self.project_changed.emit()
+
+    def flush_journal(self):
+        """Переносит изменённые этапы в очередь записей журнала (без записи на диск)."""
+        if self.journal is None:
+            return
+        for item in self._journal_dirty:
+            if item.scene() is self.scene:
+                self.journal.stage_changed(item.get_stage_data())
+        self._journal_dirty.clear()
+        scene_rect = self.sceneRect()
+        self.journal.meta_changed({
+            'scene_rect': {'x': scene_rect.x(), 'y': scene_rect.y(), 'width': scene_rect.width(), 'height': scene_rect.height()},
+            'color_history': [color.name() for color in self.color_history]
+        })
 
-    def load_project(self, project_data):
+    def begin_load(self, project_data):
+        """Очищает сцену и применяет общие настройки проекта перед созданием этапов."""
         self.clear()
         scene_rect_data = project_data.get('scene_rect')
         if scene_rect_data:
@@ -1655,34 +2494,27 @@ class RoadMapWidget(QGraphicsView):
             self.color_history = [QColor(name) for name in color_history_data]
         else:
             self.color_history = []
-        items_by_id = {}
+
+    def load_project(self, project_data):
+        self.begin_load(project_data)
         stages = sorted(project_data.get('stages', []), key=lambda x: x.get('id', ''))
-        for stage_d in stages:
-            item = self.add_stage(stage_d, save_state=False)
-            items_by_id[item.stage_data['id']] = item
-            if 'border_color' in stage_d: item.update_color(stage_d['border_color'])
         connections = sorted(project_data.get('connections', []), key=lambda x: (x.get('from', ''), x.get('to', '')))
-        for conn_d in connections:
-            start_item = items_by_id.get(conn_d.get('from'))
-            end_item = items_by_id.get(conn_d.get('to'))
-            if start_item and end_item and start_item.scene() and end_item.scene():
-                self.add_connection(start_item, end_item, save_state=False)
-
-    def export_to_image(self, file_path, format='PNG'):
-        if not self.scene.items(): return
+        # Цвет рамки блок берёт из stage_data сам, отдельный update_color не нужен
+        items = self.materialize_stages(stages, [(conn_d.get('from'), conn_d.get('to')) for conn_d in connections])
+        self.image_store.prune((item.image_hash, item.pixmap.width()) for item in items
+                               if isinstance(item, ImageStageGraphicsItem))
+
+    def export_to_image(self, file_path, scale=DEFAULT_SCALE, dpi=DEFAULT_DPI):
+        """Запускает фоновый экспорт всех блоков в PNG и возвращает TiledImageExporter (None для пустой сцены)."""
+        if not any(item is not self.connection_layer for item in self.scene.items()): return None
         self.scene.clearSelection()
+        connection_geometry_queue().flush()
         rect = self.scene.itemsBoundingRect()
         padding = 20
         rect.adjust(-padding, -padding, padding, padding)
-        scale_factor = 1.5
-        image_size = (rect.size() * scale_factor).toSize()
-        image = QImage(image_size, QImage.Format_ARGB32)
-        image.fill(Qt.white)
-        painter = QPainter(image)
-        painter.setRenderHint(QPainter.Antialiasing)
-        self.scene.render(painter, QRectF(image.rect()), rect)
-        painter.end()
-        image.save(file_path, format)
+        exporter = TiledImageExporter(self.scene, rect, file_path, scale, dpi, parent=self)
+        exporter.start()
+        return exporter
 
     def add_stage_at_pos(self, pos):
         stage_data = {'type': 'text', 'title': 'Новый этап', 'position': self.mapToScene(pos)}
@@ -1691,7 +2523,9 @@ class RoadMapWidget(QGraphicsView):
     def add_image_stage_at_pos(self, pos):
         file_path, _ = QFileDialog.getOpenFileName(self, 'Выбрать изображение', '', 'Изображения (*.png *.jpg *.jpeg *.webp *.gif)')
         if file_path:
-            stage_data = {'type': 'image', 'title': '', 'description': '', 'image_path': file_path, 'position': self.mapToScene(pos)}
+            image_hash = self.image_store.add_file(file_path)
+            stage_data = {'type': 'image', 'title': '', 'description': '', 'image_hash': image_hash,
+                          'image_format': self.image_store.image_format(image_hash), 'position': self.mapToScene(pos)}
             self.add_stage(stage_data)
 
     def add_txt_stage_at_pos(self, pos):
@@ -1701,8 +2535,9 @@ class RoadMapWidget(QGraphicsView):
     def delete_selected(self):
         self.save_undo_state()
         selected = [item for item in self.scene.selectedItems() if isinstance(item, StageGraphicsItem)]
-        for item in selected:
-            self.delete_stage(item, save_state=False)
+        with self.batch_update():
+            for item in selected:
+                self.delete_stage(item, save_state=False)
 
     def show_timeline(self):
         selected = self.get_selected_items()
@@ -1712,7 +2547,7 @@ class RoadMapWidget(QGraphicsView):
             self.timelines.append(timeline)
 
     def get_selected_items(self):
-        return [item for item in self.scene.items() if isinstance(item, StageGraphicsItem) and item.isSelected()]
+        return [item for item in self.scene.selectedItems() if isinstance(item, StageGraphicsItem)]
 
     def remove_timeline(self, timeline_to_remove):
         if timeline_to_remove in self.timelines: self.timelines.remove(timeline_to_remove)
@@ -1733,18 +2568,18 @@ class RoadMapWidget(QGraphicsView):
 
     def toggle_grid(self):
         self.show_grid = not self.show_grid
-        if self.show_grid:
-            if self.grid_item:
-                self.scene.removeItem(self.grid_item)
-            self.grid_item = GridGraphicsItem(self.scene.sceneRect())
-            self.scene.addItem(self.grid_item)
-        else:
-            if self.grid_item:
-                self.scene.removeItem(self.grid_item)
-                self.grid_item = None
-        self.scene.update()
+        # Фон с сеткой кэшируется видом: при прокрутке дорисовываются только новые полосы
+        self.setCacheMode(QGraphicsView.CacheBackground if self.show_grid else QGraphicsView.CacheNone)
+        self.resetCachedContent()
         self.viewport().update()
 
+    def drawBackground(self, painter, rect):
+        super().drawBackground(painter, rect)
+        if self.show_grid:
+            # В кэше фона открывшаяся полоса хранит старые пиксели - её нужно залить заново
+            painter.fillRect(rect, self.viewport().palette().brush(self.viewport().backgroundRole()))
+            self.grid.paint(painter, rect)
+
     def search_by_tag(self, query):
         old_glows = self._search_glows.copy()
         self._search_glows = {}
@@ -1755,33 +2590,17 @@ class RoadMapWidget(QGraphicsView):
             return
         # Только полные совпадения тегов
         fragments = [frag.strip().lower() for frag in re.split(r'[ ,]+', query) if frag.strip()]
-        for item in self.scene.items():
-            if isinstance(item, StageGraphicsItem):
-                tags = [t.lower() for t in getattr(item, 'tags', [])]
-                has_match = any(frag == tag for frag in fragments for tag in tags)
-                if has_match:
-                    if item in old_glows:
-                        glow = old_glows.pop(item)
-                        self._search_glows[item] = glow
-                    else:
-                        glow = SearchGlowGraphicsItem(item)
-                        self.scene.addItem(glow)
-                        self._search_glows[item] = glow
+        for item in self.stage_items():
+            tags = [t.lower() for t in getattr(item, 'tags', [])]
+            has_match = any(frag == tag for frag in fragments for tag in tags)
+            if has_match:
+                if item in old_glows:
+                    glow = old_glows.pop(item)
+                    self._search_glows[item] = glow
+                else:
+                    glow = SearchGlowGraphicsItem(item)
+                    self.scene.addItem(glow)
+                    self._search_glows[item] = glow
         for glow in old_glows.values():
             if glow.scene():
                 self.scene.removeItem(glow)
-
-def parse_discord_to_html(text):
-    import re
-    # Сначала моноширинный, потом зачёркнутый, потом жирный+курсив, потом жирный, потом курсив
-    text = re.sub(r'`([^`]+)`', r'<span style="font-family:Consolas; background:#f4f4f4;">\1</span>', text)
-    text = re.sub(r'~~([^~]+)~~', r'<s>\1</s>', text)
-    text = re.sub(r'\*\*\*([^*]+)\*\*\*', r'<b><i>\1</i></b>', text)
-    text = re.sub(r'\*\*([^*]+)\*\*', r'<b>\1</b>', text)
-    text = re.sub(r'\*([^*]+)\*', r'<i>\1</i>', text)
-    text = re.sub(r'_([^_]+)_', r'<i>\1</i>', text)
-    # --- Фикс начальных пробелов ---
-    def replace_leading_spaces(line):
-        return re.sub(r'^ +', lambda m: '&nbsp;' * len(m.group(0)), line)
-    text = '\n'.join(replace_leading_spaces(line) for line in text.split('\n'))
-    return text.replace('\n', '<br>')
\ No newline at end of file
@@ -167,7 +167,7 @@ class GlassSearchBar(QWidget):
             self._reposition_search_bar()
             return
         tags = set()
-        for item in parent.roadmap_widget.scene.items():
+        for item in parent.roadmap_widget.stage_items():
             if hasattr(item, 'tags') and item.tags:
                 tags.update(item.tags)
         tags = sorted(tags, key=lambda x: x.lower())
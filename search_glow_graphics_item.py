@@ -1,7 +1,8 @@
 from PyQt5.QtWidgets import QGraphicsObject
-from PyQt5.QtCore import QRectF, QPropertyAnimation, QEasingCurve, pyqtProperty
+from PyQt5.QtCore import QRectF, QEasingCurve
 from PyQt5.QtGui import QPainter, QColor, QBrush, QLinearGradient, QRadialGradient
 from PyQt5.QtCore import Qt
+from animation_clock import AnimationTrack, shared_animation_clock
 class SearchGlowGraphicsItem(QGraphicsObject):
     GLOW_MARGIN = 5
     def __init__(self, target_block, parent=None):
@@ -9,7 +10,6 @@ class SearchGlowGraphicsItem(QGraphicsObject):
         self.target_block = target_block
         self.setZValue(target_block.zValue() - 1)
         self.opacity_val = 0.0
-        self._pulse_anim = None
         self.setAcceptedMouseButtons(Qt.NoButton)
         self.setFlag(QGraphicsObject.ItemIgnoresTransformations, False)
         self.update_geometry()
@@ -21,26 +21,14 @@ class SearchGlowGraphicsItem(QGraphicsObject):
         self.setPos(self.target_block.pos())
         self._rect = rect.adjusted(-self.GLOW_MARGIN, -self.GLOW_MARGIN, self.GLOW_MARGIN, self.GLOW_MARGIN)
         self._radius = getattr(self.target_block, 'border_radius', 10) + self.GLOW_MARGIN
-    @pyqtProperty(float)
-    def glowOpacity(self):
-        return self.opacity_val
-    @glowOpacity.setter
-    def glowOpacity(self, value):
+    def _set_glow_opacity(self, value):
         self.opacity_val = value
-        self.update()
+        return (self,)
     def start_pulse(self):
-        if self._pulse_anim:
-            self._pulse_anim.stop()
-        self._pulse_anim = QPropertyAnimation(self, b'glowOpacity')
-        self._pulse_anim.setDuration(1200)
-        self._pulse_anim.setStartValue(0.7)
-        self._pulse_anim.setEndValue(0.2)
-        self._pulse_anim.setEasingCurve(QEasingCurve.InOutSine)
-        self._pulse_anim.setLoopCount(-1)
-        self._pulse_anim.start()
+        # Пульсация идёт через общие часы анимаций сцены
+        shared_animation_clock().start(self, 'pulse', AnimationTrack(self._set_glow_opacity, 0.7, 0.2, 1200, QEasingCurve.InOutSine, loop='repeat'))
     def stop_pulse(self):
-        if self._pulse_anim:
-            self._pulse_anim.stop()
+        shared_animation_clock().stop(self, 'pulse')
         self.opacity_val = 0.0
         self.update()
     def boundingRect(self):
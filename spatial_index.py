@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Пространственный индекс прямоугольников (рыхлое квадродерево).
+
+Вид хранит в нём рамки блоков этапов и обновляет их по мере перемещения,
+изменения размера, добавления и удаления. Запросы по области, ближайшему
+и k ближайшим блокам обходят только узлы рядом с запросом, а не все
+элементы сцены, как scene.items().
+
+Дерево "рыхлое": граница узла для поиска вдвое больше его квадрата, а
+прямоугольник опускается в потомка по своему центру, если не больше
+стороны потомка. Поэтому место прямоугольника зависит только от его
+центра и размера, и блок на границе квадрантов не застревает в корне.
+Корень растёт в сторону прямоугольника, который в него не помещается.
+
+BoundsTracker хранит общие границы тех же прямоугольников: по куче на
+каждую сторону с ленивым удалением устаревших записей, так что границы
+после сдвига или удаления крайнего блока находятся без обхода всех
+блоков. Модуль не зависит от Qt: прямоугольник - кортеж (x1, y1, x2, y2).
+"""
+
+import heapq
+import itertools
+
+MAX_NODE_ITEMS = 16     # Сколько прямоугольников лежит в листе до его деления
+MIN_NODE_SIZE = 64.0    # Меньше этого узлы не делятся
+ROOT_SIZE = 16384.0
+
+
+def rect_distance(x, y, rect):
+    """Расстояние от точки до прямоугольника (0, если точка внутри)."""
+    x1, y1, x2, y2 = rect
+    dx = x1 - x if x < x1 else (x - x2 if x > x2 else 0.0)
+    dy = y1 - y if y < y1 else (y - y2 if y > y2 else 0.0)
+    return (dx * dx + dy * dy) ** 0.5
+
+
+class _Node:
+    __slots__ = ('x', 'y', 'size', 'items', 'children', 'parent', 'count')
+
+    def __init__(self, x, y, size, parent=None):
+        self.x, self.y, self.size = x, y, size
+        self.items = {}          # ключ -> прямоугольник
+        self.children = None     # [лево-верх, право-верх, лево-низ, право-низ]
+        self.parent = parent
+        self.count = 0           # Прямоугольников в поддереве
+
+    def loose_rect(self):
+        half = self.size / 2
+        return (self.x - half, self.y - half, self.x + self.size + half, self.y + self.size + half)
+
+
+class QuadTree:
+    """Рыхлое квадродерево: ключ (любой хешируемый объект) -> прямоугольник."""
+
+    def __init__(self, x=-ROOT_SIZE / 2, y=-ROOT_SIZE / 2, size=ROOT_SIZE):
+        self._root = _Node(x, y, size)
+        self._where = {}   # ключ -> узел
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def __iter__(self):
+        return iter(list(self._where))
+
+    def rect_of(self, key):
+        node = self._where.get(key)
+        return node.items[key] if node is not None else None
+
+    def clear(self):
+        self._root = _Node(self._root.x, self._root.y, self._root.size)
+        self._where.clear()
+
+    # --- Изменение ---
+    def insert(self, key, rect):
+        if key in self._where:
+            self.remove(key)
+        while not self._fits(self._root, rect):
+            self._grow(rect)
+        node = self._root
+        while True:
+            if node.children is None:
+                if len(node.items) < MAX_NODE_ITEMS or node.size / 2 < MIN_NODE_SIZE:
+                    break
+                self._split(node)
+            child = self._child_for(node, rect)
+            if child is None:
+                break
+            node = child
+        self._add(node, key, rect)
+
+    def update(self, key, rect):
+        """Новый прямоугольник ключа; если он остаётся в том же узле, дерево не перестраивается."""
+        node = self._where.get(key)
+        if node is None:
+            self.insert(key, rect)
+            return
+        if node.items[key] == rect:
+            return
+        if self._fits(node, rect) and (node.children is None or self._child_for(node, rect) is None):
+            node.items[key] = rect
+            return
+        self.remove(key)
+        self.insert(key, rect)
+
+    def remove(self, key):
+        node = self._where.pop(key, None)
+        if node is None:
+            return
+        del node.items[key]
+        while node is not None:
+            node.count -= 1
+            if node.children is not None and node.count == len(node.items):
+                node.children = None   # Поддерево опустело
+            node = node.parent
+
+    def _add(self, node, key, rect):
+        node.items[key] = rect
+        self._where[key] = node
+        while node is not None:
+            node.count += 1
+            node = node.parent
+
+    @staticmethod
+    def _fits(node, rect):
+        # Центр в квадрате узла и размер не больше стороны - тогда рамка в границе поиска узла
+        cx, cy = (rect[0] + rect[2]) / 2, (rect[1] + rect[3]) / 2
+        return (node.x <= cx < node.x + node.size and node.y <= cy < node.y + node.size
+                and rect[2] - rect[0] <= node.size and rect[3] - rect[1] <= node.size)
+
+    def _child_for(self, node, rect):
+        half = node.size / 2
+        if rect[2] - rect[0] > half or rect[3] - rect[1] > half:
+            return None
+        cx, cy = (rect[0] + rect[2]) / 2, (rect[1] + rect[3]) / 2
+        index = (1 if cx >= node.x + half else 0) + (2 if cy >= node.y + half else 0)
+        return node.children[index]
+
+    def _split(self, node):
+        half = node.size / 2
+        node.children = [_Node(node.x + dx * half, node.y + dy * half, half, node) for dy in (0, 1) for dx in (0, 1)]
+        for key, rect in list(node.items.items()):
+            child = self._child_for(node, rect)
+            if child is not None:
+                del node.items[key]
+                child.items[key] = rect
+                child.count += 1
+                self._where[key] = child
+
+    def _grow(self, rect):
+        # Новый корень вдвое больше; старый становится его четвертью со стороны, противоположной rect
+        old = self._root
+        cx, cy = (rect[0] + rect[2]) / 2, (rect[1] + rect[3]) / 2
+        x = old.x - old.size if cx < old.x else old.x
+        y = old.y - old.size if cy < old.y else old.y
+        root = _Node(x, y, old.size * 2)
+        root.count = old.count
+        if old.count:
+            root.children = [old if (child_x, child_y) == (old.x, old.y) else _Node(child_x, child_y, old.size, root)
+                             for child_y in (y, y + old.size) for child_x in (x, x + old.size)]
+            old.parent = root
+        self._root = root
+
+    # --- Запросы ---
+    def query(self, x1, y1, x2, y2):
+        """Ключи, прямоугольники которых пересекают область (границы включительно)."""
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if not node.count:
+                continue
+            lx1, ly1, lx2, ly2 = node.loose_rect()
+            if lx1 > x2 or lx2 < x1 or ly1 > y2 or ly2 < y1:
+                continue
+            for key, (rx1, ry1, rx2, ry2) in node.items.items():
+                if rx1 <= x2 and rx2 >= x1 and ry1 <= y2 and ry2 >= y1:
+                    found.append(key)
+            if node.children is not None:
+                stack.extend(node.children)
+        return found
+
+    def at(self, x, y):
+        """Ключи, прямоугольники которых содержат точку."""
+        return self.query(x, y, x, y)
+
+    def nearest(self, x, y, k=1, max_distance=None, accept=None):
+        """k ближайших к точке ключей: список (расстояние, ключ) по возрастанию.
+
+        Расстояние - до прямоугольника (0 для точки внутри). accept(key)
+        отбрасывает неподходящие ключи, не останавливая поиск.
+        """
+        limit = float('inf') if max_distance is None else max_distance
+        found = []
+        heap = [(0.0, next(self._counter), self._root, None)]
+        while heap and len(found) < k:
+            dist, _, node, key = heapq.heappop(heap)
+            if dist > limit:
+                break
+            if node is None:
+                found.append((dist, key))
+                continue
+            for item_key, rect in node.items.items():
+                if accept is None or accept(item_key):
+                    heapq.heappush(heap, (rect_distance(x, y, rect), next(self._counter), None, item_key))
+            if node.children is not None:
+                for child in node.children:
+                    if child.count:
+                        heapq.heappush(heap, (rect_distance(x, y, child.loose_rect()), next(self._counter), child, None))
+        return found
+
+
+class BoundsTracker:
+    """Общие границы набора прямоугольников с обновлением за O(log n)."""
+
+    def __init__(self):
+        self._rects = {}                 # ключ -> прямоугольник
+        self._heaps = ([], [], [], [])   # x1, y1, -x2, -y2: вершина каждой кучи - крайнее значение
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._rects)
+
+    def clear(self):
+        self._rects.clear()
+        self._heaps = ([], [], [], [])
+
+    def update(self, key, rect):
+        if self._rects.get(key) == rect:
+            return
+        self._rects[key] = rect
+        order = next(self._counter)
+        x1, y1, x2, y2 = rect
+        for heap, value in zip(self._heaps, (x1, y1, -x2, -y2)):
+            heapq.heappush(heap, (value, order, key))
+        if len(self._heaps[0]) > 4 * len(self._rects) + 64:
+            self._rebuild()
+
+    def remove(self, key):
+        # Записи в кучах остаются и отбрасываются при следующем запросе границ
+        self._rects.pop(key, None)
+
+    def bounds(self):
+        """(x1, y1, x2, y2) всех прямоугольников или None, если их нет."""
+        if not self._rects:
+            return None
+        extremes = []
+        for side, heap in enumerate(self._heaps):
+            while True:
+                value, _, key = heap[0]
+                rect = self._rects.get(key)
+                if rect is not None and (rect[side] if side < 2 else -rect[side]) == value:
+                    break
+                heapq.heappop(heap)   # Прямоугольник с тех пор сдвинут или удалён
+            extremes.append(value if side < 2 else -value)
+        return tuple(extremes)
+
+    def _rebuild(self):
+        counter = self._counter
+        self._heaps = tuple([(value(rect), next(counter), key) for key, rect in self._rects.items()]
+                            for value in (lambda r: r[0], lambda r: r[1], lambda r: -r[2], lambda r: -r[3]))
+        for heap in self._heaps:
+            heapq.heapify(heap)
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Хранилище проекта в базе SQLite (.rmdb) для очень больших карт.
+
+Таблицы:
+    meta(key, value)                  - JSON: format, version, project_info, scene_rect, color_history
+    stages(rid, id, image_hash, data) - этап целиком как JSON; rid - ключ в R-tree
+    stage_bounds                      - R-tree рамок этапов (min_x, max_x, min_y, max_y)
+    connections(start_id, end_id)
+    images(hash, format, data)        - сырые байты изображений, каждое хранится один раз
+
+В отличие от .rmap, база не переписывается при сохранении: правки пишутся
+в неё сразу (write-through) короткими транзакциями, а на сцене живут
+только блоки рядом с видимой областью - их подгружает и выгружает
+ScenePager по запросам к R-tree.
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from collections import defaultdict, deque
+from urllib.request import pathname2url
+from PyQt5.QtCore import QObject, QTimer
+from project_archive import replace_file, fsync_directory
+from project_loader import FRAME_BUDGET
+
+STORE_EXTENSION = '.rmdb'
+STORE_FORMAT = 'roadmap-sqlite'
+STORE_VERSION = 1
+DEFAULT_STAGE_SIZE = (220, 100)    # Размер этапа, у которого в данных нет width/height
+QUERY_CHUNK = 500                  # Сколько параметров в одном запросе (старые SQLite допускают не больше 999)
+
+PAGE_MARGIN = 0.5                  # Запас вокруг видимой области (в долях её размера) для подгрузки
+UNLOAD_MARGIN = 1.5                # Блоки дальше этого запаса снимаются со сцены
+MAX_PAGED_STAGES = 5000            # Больше блоков не создаём даже при сильном отдалении
+PAGE_DELAY_MS = 50                 # Пауза после прокрутки/масштабирования перед запросом к базе
+WRITE_DELAY_MS = 300               # Правки копятся столько миллисекунд и пишутся одной транзакцией
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS stages (rid INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, image_hash TEXT, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS stages_image ON stages(image_hash);
+CREATE VIRTUAL TABLE IF NOT EXISTS stage_bounds USING rtree(rid, min_x, max_x, min_y, max_y);
+CREATE TABLE IF NOT EXISTS connections (start_id TEXT NOT NULL, end_id TEXT NOT NULL, PRIMARY KEY (start_id, end_id)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS connections_end ON connections(end_id);
+CREATE TABLE IF NOT EXISTS images (hash TEXT PRIMARY KEY, format TEXT NOT NULL, data BLOB NOT NULL);
+"""
+
+_UPSERT_STAGE = ('INSERT INTO stages (id, image_hash, data) VALUES (?, ?, ?) '
+                 'ON CONFLICT(id) DO UPDATE SET image_hash = excluded.image_hash, data = excluded.data')
+_UPSERT_BOUNDS = 'INSERT OR REPLACE INTO stage_bounds SELECT rid, ?, ?, ?, ? FROM stages WHERE id = ?'
+
+
+def is_store_path(file_path):
+    return os.path.splitext(file_path)[1].lower() == STORE_EXTENSION
+
+
+def _chunks(values, size=QUERY_CHUNK):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _stage_record(stage):
+    """Этап для записи в базу: (id, image_hash, JSON, рамка)."""
+    stage = dict(stage)
+    pos = stage.get('position')
+    if not isinstance(pos, dict):
+        pos = {'x': pos.x(), 'y': pos.y()} if pos is not None else {'x': 0, 'y': 0}
+    stage['position'] = {'x': round(pos.get('x', 0), 2), 'y': round(pos.get('y', 0), 2)}
+    x, y = stage['position']['x'], stage['position']['y']
+    bounds = (x, x + stage.get('width', DEFAULT_STAGE_SIZE[0]), y, y + stage.get('height', DEFAULT_STAGE_SIZE[1]))
+    return stage['id'], stage.get('image_hash'), json.dumps(stage, ensure_ascii=False), bounds
+
+
+def _connect(file_path, read_only=False):
+    if read_only:
+        connection = sqlite3.connect(f'file:{pathname2url(os.path.abspath(file_path))}?mode=ro', uri=True)
+    else:
+        connection = sqlite3.connect(file_path)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=FULL')
+    return connection
+
+
+def _project_info(project_data):
+    return {
+        'name': project_data.get('name', 'Новый проект'),
+        'description': project_data.get('description', ''),
+        'created_date': project_data.get('created_date', ''),
+        'modified_date': project_data.get('modified_date') or datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def read_store_header(file_path):
+    """Сведения о проекте из базы (имя, даты, число этапов) без загрузки этапов."""
+    connection = _connect(file_path, read_only=True)
+    try:
+        meta = {key: json.loads(value) for key, value in connection.execute('SELECT key, value FROM meta')}
+        if meta.get('format') != STORE_FORMAT:
+            raise ValueError(f"Файл не является базой RoadMap: {file_path}")
+        header = dict(meta.get('project_info', {}))
+        header['stages_count'] = connection.execute('SELECT count(*) FROM stages').fetchone()[0]
+        return header
+    finally:
+        connection.close()
+
+
+class SqliteProjectStore:
+    """Открытая база проекта. Соединение привязано к потоку, в котором создано.
+
+    Правки принимаются через тот же интерфейс, что у ProjectJournal
+    (stage_changed, stage_deleted, connection_added, connection_removed,
+    meta_changed, commit), поэтому RoadMapWidget пишет в базу из тех же
+    мест, что и в журнал. Как и ProjectArchive, база закрывается в
+    close() и переоткрывается при следующем обращении.
+    """
+
+    write_through = True   # Правки сразу пишутся в сам файл проекта, отдельного сохранения нет
+
+    def __init__(self, file_path, image_store=None):
+        self.file_path = file_path
+        self.image_store = image_store
+        self.journal_images = {}   # Для ImageStore.register_archive: у базы нет журнала
+        self._connection = None
+        self._pending = []          # (sql, параметры) до следующего commit()
+        self._meta = {key: json.loads(value) for key, value in self._db().execute('SELECT key, value FROM meta')}
+        if self._meta.get('format') != STORE_FORMAT:
+            raise ValueError(f"Файл не является базой RoadMap: {file_path}")
+        self.manifest = {'images': {image_hash: {'format': image_format}
+                                    for image_hash, image_format in self._db().execute('SELECT hash, format FROM images')}}
+        self._image_hashes = set(self.manifest['images'])
+
+    @classmethod
+    def create(cls, file_path, project_data, image_store):
+        """Создаёт базу из данных проекта (формат RoadMapWidget.get_project_data()).
+
+        База собирается во временном файле рядом с целевым и подменяет его
+        целиком, как и архив .rmap.
+        """
+        directory = os.path.dirname(os.path.abspath(file_path))
+        fd, temp_path = tempfile.mkstemp(prefix='.roadmap-', suffix='.tmp', dir=directory)
+        os.close(fd)
+        try:
+            connection = sqlite3.connect(temp_path)
+            try:
+                connection.executescript(_SCHEMA)
+                with connection:
+                    meta = {'format': STORE_FORMAT, 'version': STORE_VERSION, 'project_info': _project_info(project_data),
+                            'scene_rect': project_data.get('scene_rect'), 'color_history': project_data.get('color_history', [])}
+                    connection.executemany('INSERT INTO meta (key, value) VALUES (?, ?)',
+                                           [(key, json.dumps(value, ensure_ascii=False)) for key, value in meta.items()])
+                    image_hashes = set()
+                    for stage in project_data.get('stages', []):
+                        stage_id, image_hash, data, bounds = _stage_record(stage)
+                        connection.execute(_UPSERT_STAGE, (stage_id, image_hash, data))
+                        connection.execute(_UPSERT_BOUNDS, bounds + (stage_id,))
+                        if image_hash and image_hash not in image_hashes and image_store.has(image_hash):
+                            image_hashes.add(image_hash)
+                            connection.execute('INSERT INTO images (hash, format, data) VALUES (?, ?, ?)',
+                                               (image_hash, image_store.image_format(image_hash), image_store.read_bytes(image_hash)))
+                    connection.executemany('INSERT OR IGNORE INTO connections (start_id, end_id) VALUES (?, ?)',
+                                           [(conn['from'], conn['to']) for conn in project_data.get('connections', [])])
+            finally:
+                connection.close()
+            # Старые -wal/-shm от прежней базы с тем же именем испортили бы новую
+            for suffix in ('-wal', '-shm'):
+                if os.path.exists(file_path + suffix):
+                    os.remove(file_path + suffix)
+            replace_file(temp_path, file_path)
+            fsync_directory(directory)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return cls(file_path, image_store)
+
+    def _db(self):
+        if self._connection is None:
+            self._connection = _connect(self.file_path)
+        return self._connection
+
+    # --- Чтение ---
+
+    def project_header(self):
+        """Общие настройки проекта для RoadMapWidget.begin_load()."""
+        header = dict(self._meta.get('project_info', {}))
+        header['scene_rect'] = self._meta.get('scene_rect')
+        header['color_history'] = self._meta.get('color_history', [])
+        return header
+
+    def bounds(self):
+        """(min_x, min_y, max_x, max_y) всех этапов или None для пустого проекта."""
+        row = self._db().execute('SELECT min(min_x), min(min_y), max(max_x), max(max_y) FROM stage_bounds').fetchone()
+        return None if row[0] is None else row
+
+    def query_region(self, left, top, right, bottom):
+        """Этапы, чьи рамки пересекают прямоугольник: список (id, центр x, центр y)."""
+        return self._db().execute(
+            'SELECT s.id, (b.min_x + b.max_x) / 2, (b.min_y + b.max_y) / 2 FROM stage_bounds b JOIN stages s ON s.rid = b.rid '
+            'WHERE b.max_x >= ? AND b.min_x <= ? AND b.max_y >= ? AND b.min_y <= ?', (left, right, top, bottom)).fetchall()
+
+    def load_stages(self, stage_ids):
+        stages = []
+        for chunk in _chunks(stage_ids):
+            marks = ','.join('?' * len(chunk))
+            stages.extend(json.loads(data) for (data,) in
+                          self._db().execute(f'SELECT data FROM stages WHERE id IN ({marks})', chunk))
+        return stages
+
+    def connections_for(self, stage_ids):
+        """Связи, у которых хотя бы один конец среди stage_ids: множество (from, to)."""
+        connections = set()
+        # Каждый id подставляется дважды (начало и конец), поэтому порция вдвое меньше
+        for chunk in _chunks(stage_ids, QUERY_CHUNK // 2):
+            marks = ','.join('?' * len(chunk))
+            connections.update(self._db().execute(
+                f'SELECT start_id, end_id FROM connections WHERE start_id IN ({marks}) '
+                f'UNION SELECT start_id, end_id FROM connections WHERE end_id IN ({marks})', chunk + chunk))
+        return connections
+
+    def load_project_data(self):
+        """Собирает весь проект в формате RoadMapWidget.get_project_data() (экспорт в .rmap)."""
+        self.commit()
+        project_data = {
+            'stages': [json.loads(data) for (data,) in self._db().execute('SELECT data FROM stages ORDER BY id')],
+            'connections': [{'from': start_id, 'to': end_id} for start_id, end_id in
+                            self._db().execute('SELECT start_id, end_id FROM connections ORDER BY start_id, end_id')],
+            'color_history': self._meta.get('color_history', []),
+        }
+        project_data.update(self._meta.get('project_info', {}))
+        if self._meta.get('scene_rect'):
+            project_data['scene_rect'] = self._meta['scene_rect']
+        return project_data
+
+    def has_image(self, image_hash):
+        return image_hash in self._image_hashes
+
+    def read_image(self, image_hash):
+        row = self._db().execute('SELECT data FROM images WHERE hash = ?', (image_hash,)).fetchone()
+        if row is None:
+            raise KeyError(image_hash)
+        return row[0]
+
+    # --- Запись изменений ---
+
+    def stage_changed(self, stage):
+        stage_id, image_hash, data, bounds = _stage_record(stage)
+        if image_hash and image_hash not in self._image_hashes and self.image_store is not None and self.image_store.has(image_hash):
+            self._image_hashes.add(image_hash)
+            self._pending.append(('INSERT OR IGNORE INTO images (hash, format, data) VALUES (?, ?, ?)',
+                                  (image_hash, self.image_store.image_format(image_hash), self.image_store.read_bytes(image_hash))))
+        self._pending.append((_UPSERT_STAGE, (stage_id, image_hash, data)))
+        self._pending.append((_UPSERT_BOUNDS, bounds + (stage_id,)))
+
+    def stage_deleted(self, stage_id):
+        self._pending.append(('DELETE FROM stage_bounds WHERE rid = (SELECT rid FROM stages WHERE id = ?)', (stage_id,)))
+        self._pending.append(('DELETE FROM stages WHERE id = ?', (stage_id,)))
+        self._pending.append(('DELETE FROM connections WHERE start_id = ? OR end_id = ?', (stage_id, stage_id)))
+
+    def connection_added(self, start_id, end_id):
+        self._pending.append(('INSERT OR IGNORE INTO connections (start_id, end_id) VALUES (?, ?)', (start_id, end_id)))
+
+    def connection_removed(self, start_id, end_id):
+        self._pending.append(('DELETE FROM connections WHERE start_id = ? AND end_id = ?', (start_id, end_id)))
+
+    def meta_changed(self, project_data):
+        for key in ('scene_rect', 'color_history'):
+            value = project_data.get(key)
+            if value != self._meta.get(key):
+                self._meta[key] = value
+                self._pending.append(('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                                      (key, json.dumps(value, ensure_ascii=False))))
+
+    def has_pending(self):
+        return bool(self._pending)
+
+    def commit(self):
+        """Записывает накопленные правки одной транзакцией."""
+        if not self._pending:
+            return
+        project_info = self._meta.setdefault('project_info', {})
+        project_info['modified_date'] = datetime.now().isoformat(timespec='seconds')
+        self._pending.append(('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                              ('project_info', json.dumps(project_info, ensure_ascii=False))))
+        with self._db():
+            for sql, params in self._pending:
+                self._db().execute(sql, params)
+        self._pending = []
+
+    def needs_compaction(self):
+        return False
+
+    def remove_unused_images(self):
+        """Удаляет изображения, на которые не ссылается ни один этап."""
+        with self._db():
+            self._db().execute('DELETE FROM images WHERE hash NOT IN '
+                               '(SELECT image_hash FROM stages WHERE image_hash IS NOT NULL)')
+        self._image_hashes = {image_hash for (image_hash,) in self._db().execute('SELECT hash FROM images')}
+        self.manifest['images'] = {image_hash: info for image_hash, info in self.manifest['images'].items()
+                                   if image_hash in self._image_hashes}
+
+    def close(self):
+        if self._connection is not None:
+            self.commit()
+            self._connection.close()
+            self._connection = None
+
+
+class ScenePager(QObject):
+    """Держит на сцене только блоки рядом с видимой областью.
+
+    После прокрутки или масштабирования (RoadMapWidget.viewport_changed)
+    из R-tree выбираются этапы в видимой области с запасом PAGE_MARGIN и
+    их соседи по связям, чтобы связи, уходящие за край экрана, тоже были
+    видны. Недостающие блоки создаются порциями в пределах FRAME_BUDGET,
+    ближайшие к центру - первыми; блоки, ушедшие дальше UNLOAD_MARGIN,
+    снимаются со сцены. Правки к этому моменту уже записаны в базу.
+    """
+
+    def __init__(self, widget, store, parent=None):
+        super().__init__(parent)
+        self.widget = widget
+        self.store = store
+        self._loaded = {}                      # id -> блок на сцене
+        self._adjacency = defaultdict(list)    # id -> связи (from, to) подгружаемой области
+        self._queue = deque()
+        self._page_timer = QTimer(self)
+        self._page_timer.setSingleShot(True)
+        self._page_timer.setInterval(PAGE_DELAY_MS)
+        self._page_timer.timeout.connect(self.update_region)
+        self._pump_timer = QTimer(self)
+        self._pump_timer.setInterval(0)
+        self._pump_timer.timeout.connect(self._pump)
+        self._write_timer = QTimer(self)
+        self._write_timer.setSingleShot(True)
+        self._write_timer.setInterval(WRITE_DELAY_MS)
+        self._write_timer.timeout.connect(self.write_through)
+        widget.viewport_changed.connect(self._page_timer.start)
+        widget.project_changed.connect(self._write_timer.start)
+
+    def stop(self):
+        self.widget.viewport_changed.disconnect(self._page_timer.start)
+        self.widget.project_changed.disconnect(self._write_timer.start)
+        self._page_timer.stop()
+        self._pump_timer.stop()
+        self._write_timer.stop()
+        self._queue.clear()
+        self.write_through()
+
+    def is_paging(self):
+        return bool(self._queue)
+
+    def write_through(self):
+        """Переносит изменённые блоки в базу одной транзакцией."""
+        self._write_timer.stop()
+        try:
+            self.widget.flush_journal()
+            self.store.commit()
+        except sqlite3.Error as e:
+            print(f"Ошибка записи в базу проекта: {str(e)}")
+            self._write_timer.start()
+
+    def update_region(self):
+        if self.widget.focused_on_sources:
+            # В режиме фокуса набор блоков не меняем, иначе новые блоки не будут скрыты
+            return
+        # Запросы к R-tree должны видеть последние положения блоков
+        self.write_through()
+        view_rect = self.widget.mapToScene(self.widget.viewport().rect()).boundingRect()
+        load_rect = view_rect.adjusted(-view_rect.width() * PAGE_MARGIN, -view_rect.height() * PAGE_MARGIN,
+                                       view_rect.width() * PAGE_MARGIN, view_rect.height() * PAGE_MARGIN)
+        keep_rect = view_rect.adjusted(-view_rect.width() * UNLOAD_MARGIN, -view_rect.height() * UNLOAD_MARGIN,
+                                       view_rect.width() * UNLOAD_MARGIN, view_rect.height() * UNLOAD_MARGIN)
+        center = view_rect.center()
+        region = self.store.query_region(load_rect.left(), load_rect.top(), load_rect.right(), load_rect.bottom())
+        region.sort(key=lambda row: (row[1] - center.x()) ** 2 + (row[2] - center.y()) ** 2)
+        wanted = [row[0] for row in region[:MAX_PAGED_STAGES]]
+        wanted_ids = set(wanted)
+        self._adjacency = defaultdict(list)
+        for start_id, end_id in self.store.connections_for(wanted_ids):
+            self._adjacency[start_id].append((start_id, end_id))
+            self._adjacency[end_id].append((start_id, end_id))
+            for stage_id in (start_id, end_id):
+                if stage_id not in wanted_ids:
+                    wanted_ids.add(stage_id)
+                    wanted.append(stage_id)
+        self._loaded = {item.stage_data['id']: item for item in self.widget.stage_items()}
+        keep = set(self.widget.stages_in(keep_rect))
+        unload = [item for stage_id, item in self._loaded.items()
+                  if stage_id not in wanted_ids and item not in keep and self.widget.can_unload(item)]
+        if unload:
+            self.widget.unload_stages(unload)
+            for item in unload:
+                del self._loaded[item.stage_data['id']]
+        self._queue = deque(stage_id for stage_id in wanted if stage_id not in self._loaded)
+        if self._queue:
+            self._pump_timer.start()
+
+    def finish_now(self):
+        """Синхронно создаёт все блоки, стоящие в очереди."""
+        while self._queue:
+            self._page_in(len(self._queue))
+        self._pump_timer.stop()
+
+    def _pump(self):
+        deadline = time.perf_counter() + FRAME_BUDGET
+        while self._queue and time.perf_counter() < deadline:
+            self._page_in(50)
+        if not self._queue:
+            self._pump_timer.stop()
+
+    def _page_in(self, count):
+        chunk = [self._queue.popleft() for _ in range(min(count, len(self._queue)))]
+        chunk = [stage_id for stage_id in chunk if stage_id not in self._loaded]
+        # Связь между двумя блоками порции встречается в списках обоих концов - берём её один раз
+        connections = {key: None for stage_id in chunk for key in self._adjacency.get(stage_id, [])}
+        with self.widget.unrecorded():
+            # Концы, которых нет на сцене, materialize_stages пропускает
+            for item in self.widget.materialize_stages(self.store.load_stages(chunk), connections):
+                self._loaded[item.stage_data['id']] = item
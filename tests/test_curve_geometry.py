@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import math
+import random
+
+import pytest
+
+from curve_geometry import CurveLUT, cubic_point
+
+
+def _brute_project(lut, x, y):
+    # Ближайшая точка по всем отрезкам ломаной подряд
+    best = (float('inf'), 0.0)
+    for i in range(len(lut.xs) - 1):
+        x1, y1, x2, y2 = lut.xs[i], lut.ys[i], lut.xs[i + 1], lut.ys[i + 1]
+        dx, dy = x2 - x1, y2 - y1
+        length_sq = dx * dx + dy * dy
+        f = 0.0 if length_sq == 0 else max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / length_sq))
+        distance = math.hypot(x - (x1 + f * dx), y - (y1 + f * dy))
+        if distance < best[0]:
+            best = (distance, lut.lengths[i] + f * (lut.lengths[i + 1] - lut.lengths[i]))
+    return best
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_project_matches_brute_force(seed):
+    rng = random.Random(seed)
+    points = [(rng.uniform(-500, 500), rng.uniform(-500, 500)) for _ in range(4)]
+    lut = CurveLUT.from_cubic(*points)
+    for _ in range(300):
+        x, y = rng.uniform(-700, 700), rng.uniform(-700, 700)
+        t, px, py, distance = lut.project(x, y)
+        brute_distance, brute_s = _brute_project(lut, x, y)
+        assert distance == pytest.approx(brute_distance, abs=1e-6)
+        assert math.hypot(x - px, y - py) == pytest.approx(distance, abs=1e-6)
+        # Точка на доле t лежит там же, где найденная проекция
+        assert lut.point_at_percent(t) == pytest.approx((px, py), abs=1e-6)
+        if abs(t * lut.length - brute_s) > 1e-6:
+            # Равноудалённые точки на разных участках кривой
+            qx, qy = lut.point_at_percent(brute_s / lut.length)
+            assert math.hypot(x - qx, y - qy) == pytest.approx(distance, abs=1e-6)
+
+
+def test_point_at_percent_follows_arc_length():
+    lut = CurveLUT([(0, 0), (30, 0), (30, 40)])
+    assert lut.length == 70
+    assert lut.point_at_percent(0) == (0, 0)
+    assert lut.point_at_percent(3 / 7) == pytest.approx((30, 0))
+    assert lut.point_at_percent(0.5) == pytest.approx((30, 5))
+    assert lut.point_at_percent(1) == pytest.approx((30, 40))
+    assert lut.point_at_percent(2) == pytest.approx((30, 40))
+
+
+def test_cubic_lut_length_converges():
+    points = [(0, 0), (100, 300), (400, -200), (500, 100)]
+    fine = [cubic_point(*points, i / 20000) for i in range(20001)]
+    reference = sum(math.dist(fine[i], fine[i + 1]) for i in range(len(fine) - 1))
+    assert CurveLUT.from_cubic(*points).length == pytest.approx(reference, rel=1e-3)
+
+
+def test_from_path_reads_lines_and_curves():
+    from PyQt5.QtGui import QPainterPath
+    path = QPainterPath()
+    path.moveTo(0, 0)
+    path.lineTo(100, 0)
+    path.cubicTo(150, 0, 200, 50, 200, 100)
+    lut = CurveLUT.from_path(path, segments=256)
+    assert (lut.xs[0], lut.ys[0]) == (0, 0)
+    assert (lut.xs[-1], lut.ys[-1]) == pytest.approx((200, 100))
+    assert lut.length == pytest.approx(path.length(), rel=1e-3)
+    for t in (0.1, 0.35, 0.6, 0.9):
+        expected = path.pointAtPercent(t)
+        # pointAtPercent у Qt сам приближённый (длины кривых по оценке), отсюда допуск
+        assert lut.point_at_percent(t) == pytest.approx((expected.x(), expected.y()), abs=1.0)
+
+
+def test_degenerate_paths():
+    single = CurveLUT([(5, 5)])
+    assert single.point_at_percent(0.5) == (5, 5)
+    assert single.project(8, 9) == (0.0, 5, 5, 5.0)
+    zero = CurveLUT.from_line((1, 1), (1, 1))
+    assert zero.point_at_percent(0.3) == (1, 1)
+    assert zero.project(4, 5)[3] == pytest.approx(5.0)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import random
+
+import pytest
+
+from graph_analysis import GraphAnalysis
+from graph_index import GraphIndex
+from test_graph_index import Edge, brute_reachable
+
+
+def _random_graph(seed, nodes=80, edges=95):
+    rng = random.Random(seed)
+    graph, items = GraphIndex(), []
+    names = ['n%d' % i for i in range(nodes)]
+    for name in names:
+        graph.add_node(name)
+    for _ in range(edges):
+        edge = Edge(rng.choice(names), rng.choice(names))
+        graph.add_edge(edge)
+        items.append(edge)
+    return graph, names, items, rng
+
+
+def _brute_is_bridge(edges, a, b):
+    return a != b and b not in brute_reachable(edges, a, exclude=(a, b)) and \
+        any({e.start_item, e.end_item} == {a, b} for e in edges)
+
+
+@pytest.mark.parametrize('seed', range(6))
+def test_bridges_match_brute_force(seed):
+    graph, names, edges, _ = _random_graph(seed)
+    analysis = GraphAnalysis(graph)
+    pairs = {frozenset((e.start_item, e.end_item)) for e in edges if e.start_item != e.end_item}
+    brute = {pair for pair in pairs if _brute_is_bridge(edges, *pair)}
+    assert {frozenset(pair) for pair in analysis.bridges()} == brute
+    for pair in pairs:
+        a, b = tuple(pair)
+        assert analysis.is_bridge(a, b) == (pair in brute)
+
+
+@pytest.mark.parametrize('seed', range(6))
+def test_far_side_matches_reachable(seed):
+    graph, names, edges, rng = _random_graph(seed)
+    analysis = GraphAnalysis(graph)
+    for edge in edges:
+        a, b = edge.start_item, edge.end_item
+        for from_node in (a, b, rng.choice(names)):
+            assert analysis.far_side(from_node, a, b) == brute_reachable(edges, from_node, exclude=(a, b))
+            # Повтор берётся из кэша и совпадает
+            assert analysis.far_side(from_node, a, b) == brute_reachable(edges, from_node, exclude=(a, b))
+
+
+def test_components_and_recompute_after_change():
+    graph, names, edges, rng = _random_graph(3)
+    analysis = GraphAnalysis(graph)
+    for name in names:
+        assert analysis.component(name) == brute_reachable(edges, name)
+    groups = analysis.two_edge_components()
+    assert sorted(n for group in groups for n in group) == sorted(names)
+    for group in groups:
+        # Внутри группы блоки связаны и без любого моста
+        for bridge in analysis.bridges():
+            assert set(group) <= brute_reachable(edges, group[0], exclude=bridge)
+    # Изменение графа сбрасывает кэш: мост, замкнутый в цикл, перестаёт быть мостом
+    a, b = next(iter(analysis.bridges()))
+    closing = [Edge(a, 'extra'), Edge('extra', b)]
+    for edge in closing:
+        graph.add_edge(edge)
+    assert not analysis.is_bridge(a, b)
+    assert analysis.far_side(a, a, b) == brute_reachable(edges + closing, a, exclude=(a, b))
+
+
+class _CountingAnalysis(GraphAnalysis):
+    computes = 0
+
+    def _compute(self):
+        self.computes += 1
+        super()._compute()
+
+
+def _assert_matches_fresh(graph, analysis, edges):
+    fresh = GraphAnalysis(graph)
+    assert {frozenset(pair) for pair in analysis.bridges()} == {frozenset(pair) for pair in fresh.bridges()}
+    assert {frozenset(group) for group in analysis.two_edge_components()} == \
+        {frozenset(group) for group in fresh.two_edge_components()}
+    for name in graph.nodes():
+        assert analysis.component(name) == fresh.component(name)
+    for edge in edges[:20]:
+        a, b = edge.start_item, edge.end_item
+        assert analysis.far_side(a, a, b) == brute_reachable(edges, a, exclude=(a, b))
+
+
+@pytest.mark.parametrize('seed,edge_count', [(seed, count) for seed in range(4) for count in (50, 95)])
+def test_incremental_updates_match_full_recompute(seed, edge_count):
+    graph, names, edges, rng = _random_graph(seed, edges=edge_count)
+    analysis = GraphAnalysis(graph)
+    _assert_matches_fresh(graph, analysis, edges)
+    fresh_names = iter('new%d' % i for i in range(1000))
+    for step in range(120):
+        live = graph.nodes()
+        roll = rng.random()
+        if roll < 0.35 and edges:
+            edge = edges.pop(rng.randrange(len(edges)))
+            graph.remove_edge(edge)
+        elif roll < 0.45 and len(live) > 2:
+            removed = graph.remove_node(rng.choice(live))
+            edges = [edge for edge in edges if edge not in removed]
+        elif roll < 0.5:
+            graph.add_node(next(fresh_names))
+        else:
+            # Чаще внутри уже связанной части, чтобы попадать в одну компоненту двусвязности
+            a = rng.choice(live)
+            pool = sorted(analysis.component(a), key=str) if rng.random() < 0.7 else live
+            edge = Edge(a, rng.choice(pool))
+            graph.add_edge(edge)
+            edges.append(edge)
+        if step % 3 == 0:
+            _assert_matches_fresh(graph, analysis, edges)
+    _assert_matches_fresh(graph, analysis, edges)
+
+
+def _cycle(graph, names):
+    edges = [Edge(a, b) for a, b in zip(names, names[1:] + names[:1])]
+    for edge in edges:
+        graph.add_edge(edge)
+    return edges
+
+
+def test_edge_inside_two_edge_component_keeps_results():
+    graph = GraphIndex()
+    left, right = ['l%d' % i for i in range(6)], ['r%d' % i for i in range(6)]
+    edges = _cycle(graph, left) + _cycle(graph, right) + [Edge('l0', 'r0')]
+    graph.add_edge(edges[-1])
+    analysis = _CountingAnalysis(graph)
+    side = analysis.far_side('l3', 'l0', 'r0')
+    assert side == frozenset(left)
+    assert analysis.computes == 1
+    # Хорда внутри цикла: мосты те же, кэш сторон не сбрасывается
+    graph.add_edge(Edge('l1', 'l4'))
+    graph.add_edge(Edge('r4', 'r1'))
+    assert analysis.is_bridge('l0', 'r0')
+    assert analysis.far_side('l3', 'l0', 'r0') is side
+    assert analysis.computes == 1
+
+
+def test_removal_relays_out_only_its_component():
+    graph = GraphIndex()
+    first, second = ['a%d' % i for i in range(8)], ['b%d' % i for i in range(40)]
+    edges = _cycle(graph, first) + _cycle(graph, second)
+    analysis = _CountingAnalysis(graph)
+    analysis.bridges()
+    second_tin = {node_id: analysis._tin[node_id] for node_id in map(graph.node_id, second)}
+    kept = analysis.far_side('b5', 'b0', 'b1')
+    # Разрыв цикла: все связи первой компоненты становятся мостами
+    graph.remove_edge(edges[0])
+    assert analysis.is_bridge('a1', 'a2')
+    assert analysis.far_side('a1', 'a1', 'a2') == brute_reachable(edges[1:], 'a1', exclude=('a1', 'a2'))
+    removed = graph.remove_node('a4')
+    assert analysis.component('a3') == frozenset(['a1', 'a2', 'a3'])
+    assert analysis.component('a5') == frozenset(['a5', 'a6', 'a7', 'a0'])
+    assert analysis.computes == 1
+    assert {node_id: analysis._tin[node_id] for node_id in map(graph.node_id, second)} == second_tin
+    assert analysis.far_side('b5', 'b0', 'b1') is kept
+    _assert_matches_fresh(graph, analysis, [edge for edge in edges[1:] if edge not in removed])
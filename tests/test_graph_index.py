@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import random
+
+import pytest
+
+from graph_index import GraphIndex
+
+
+class Edge:
+    def __init__(self, start_item, end_item):
+        self.start_item, self.end_item = start_item, end_item
+
+
+def brute_reachable(edges, start, exclude=None):
+    seen, stack = {start}, [start]
+    while stack:
+        node = stack.pop()
+        for edge in edges:
+            if node not in (edge.start_item, edge.end_item):
+                continue
+            if exclude is not None and {edge.start_item, edge.end_item} == set(exclude):
+                continue
+            other = edge.end_item if edge.start_item == node else edge.start_item
+            if other not in seen:
+                seen.add(other)
+                stack.append(other)
+    return seen
+
+
+@pytest.fixture
+def random_graph():
+    rng = random.Random(21)
+    graph, edges = GraphIndex(), []
+    nodes = ['n%d' % i for i in range(120)]
+    for node in nodes:
+        graph.add_node(node)
+    for _ in range(150):
+        edge = Edge(rng.choice(nodes), rng.choice(nodes))
+        graph.add_edge(edge)
+        edges.append(edge)
+    for edge in rng.sample(edges, 30):
+        assert graph.remove_edge(edge)
+        edges.remove(edge)
+    for node in rng.sample(nodes, 10):
+        removed = graph.remove_node(node)
+        assert set(removed) == {edge for edge in edges if node in (edge.start_item, edge.end_item)}
+        edges = [edge for edge in edges if edge not in removed]
+        nodes.remove(node)
+    return graph, nodes, edges, rng
+
+
+def test_edges_and_lookup(random_graph):
+    graph, nodes, edges, rng = random_graph
+    assert set(graph.connections()) == set(edges)
+    assert graph.edge_count() == len(edges)
+    for node in nodes:
+        assert set(graph.connections_of(node)) == {e for e in edges if node in (e.start_item, e.end_item)}
+        assert graph.degree(node) == len(graph.connections_of(node))
+        assert graph.neighbors(node) == ({e.end_item for e in edges if e.start_item == node}
+                                         | {e.start_item for e in edges if e.end_item == node})
+    for _ in range(300):
+        a, b = rng.choice(nodes), rng.choice(nodes)
+        forward = [e for e in edges if (e.start_item, e.end_item) == (a, b)]
+        assert graph.edge(a, b) is (forward[0] if forward else None)
+        either = forward or [e for e in edges if (e.start_item, e.end_item) == (b, a)]
+        assert graph.edge_between(a, b) is (either[0] if either else None)
+
+
+def test_reachable_matches_brute_force(random_graph):
+    graph, nodes, edges, rng = random_graph
+    for node in nodes:
+        assert graph.reachable(node) == brute_reachable(edges, node)
+    for edge in rng.sample(edges, 40):
+        pair = (edge.start_item, edge.end_item)
+        assert graph.reachable(edge.start_item, exclude=pair) == brute_reachable(edges, edge.start_item, pair)
+
+
+def test_parallel_edges_and_version():
+    graph = GraphIndex()
+    first, second = Edge('a', 'b'), Edge('a', 'b')
+    graph.add_edge(first)
+    graph.add_edge(second)
+    version = graph.version
+    assert graph.edge('a', 'b') is first
+    assert graph.remove_edge(first)
+    assert graph.edge('a', 'b') is second
+    assert graph.neighbors('a') == {'b'}
+    assert graph.version > version
+    assert not graph.remove_edge(first)
+    graph.remove_edge(second)
+    assert graph.neighbors('a') == set()
+    assert graph.reachable('missing') == {'missing'}
+    graph.clear()
+    assert len(graph) == 0 and graph.connections() == []
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import time
+
+from project_archive import convert_legacy_json, read_archive_header
+
+
+def _write_legacy(path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'stages': [{'id': 'a', 'title': 'A', 'position': {'x': 0, 'y': 0}}], 'connections': []}, f)
+
+
+def test_convert_legacy_json_reuses_fresh_archive(tmp_path):
+    json_path = str(tmp_path / 'plan.json')
+    _write_legacy(json_path)
+    first = convert_legacy_json(json_path)
+    assert convert_legacy_json(json_path) == first
+    assert sorted(os.listdir(tmp_path)) == ['plan.json', 'plan.rmap']
+    assert read_archive_header(first)['format'] == 'roadmap-archive'
+
+
+def test_convert_legacy_json_rewrites_after_json_changes(tmp_path):
+    json_path = str(tmp_path / 'plan.json')
+    _write_legacy(json_path)
+    first = convert_legacy_json(json_path)
+    past = time.time() - 60
+    os.utime(first, (past, past))   # .json изменён после конвертации
+    second = convert_legacy_json(json_path)
+    assert second == str(tmp_path / 'plan_1.rmap')
+    assert convert_legacy_json(json_path) == second
+
+
+def test_convert_legacy_json_skips_foreign_file(tmp_path):
+    json_path = str(tmp_path / 'plan.json')
+    _write_legacy(json_path)
+    (tmp_path / 'plan.rmap').write_bytes(b'not an archive')
+    os.utime(json_path, (0, 0))
+    assert convert_legacy_json(json_path) == str(tmp_path / 'plan_1.rmap')
+    assert (tmp_path / 'plan.rmap').read_bytes() == b'not an archive'
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Порядок сигналов потока разбора и таймера порций ProgressiveSceneLoader.
+
+Сигналы потока вызываются здесь напрямую в том порядке, в каком их
+доставляет очередь GUI-потока, чтобы гонки воспроизводились без потоков.
+"""
+
+import time
+
+import pytest
+
+from project_archive import ProjectArchive, write_project_archive
+from project_loader import ProgressiveSceneLoader
+from roadmap_widget import RoadMapWidget
+
+
+@pytest.fixture
+def widget(qapp):
+    widget = RoadMapWidget()
+    yield widget
+    widget.clear()
+    widget.deleteLater()
+
+
+def _chain_project(count):
+    stages = [{'id': 's%05d' % i, 'title': 'S%d' % i, 'position': {'x': (i % 40) * 260, 'y': (i // 40) * 140}}
+              for i in range(count)]
+    connections = [{'from': 's%05d' % i, 'to': 's%05d' % (i + 1)} for i in range(count - 1)]
+    return {'stages': stages, 'connections': connections}
+
+
+@pytest.fixture
+def archive_loader(widget, tmp_path):
+    """Загрузчик, получивший заголовок архива; поток не запущен."""
+    project = _chain_project(600)
+    path = str(tmp_path / 'chain.rmap')
+    write_project_archive(path, project, widget.image_store)
+    archive = ProjectArchive(path)
+    manifest = archive.manifest
+    archive.close()
+    loader = ProgressiveSceneLoader(widget, path)
+    loaded = []
+    loader.loaded.connect(loaded.append)
+    loader._on_header(path, manifest, {})
+    return loader, project, loaded
+
+
+def _drain(loader):
+    while loader._heap:
+        loader._pump()
+
+
+def test_connections_in_last_batch_are_kept(widget, qapp, archive_loader):
+    loader, project, loaded = archive_loader
+    loader._on_stages(project['stages'])
+    # Все этапы созданы, поток уже завершился, но его последние пачки ещё в очереди
+    _drain(loader)
+    loader._pump()
+    assert not loaded
+    loader._on_connections(project['connections'])
+    loader._on_worker_finished()
+    deadline = time.monotonic() + 30
+    while not loaded and time.monotonic() < deadline:
+        qapp.processEvents()
+    assert loaded
+    assert len(widget.stage_items()) == len(project['stages'])
+    assert len(widget.connection_items()) == len(project['connections'])
+
+
+def test_pump_timer_stops_while_worker_still_parses(widget, archive_loader, monkeypatch):
+    loader, project, loaded = archive_loader
+    monkeypatch.setattr(loader.worker, 'isRunning', lambda: True)
+    loader._on_stages(project['stages'][:50])
+    assert loader._pump_timer.isActive()
+    _drain(loader)
+    # Очередь пуста - таймер не крутит _pump вхолостую, пока не придёт следующая пачка
+    assert not loader._pump_timer.isActive()
+    loader._on_stages(project['stages'][50:])
+    assert loader._pump_timer.isActive()
+    _drain(loader)
+    assert not loader._pump_timer.isActive()
+    assert not loaded
+    assert len(widget.stage_items()) == len(project['stages'])
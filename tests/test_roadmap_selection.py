@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Пульсация выделенных блоков: при смене выделения затрагиваются только изменившиеся блоки."""
+
+import pytest
+
+from animation_clock import shared_animation_clock
+from roadmap_widget import RoadMapWidget, StageGraphicsItem
+
+
+@pytest.fixture
+def widget(qapp):
+    widget = RoadMapWidget()
+    yield widget
+    widget.clear()
+    widget.deleteLater()
+
+
+@pytest.fixture
+def stages(widget):
+    items = [widget.add_stage({'id': 's%d' % i, 'title': 'Этап %d' % i, 'position': {'x': i * 300, 'y': 0}})
+             for i in range(6)]
+    widget.scene.clearSelection()   # add_stage выделяет новый блок
+    return items
+
+
+def pulsing(items):
+    return {item for item in items if shared_animation_clock().is_running(item, 'pulse')}
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+    start, stop = StageGraphicsItem._start_pulsing_animation, StageGraphicsItem._stop_pulsing_animation
+    monkeypatch.setattr(StageGraphicsItem, '_start_pulsing_animation',
+                        lambda item: (calls.append(('start', item)), start(item)))
+    monkeypatch.setattr(StageGraphicsItem, '_stop_pulsing_animation',
+                        lambda item: (calls.append(('stop', item)), stop(item)))
+    return calls
+
+
+def test_selection_change_touches_only_changed_stages(widget, stages, calls):
+    stages[0].setSelected(True)
+    stages[1].setSelected(True)
+    assert pulsing(stages) == {stages[0], stages[1]}
+
+    calls.clear()
+    stages[0].setSelected(False)
+    stages[2].setSelected(True)
+    assert pulsing(stages) == {stages[1], stages[2]}
+    assert set(calls) == {('stop', stages[0]), ('start', stages[2])}
+
+    calls.clear()
+    widget.scene.clearSelection()
+    assert pulsing(stages) == set()
+    assert set(calls) == {('stop', stages[1]), ('stop', stages[2])}
+
+
+def test_batch_selection_applies_diff_once(widget, stages, calls):
+    stages[0].setSelected(True)
+    calls.clear()
+    with widget.batch_update():
+        for item in stages[3:]:
+            item.setSelected(True)
+        stages[0].setSelected(False)
+    assert pulsing(stages) == set(stages[3:])
+    assert sorted(kind for kind, _ in calls) == ['start'] * 3 + ['stop']
+
+
+def test_preview_reset_keeps_selected_stage_pulsing(widget, stages):
+    widget.add_connection(stages[0], stages[1])
+    stages[1].setSelected(True)
+    widget.preview_items = {stages[1], stages[2]}
+    stages[2]._start_pulsing_animation()
+    widget._reset_preview()
+    assert pulsing(stages) == {stages[1]}
+
+
+def test_deleted_and_cleared_stages_leave_selection(widget, stages):
+    stages[0].setSelected(True)
+    stages[1].setSelected(True)
+    widget.delete_stage(stages[0])
+    assert widget._pulsing_selection == {stages[1]}
+    widget.clear()
+    assert widget._pulsing_selection == set()
+    item = widget.add_stage({'id': 'new', 'title': 'Новый', 'position': {'x': 0, 'y': 0}})
+    assert item.isSelected()
+    assert pulsing([item]) == {item}
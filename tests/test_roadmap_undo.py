@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Отмена и повтор в RoadMapWidget: сцена после каждого шага совпадает со снимком до него."""
+
+import base64
+import time
+
+import pytest
+from PyQt5.QtCore import QBuffer, QByteArray, QIODevice, QPointF
+from PyQt5.QtGui import QColor, QImage
+
+from project_archive import ProjectArchive, write_project_archive
+from project_journal import ProjectJournal
+from project_loader import ProgressiveSceneLoader
+from roadmap_widget import ImageStageGraphicsItem, RoadMapWidget
+
+
+@pytest.fixture
+def widget(qapp):
+    widget = RoadMapWidget()
+    yield widget
+    widget.detach_journal()
+    widget.clear()
+    widget.deleteLater()
+
+
+def scene_snapshot(widget):
+    data = widget.get_project_data()
+    fields = ('title', 'border_color', 'width', 'height', 'image_width')
+    stages = sorted((stage['id'], stage['position']['x'], stage['position']['y'], tuple(stage.get(key) for key in fields))
+                    for stage in data['stages'])
+    return stages, sorted((conn['from'], conn['to']) for conn in data['connections'])
+
+
+def png_data(width, height):
+    image = QImage(width, height, QImage.Format_RGB32)
+    image.fill(QColor('#3366cc'))
+    buffer_bytes = QByteArray()
+    buffer = QBuffer(buffer_bytes)
+    buffer.open(QIODevice.WriteOnly)
+    image.save(buffer, 'PNG')
+    return base64.b64encode(bytes(buffer_bytes)).decode('ascii')
+
+
+def test_undo_redo_round_trip_over_create_move_connect_delete(widget):
+    widget.save_undo_state()
+    history = []
+
+    def step(action):
+        history.append(scene_snapshot(widget))
+        action()
+
+    items = []
+    for i in range(4):
+        step(lambda i=i: items.append(widget.add_stage({'id': 's%d' % i, 'title': 'Этап %d' % i,
+                                                         'position': {'x': i * 300, 'y': 0}})))
+    step(lambda: widget.add_connection(items[0], items[1]))
+    step(lambda: widget.add_connection(items[1], items[2]))
+
+    def move():
+        widget.save_undo_state()
+        with widget.batch_update():
+            items[1].setPos(QPointF(120, 480))
+            items[2].setPos(QPointF(-40, 900))
+    step(move)
+
+    def recolor():
+        widget.save_undo_state()
+        items[3].update_color('#FF0000')
+    step(recolor)
+    step(lambda: widget.delete_stage(items[1]))
+    step(lambda: widget.add_connection(items[3], items[0]))
+    widget.save_undo_state()
+    final = scene_snapshot(widget)
+
+    for expected in reversed(history):
+        widget.undo()
+        assert scene_snapshot(widget) == expected
+    for expected in history[1:] + [final]:
+        widget.redo()
+        assert scene_snapshot(widget) == expected
+
+
+class _ReleaseEvent:
+    def accept(self):
+        pass
+
+
+def test_image_resize_undo_redo(widget):
+    widget.save_undo_state()
+    item = widget.add_stage({'id': 'img', 'type': 'image', 'title': '', 'description': '',
+                             'image_data': png_data(100, 50), 'position': {'x': 0, 'y': 0}})
+    widget.save_undo_state()
+    assert isinstance(item, ImageStageGraphicsItem) and item.pixmap.width() == 100
+    # Перетаскивание маркера размера: промежуточные масштабы, затем отпускание
+    item.resizing = True
+    for width in (90, 75, 60):
+        item.recalculate_size(new_image_width=width)
+    item.mouseReleaseEvent(_ReleaseEvent())
+    assert item.pixmap.width() == 60
+    widget.save_undo_state()
+
+    widget.undo()
+    assert item.pixmap.width() == 100
+    assert item.get_stage_data()['image_width'] == 100
+    assert item.rect.width() == max(100, 220) + 2 * item.padding
+    widget.redo()
+    assert item.pixmap.width() == 60
+    assert item.get_stage_data()['image_width'] == 60
+    widget.undo()
+    assert item.pixmap.width() == 100
+
+
+def test_click_during_progressive_load_does_not_record_loaded_stages(widget, qapp, tmp_path):
+    count = 3000
+    stages = [{'id': 's%05d' % i, 'title': 'S%d' % i, 'position': {'x': (i % 60) * 260, 'y': (i // 60) * 140}}
+              for i in range(count)]
+    connections = [{'from': 's%05d' % i, 'to': 's%05d' % (i + 1)} for i in range(count - 1)]
+    path = str(tmp_path / 'big.rmap')
+    write_project_archive(path, {'stages': stages, 'connections': connections}, widget.image_store)
+
+    loader = ProgressiveSceneLoader(widget, path)
+    loaded = []
+    loader.loaded.connect(loaded.append)
+    loader.start()
+    clicked = False
+    deadline = time.monotonic() + 60
+    while not loaded and time.monotonic() < deadline:
+        qapp.processEvents()
+        if not clicked and 100 <= len(widget.stage_items()) < count:
+            widget.save_undo_state()   # Левый клик по сцене
+            clicked = True
+    assert loaded and clicked
+    assert len(widget.stage_items()) == count
+    assert len(widget.connection_items()) == count - 1
+
+    widget.undo()
+    assert len(widget.stage_items()) == count
+    assert len(widget.connection_items()) == count - 1
+    # После загрузки отмена снова работает, а загруженные блоки возвращаются к исходному виду, а не удаляются
+    widget.save_undo_state()
+    moved = widget._stages_by_id['s00010']
+    moved.setPos(QPointF(-999, -999))
+    widget.undo()
+    assert moved.pos() == QPointF(10 * 260, 0)
+    assert len(widget.stage_items()) == count
+
+
+def test_journal_matches_scene_after_undo_and_redo(widget, tmp_path):
+    for i in range(5):
+        widget.materialize_stage({'id': 's%d' % i, 'title': 'S%d' % i, 'position': {'x': i * 300, 'y': 0}})
+    path = str(tmp_path / 'journal.rmap')
+    write_project_archive(path, widget.get_project_data(), widget.image_store)
+    checkpoint_id = ProjectArchive(path).manifest['checkpoint_id']
+    widget.attach_journal(ProjectJournal(path, checkpoint_id, widget.get_project_data(), widget.image_store))
+
+    widget.save_undo_state()
+    widget.add_connection(widget._stages_by_id['s0'], widget._stages_by_id['s1'])
+    widget.save_undo_state()
+    widget._stages_by_id['s2'].setPos(QPointF(50, 700))
+    widget.delete_stage(widget._stages_by_id['s3'])
+    widget.add_stage({'id': 's9', 'title': 'Новый', 'position': {'x': 0, 'y': 400}})
+    widget.save_undo_state()
+    widget.undo()
+    widget.undo()
+    widget.redo()
+
+    widget.flush_journal()
+    widget.journal.commit()
+    archive = ProjectArchive(path)
+    try:
+        restored = archive.load_project_data()
+    finally:
+        archive.close()
+    assert ({stage['id']: stage['position'] for stage in restored['stages']}
+            == {stage['id']: stage['position'] for stage in widget.get_project_data()['stages']})
+    assert (sorted((conn['from'], conn['to']) for conn in restored['connections'])
+            == sorted((conn['from'], conn['to']) for conn in widget.get_project_data()['connections']))
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import random
+
+import pytest
+
+from spatial_index import BoundsTracker, QuadTree, rect_distance
+
+
+def _random_rect(rng, spread=20000):
+    x, y = rng.uniform(-spread, spread), rng.uniform(-spread, spread)
+    return (x, y, x + rng.uniform(0, 400), y + rng.uniform(0, 300))
+
+
+def _intersects(rect, x1, y1, x2, y2):
+    return rect[0] <= x2 and rect[2] >= x1 and rect[1] <= y2 and rect[3] >= y1
+
+
+@pytest.fixture
+def populated():
+    # Дерево после вставок, сдвигов (в том числе далеко за корень) и удалений, и эталонный словарь
+    rng = random.Random(20)
+    tree, rects = QuadTree(), {}
+    for key in range(2000):
+        rects[key] = _random_rect(rng)
+        tree.insert(key, rects[key])
+    for key in rng.sample(range(2000), 600):
+        rect = rects[key]
+        dx, dy = rng.uniform(-500, 500), rng.uniform(-500, 500)
+        rects[key] = (rect[0] + dx, rect[1] + dy, rect[2] + dx, rect[3] + dy)
+        tree.update(key, rects[key])
+    for key in rng.sample(range(2000), 50):
+        rects[key] = _random_rect(rng, spread=200000)
+        tree.update(key, rects[key])
+    for key in rng.sample(sorted(rects), 300):
+        del rects[key]
+        tree.remove(key)
+    return tree, rects, rng
+
+
+def test_membership(populated):
+    tree, rects, _ = populated
+    assert len(tree) == len(rects)
+    assert set(tree) == set(rects)
+    assert all(tree.rect_of(key) == rect for key, rect in rects.items())
+
+
+def test_query_matches_brute_force(populated):
+    tree, rects, rng = populated
+    for _ in range(200):
+        x, y = rng.uniform(-21000, 21000), rng.uniform(-21000, 21000)
+        area = (x, y, x + rng.uniform(0, 3000), y + rng.uniform(0, 3000))
+        assert sorted(tree.query(*area)) == sorted(key for key, rect in rects.items() if _intersects(rect, *area))
+    everything = (-10 ** 7, -10 ** 7, 10 ** 7, 10 ** 7)
+    assert sorted(tree.query(*everything)) == sorted(rects)
+
+
+def test_at_matches_brute_force(populated):
+    tree, rects, rng = populated
+    for key in rng.sample(sorted(rects), 100):
+        rect = rects[key]
+        x, y = (rect[0] + rect[2]) / 2, (rect[1] + rect[3]) / 2
+        hits = tree.at(x, y)
+        assert key in hits
+        assert sorted(hits) == sorted(k for k, r in rects.items() if r[0] <= x <= r[2] and r[1] <= y <= r[3])
+
+
+def test_nearest_matches_brute_force(populated):
+    tree, rects, rng = populated
+    for _ in range(100):
+        x, y = rng.uniform(-25000, 25000), rng.uniform(-25000, 25000)
+        brute = sorted(rect_distance(x, y, rect) for rect in rects.values())
+        found = tree.nearest(x, y, k=8)
+        assert [round(d, 6) for d, _ in found] == [round(d, 6) for d in brute[:8]]
+        assert all(rect_distance(x, y, rects[key]) == d for d, key in found)
+
+
+def test_nearest_with_limit_and_filter(populated):
+    tree, rects, rng = populated
+    x, y = rng.uniform(-5000, 5000), rng.uniform(-5000, 5000)
+    accept = lambda key: key % 3 == 0
+    found = tree.nearest(x, y, k=1000, max_distance=3000, accept=accept)
+    expected = sorted(rect_distance(x, y, rect) for key, rect in rects.items()
+                      if accept(key) and rect_distance(x, y, rect) <= 3000)
+    assert [d for d, _ in found] == pytest.approx(expected)
+    assert all(accept(key) for _, key in found)
+
+
+def test_empty_tree_and_clear(populated):
+    tree, _, _ = populated
+    tree.clear()
+    assert len(tree) == 0
+    assert tree.query(-1e9, -1e9, 1e9, 1e9) == []
+    assert tree.nearest(0, 0, 3) == []
+
+
+def _brute_bounds(rects):
+    if not rects:
+        return None
+    return (min(r[0] for r in rects.values()), min(r[1] for r in rects.values()),
+            max(r[2] for r in rects.values()), max(r[3] for r in rects.values()))
+
+
+def test_bounds_tracker_matches_brute_force():
+    rng = random.Random(24)
+    tracker, rects = BoundsTracker(), {}
+    for step in range(20000):
+        key = rng.randrange(300)
+        if rng.random() < 0.7:
+            rects[key] = _random_rect(rng, spread=10000)
+            tracker.update(key, rects[key])
+        else:
+            rects.pop(key, None)
+            tracker.remove(key)
+        if step % 5 == 0:
+            assert tracker.bounds() == _brute_bounds(rects)
+    assert len(tracker) == len(rects)
+    # Кучи перестраиваются и не растут без предела от устаревших записей
+    assert all(len(heap) <= 4 * len(rects) + 64 + 1 for heap in tracker._heaps)
+
+
+def test_bounds_tracker_removes_extreme_and_clears():
+    tracker = BoundsTracker()
+    tracker.update('a', (0, 0, 10, 10))
+    tracker.update('b', (-50, 5, 5, 80))
+    assert tracker.bounds() == (-50, 0, 10, 80)
+    tracker.remove('b')
+    assert tracker.bounds() == (0, 0, 10, 10)
+    tracker.update('a', (100, 100, 110, 120))
+    assert tracker.bounds() == (100, 100, 110, 120)
+    tracker.clear()
+    assert tracker.bounds() is None
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import random
+import sqlite3
+
+from image_store import ImageStore
+from sqlite_store import SqliteProjectStore
+
+STAGES = 1200
+
+
+def _project():
+    random.seed(9)
+    stages = [{'id': 's%05d' % i, 'title': 'S%d' % i, 'position': {'x': random.uniform(0, 20000), 'y': random.uniform(0, 20000)}}
+              for i in range(STAGES)]
+    connections = {('s%05d' % random.randrange(STAGES), 's%05d' % random.randrange(STAGES)) for _ in range(STAGES * 2)}
+    return {'stages': stages, 'connections': [{'from': a, 'to': b} for a, b in sorted(connections)]}, connections
+
+
+def test_connections_for_matches_brute_force_under_999_variable_limit(tmp_path):
+    project_data, connections = _project()
+    store = SqliteProjectStore.create(str(tmp_path / 'plan.rmdb'), project_data, ImageStore())
+    try:
+        # Предел старых сборок SQLite (до 3.32)
+        store._db().setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+        ids = [stage['id'] for stage in project_data['stages']]
+        assert store.connections_for(ids) == connections
+        some = set(random.sample(ids, 700))
+        assert store.connections_for(some) == {(a, b) for a, b in connections if a in some or b in some}
+        assert len(store.load_stages(ids)) == STAGES
+    finally:
+        store.close()
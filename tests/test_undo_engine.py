@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import random
+
+import pytest
+
+from undo_engine import UndoEngine
+
+
+class Model:
+    """Сцена без Qt: состояния блоков по id и множество связей, правки сообщаются движку как это делает вид."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.stages = {}
+        self.connections = set()
+
+    def snapshot(self):
+        return dict(self.stages), set(self.connections)
+
+    def state_of(self, stage_id):
+        return self.stages.get(stage_id)
+
+    def set_stage(self, stage_id, state):
+        self.stages[stage_id] = state
+        self.engine.stage_changed(stage_id, lambda: self.stages[stage_id])
+
+    def delete_stage(self, stage_id):
+        for key in [key for key in self.connections if stage_id in key]:
+            self.disconnect(*key)
+        del self.stages[stage_id]
+        self.engine.stage_removed(stage_id)
+
+    def connect(self, start_id, end_id):
+        self.connections.add((start_id, end_id))
+        self.engine.connection_changed(start_id, end_id, True)
+
+    def disconnect(self, start_id, end_id):
+        self.connections.discard((start_id, end_id))
+        self.engine.connection_changed(start_id, end_id, False)
+
+    def apply(self, states, connections):
+        for stage_id, state in states.items():
+            if state is None:
+                self.stages.pop(stage_id, None)
+            else:
+                self.stages[stage_id] = state
+        for key, present in connections.items():
+            if present:
+                self.connections.add(key)
+            else:
+                self.connections.discard(key)
+
+    def undo(self):
+        return self.engine.undo(self.state_of, self.apply)
+
+    def redo(self):
+        return self.engine.redo(self.state_of, self.apply)
+
+
+def _random_edit(model, rng, counter):
+    ids = sorted(model.stages)
+    action = rng.random()
+    if action < 0.3 or len(ids) < 2:
+        stage_id = 's%d' % next(counter)
+        model.set_stage(stage_id, ({'title': stage_id, 'x': rng.randrange(1000)}, ()))
+    elif action < 0.55:
+        stage_id = rng.choice(ids)
+        data, tags = model.stages[stage_id]
+        model.set_stage(stage_id, ({**data, 'x': rng.randrange(1000)}, tags))
+    elif action < 0.7:
+        model.delete_stage(rng.choice(ids))
+    elif action < 0.9:
+        key = (rng.choice(ids), rng.choice(ids))
+        if key not in model.connections:   # Как toggle_connection: связь между парой одна
+            model.connect(*key)
+    elif model.connections:
+        model.disconnect(*rng.choice(sorted(model.connections)))
+
+
+@pytest.mark.parametrize('seed', range(8))
+def test_undo_redo_round_trips(seed):
+    rng = random.Random(seed)
+    engine = UndoEngine()
+    model = Model(engine)
+    counter = iter(range(10 ** 6))
+    for _ in range(5):
+        _random_edit(model, rng, counter)   # Загрузка: до первой контрольной точки ничего не записывается
+    snapshots = []
+    for _ in range(40):
+        engine.checkpoint(model.state_of)
+        snapshots.append(model.snapshot())
+        for _ in range(rng.randrange(1, 6)):
+            _random_edit(model, rng, counter)
+    engine.checkpoint(model.state_of)
+    final = model.snapshot()
+    history = snapshots + [final]
+    # Шаги, которые ничего не изменили, не записываются - сравниваем только различающиеся соседние снимки
+    distinct = [history[0]] + [b for a, b in zip(history, history[1:]) if a != b]
+    for expected in reversed(distinct[:-1]):
+        assert model.undo()
+        assert model.snapshot() == expected
+    assert not model.undo()
+    for expected in distinct[1:]:
+        assert model.redo()
+        assert model.snapshot() == expected
+    assert not model.redo()
+
+
+def test_new_edit_after_undo_drops_redo():
+    engine = UndoEngine()
+    model = Model(engine)
+    engine.checkpoint(model.state_of)
+    model.set_stage('a', ({'x': 1}, ()))
+    engine.checkpoint(model.state_of)
+    model.set_stage('a', ({'x': 2}, ()))
+    assert model.undo()
+    model.set_stage('b', ({'x': 3}, ()))
+    assert not model.redo()
+    assert model.snapshot() == ({'a': ({'x': 1}, ()), 'b': ({'x': 3}, ())}, set())
+
+
+def test_edit_reverted_within_step_is_not_recorded():
+    engine = UndoEngine()
+    model = Model(engine)
+    model.set_stage('a', ({'x': 1}, ()))
+    engine.checkpoint(model.state_of)
+    model.set_stage('a', ({'x': 5}, ()))
+    model.set_stage('a', ({'x': 1}, ()))
+    model.connect('a', 'a')
+    model.disconnect('a', 'a')
+    assert not engine.checkpoint(model.state_of)
+    assert not engine.can_undo()
+
+
+def test_budget_trims_oldest_steps():
+    engine = UndoEngine(budget_bytes=20000)
+    model = Model(engine)
+    for i in range(200):
+        engine.checkpoint(model.state_of)
+        model.set_stage('s%d' % i, ({'title': 'x' * 100}, ()))
+    engine.checkpoint(model.state_of)
+    assert engine.used_bytes <= 20000
+    assert 1 <= len(engine.undo_steps) < 200
+    assert engine.used_bytes == sum(step.size for step in engine.undo_steps)
+
+
+def test_suspend_keeps_known_states_and_drops_history():
+    engine = UndoEngine()
+    model = Model(engine)
+    engine.checkpoint(model.state_of)
+    model.set_stage('old', ({'x': 0}, ()))
+    engine.suspend()
+    # Клик во время загрузки: контрольная точка не открывает шаг
+    assert not engine.checkpoint(model.state_of)
+    for i in range(10):
+        model.set_stage('s%d' % i, ({'x': i}, ()))
+    model.connect('s1', 's2')
+    assert not model.undo()
+    engine.resume()
+    assert not engine.can_undo() and not engine.can_redo()
+    loaded = model.snapshot()
+    engine.checkpoint(model.state_of)
+    model.set_stage('s3', ({'x': 99}, ()))
+    assert model.undo()
+    # Блок, загруженный при приостановленной записи, возвращается к загруженному состоянию, а не удаляется
+    assert model.snapshot() == loaded
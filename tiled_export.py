@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Экспорт сцены в PNG полосами-тайлами.
+
+Сцена записывается в QPicture полосами высотой в один тайл - это
+единственная работа на GUI-потоке. Растеризация и сжатие полос идут в
+QThreadPool. Каждая полоса сжимается в отдельный raw-deflate фрагмент,
+который заканчивается Z_SYNC_FLUSH, поэтому фрагменты склеиваются в
+один поток IDAT по порядку, а контрольная сумма Adler-32 собирается из
+сумм полос. Одну QPicture нельзя проигрывать из нескольких потоков сразу,
+поэтому у каждой полосы своя запись. Память ограничена полосами в
+работе (ширина × высота тайла), а не размером всего холста.
+"""
+
+import math
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from PyQt5.QtCore import Qt, QObject, QRectF, QRunnable, QThreadPool, QTimer, pyqtSignal
+from PyQt5.QtGui import QImage, QPainter, QPicture
+from project_archive import replace_file
+
+TILE_SIZE = 512            # Высота полосы в пикселях результата
+DEFAULT_SCALE = 1.5        # Пикселей на единицу сцены
+DEFAULT_DPI = 96           # Записывается в pHYs: определяет размер при печати
+COMPRESS_LEVEL = 6
+IDAT_CHUNK_SIZE = 1 << 20  # Наибольший чанк IDAT
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_ADLER_BASE = 65521
+
+
+def _png_chunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+
+def adler32_combine(adler1, adler2, length2):
+    """Adler-32 склейки двух блоков по их суммам (как adler32_combine из zlib)."""
+    remainder = length2 % _ADLER_BASE
+    sum1 = adler1 & 0xffff
+    sum2 = (remainder * sum1) % _ADLER_BASE
+    sum1 += (adler2 & 0xffff) + _ADLER_BASE - 1
+    sum2 += (adler1 >> 16) + (adler2 >> 16) + _ADLER_BASE - remainder
+    sum1 %= _ADLER_BASE
+    sum2 %= _ADLER_BASE
+    return sum1 | (sum2 << 16)
+
+
+class _BandSignals(QObject):
+    done = pyqtSignal(int, bytes, 'qint64', 'qint64')   # номер полосы, deflate-фрагмент, adler32, длина несжатых строк
+    failed = pyqtSignal(int, str)
+
+
+class _BandTask(QRunnable):
+    """Растеризует одну полосу и сжимает её строки PNG."""
+
+    def __init__(self, index, picture, width, height, scale, signals, cancelled):
+        super().__init__()
+        self.index = index
+        self.picture = picture
+        self.width = width
+        self.height = height
+        self.scale = scale
+        self.signals = signals
+        self.cancelled = cancelled
+
+    def run(self):
+        try:
+            if self.cancelled.is_set():
+                return
+            # Полоса проигрывается целиком за раз: разбор команд QPicture стоит
+            # столько же, сколько сама отрисовка, и повторять его по тайлам дороже
+            band = QImage(self.width, self.height, QImage.Format_RGB888)
+            band.fill(Qt.white)
+            painter = QPainter(band)
+            painter.setRenderHint(QPainter.Antialiasing)
+            painter.setRenderHint(QPainter.SmoothPixmapTransform)
+            painter.scale(self.scale, self.scale)
+            self.picture.play(painter)
+            painter.end()
+            bits = band.constBits()
+            bits.setsize(band.sizeInBytes())
+            pixels = memoryview(bits)
+            line, row_bytes = band.bytesPerLine(), self.width * 3
+            compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -15)
+            chunks = []
+            adler = 1
+            for y in range(self.height):
+                # Каждая строка PNG начинается с байта фильтра (0 - без фильтра)
+                row = pixels[y * line:y * line + row_bytes]
+                adler = zlib.adler32(row, zlib.adler32(b'\x00', adler))
+                chunks.append(compressor.compress(b'\x00'))
+                chunks.append(compressor.compress(row))
+            chunks.append(compressor.flush(zlib.Z_SYNC_FLUSH))
+            self.signals.done.emit(self.index, b''.join(chunks), adler, self.height * (1 + row_bytes))
+        except Exception as e:
+            self.signals.failed.emit(self.index, str(e))
+
+
+class TiledImageExporter(QObject):
+    """Фоновый экспорт прямоугольника сцены в PNG.
+
+    Полосы записываются с GUI-потока по одной за итерацию цикла событий,
+    пока в работе не больше max_in_flight полос; готовые полосы пишутся
+    в файл строго по порядку. Файл пишется во временный и подменяет
+    целевой только после успешного завершения.
+    """
+
+    progress = pyqtSignal(int, int)   # готово полос, всего полос
+    finished = pyqtSignal(str)
+    failed = pyqtSignal(str)
+
+    def __init__(self, scene, source_rect, file_path, scale=DEFAULT_SCALE, dpi=DEFAULT_DPI,
+                 tile_size=TILE_SIZE, parent=None):
+        super().__init__(parent)
+        self.scene = scene
+        self.source_rect = QRectF(source_rect)
+        self.file_path = file_path
+        self.scale = scale
+        self.dpi = dpi
+        self.tile_size = tile_size
+        self.width = max(1, math.ceil(self.source_rect.width() * scale))
+        self.height = max(1, math.ceil(self.source_rect.height() * scale))
+        self.band_count = math.ceil(self.height / tile_size)
+        self._pool = QThreadPool(self)
+        self.max_in_flight = self._pool.maxThreadCount() + 1
+        self._signals = _BandSignals(self)
+        self._signals.done.connect(self._on_band_done)
+        self._signals.failed.connect(self._on_band_failed)
+        self._cancelled = threading.Event()
+        self._next_record = 0
+        self._next_write = 0
+        self._in_flight = 0
+        self._ready = {}
+        self._adler = 1
+        self._file = None
+        self._temp_path = None
+        self._running = False
+        self._record_timer = QTimer(self)
+        self._record_timer.setInterval(0)
+        self._record_timer.timeout.connect(self._record_next)
+
+    def start(self):
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+        fd, self._temp_path = tempfile.mkstemp(prefix='.roadmap-', suffix='.tmp', dir=directory)
+        self._file = os.fdopen(fd, 'wb')
+        pixels_per_meter = round(self.dpi / 0.0254)
+        self._file.write(_PNG_SIGNATURE)
+        self._file.write(_png_chunk(b'IHDR', struct.pack('>IIBBBBB', self.width, self.height, 8, 2, 0, 0, 0)))
+        self._file.write(_png_chunk(b'pHYs', struct.pack('>IIB', pixels_per_meter, pixels_per_meter, 1)))
+        # Заголовок zlib; дальше идут deflate-фрагменты полос
+        self._write_idat(b'\x78\x9c')
+        self._running = True
+        self._record_timer.start()
+
+    def is_running(self):
+        return self._running
+
+    def cancel(self):
+        """Останавливает экспорт и удаляет недописанный файл."""
+        if not self._running:
+            return
+        self._cancelled.set()
+        self._stop()
+
+    def _stop(self):
+        self._running = False
+        self._record_timer.stop()
+        self._pool.clear()
+        self._pool.waitForDone()
+        self._ready.clear()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._temp_path and os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+    def _record_next(self):
+        if self._in_flight >= self.max_in_flight:
+            # Новые полосы записываются, когда освобождаются старые
+            self._record_timer.stop()
+            return
+        index = self._next_record
+        top = index * self.tile_size
+        band_height = min(self.tile_size, self.height - top)
+        source = QRectF(self.source_rect.left(), self.source_rect.top() + top / self.scale,
+                        self.source_rect.width(), band_height / self.scale)
+        picture = QPicture()
+        painter = QPainter(picture)
+        self.scene.render(painter, QRectF(0, 0, source.width(), source.height()), source, Qt.IgnoreAspectRatio)
+        painter.end()
+        self._pool.start(_BandTask(index, picture, self.width, band_height, self.scale, self._signals, self._cancelled))
+        self._in_flight += 1
+        self._next_record += 1
+        if self._next_record >= self.band_count:
+            self._record_timer.stop()
+
+    def _on_band_done(self, index, chunk, adler, length):
+        if not self._running:
+            return
+        self._in_flight -= 1
+        self._ready[index] = (chunk, adler, length)
+        try:
+            while self._next_write in self._ready:
+                chunk, adler, length = self._ready.pop(self._next_write)
+                self._write_idat(chunk)
+                self._adler = adler32_combine(self._adler, adler, length)
+                self._next_write += 1
+            self.progress.emit(self._next_write, self.band_count)
+            if self._next_write >= self.band_count:
+                self._finish()
+            elif self._next_record < self.band_count and not self._record_timer.isActive():
+                self._record_timer.start()
+        except OSError as e:
+            self._stop()
+            self.failed.emit(f"Ошибка записи изображения: {str(e)}")
+
+    def _on_band_failed(self, index, message):
+        if not self._running:
+            return
+        self._cancelled.set()
+        self._stop()
+        self.failed.emit(f"Ошибка отрисовки изображения: {message}")
+
+    def _write_idat(self, data):
+        for start in range(0, len(data), IDAT_CHUNK_SIZE):
+            self._file.write(_png_chunk(b'IDAT', data[start:start + IDAT_CHUNK_SIZE]))
+
+    def _finish(self):
+        # Пустой последний блок deflate и Adler-32 всех строк завершают поток zlib
+        self._write_idat(zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -15).flush() + struct.pack('>I', self._adler))
+        self._file.write(_png_chunk(b'IEND', b''))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        self._running = False
+        replace_file(self._temp_path, self.file_path)
+        self._temp_path = None
+        self.finished.emit(self.file_path)
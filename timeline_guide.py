@@ -3,6 +3,7 @@ from PyQt5.QtCore import Qt, QRectF, QPointF, pyqtSignal, QTimer
 from PyQt5.QtGui import QPen, QColor, QFont, QPainterPath, QTextOption, QPainterPathStroker
 from glass_menu import GlassMenu
 from glass_input_dialog import GlassInputDialog
+from curve_geometry import CurveLUT
 
 TICK_OFFSET = 8
 
@@ -187,16 +188,7 @@ class TickItem(QGraphicsObject):
                     self.setPos(rel_pos)
                     return
                 # 3. Иначе ищем ближайшую точку на линии
-                min_dist = float('inf')
-                best_t = 0.0
-                for i in range(101):
-                    t = i / 100.0
-                    p = guide_line_path.pointAtPercent(t)
-                    d = (QPointF(p) - self.original_scene_pos).manhattanLength()
-                    if d < min_dist:
-                        min_dist = d
-                        best_t = t
-                self.relative_offset = best_t
+                self.relative_offset = self.guide.line_curve().project(self.original_scene_pos.x(), self.original_scene_pos.y())[0]
             # Позиция по относительному смещению (после возможного обновления)
             if self.guide.orientation == 'horizontal':
                 length = guide_line_end.x() - guide_line_start.x()
@@ -275,6 +267,7 @@ class TimelineGuideItem(QGraphicsObject):
         
         self.offset = 20
         self.line_path = QPainterPath()
+        self._line_curve = None
         
         self.setFlags(QGraphicsItem.ItemIsSelectable | QGraphicsItem.ItemIsFocusable)
         self.setAcceptHoverEvents(True)
@@ -299,6 +292,12 @@ class TimelineGuideItem(QGraphicsObject):
         painter.setPen(pen)
         painter.drawPath(self.line_path)
 
+    def line_curve(self):
+        # Таблица длины линии для поиска ближайшей точки; сбрасывается при перестроении линии
+        if self._line_curve is None:
+            self._line_curve = CurveLUT.from_path(self.line_path)
+        return self._line_curve
+
     @property
     def all_ticks(self):
         ticks = list(self.custom_ticks)
@@ -425,6 +424,7 @@ class TimelineGuideItem(QGraphicsObject):
         
         self.line_path = QPainterPath(p1)
         self.line_path.lineTo(p2)
+        self._line_curve = None
 
         for tick in self.all_ticks:
             tick.update_position()
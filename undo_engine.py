@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Отмена и повтор правок через изменения, а не снимки проекта.
+
+Шаг отмены хранит только то, что поменялось между двумя контрольными
+точками (save_undo_state): состояние затронутых блоков до и после шага и
+добавленные или удалённые связи. Состояние блока - неизменяемый снимок
+(данные, теги); снимки общие для соседних шагов и для таблицы известных
+состояний, поэтому у неизменённых блоков копий нет вовсе. Отмена
+применяет к существующим элементам состояния "до" и обратные операции со
+связями, не пересобирая сцену.
+
+Правки блока приходят уже после изменения, поэтому состояние "до" берётся
+из таблицы состояний на последней контрольной точке. Пока контрольных
+точек нет (загрузка проекта) или запись приостановлена (suspend), правки
+только обновляют эту таблицу и не записываются. Глубина истории ограничена примерной занятой памятью, а не
+числом шагов. Модуль не зависит от Qt: блоки различаются по id.
+"""
+
+UNDO_BUDGET_BYTES = 32 * 1024 * 1024
+STATE_OVERHEAD = 512      # Примерный размер пустого снимка блока (словарь, кортеж)
+CONNECTION_OVERHEAD = 160
+
+
+def estimate_size(value):
+    """Примерный размер значения в байтах (строки, числа, словари, списки)."""
+    if isinstance(value, str):
+        return 50 + len(value)
+    if isinstance(value, dict):
+        return 64 + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 56 + sum(estimate_size(v) for v in value)
+    return 32
+
+
+class UndoStep:
+    """Правки между двумя контрольными точками."""
+
+    __slots__ = ('before', 'after', 'connections', 'size')
+
+    def __init__(self):
+        self.before = {}        # id блока -> состояние до шага (None - блока не было)
+        self.after = {}         # id блока -> состояние после шага (None - блок удалён)
+        self.connections = {}   # (id начала, id конца) -> True добавлена / False удалена
+        self.size = 0
+
+    def is_empty(self):
+        return not self.before and not self.connections
+
+
+class UndoEngine:
+    def __init__(self, budget_bytes=UNDO_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self.undo_steps = []
+        self.redo_steps = []
+        self.used_bytes = 0
+        self._known = {}     # id блока -> состояние на последней контрольной точке
+        self._step = None    # Открытый шаг; None - правки не записываются
+        self._suspended = False
+
+    def clear(self):
+        """Забывает историю и состояния (новый проект); запись начнётся со следующей контрольной точки."""
+        self.undo_steps.clear()
+        self.redo_steps.clear()
+        self.used_bytes = 0
+        self._known.clear()
+        self._step = None
+
+    def is_recording(self):
+        return self._step is not None
+
+    def suspend(self):
+        """Не записывать правки (пока сцена наполняется при загрузке); состояния блоков по-прежнему обновляются."""
+        self._suspended = True
+        self._step = None
+
+    def resume(self):
+        """Снова принимать контрольные точки. Шаги, записанные до приостановки, относятся к прежней сцене и забываются."""
+        self._suspended = False
+        self.undo_steps.clear()
+        self.redo_steps.clear()
+        self.used_bytes = 0
+
+    def can_undo(self):
+        return bool(self.undo_steps) or (self._step is not None and not self._step.is_empty())
+
+    def can_redo(self):
+        return bool(self.redo_steps)
+
+    # --- Запись правок ---
+    def stage_changed(self, stage_id, state_fn):
+        """Блок добавлен или изменён. state_fn() вызывается, только если шаг не записывается."""
+        if self._step is not None:
+            if stage_id not in self._step.before:
+                self._step.before[stage_id] = self._known.get(stage_id)
+        else:
+            self._known[stage_id] = state_fn()
+
+    def stage_removed(self, stage_id):
+        if self._step is not None:
+            if stage_id not in self._step.before:
+                self._step.before[stage_id] = self._known.get(stage_id)
+        else:
+            self._known.pop(stage_id, None)
+
+    def connection_changed(self, start_id, end_id, added):
+        if self._step is None:
+            return
+        key = (start_id, end_id)
+        if self._step.connections.get(key, added) != added:
+            del self._step.connections[key]   # Добавлена и удалена в одном шаге
+        else:
+            self._step.connections[key] = added
+
+    # --- Контрольные точки ---
+    def checkpoint(self, state_of):
+        """Закрывает открытый шаг и начинает новый. state_of(id) - текущее состояние блока или None."""
+        if self._suspended:
+            return False
+        step, self._step = self._step, UndoStep()
+        if step is None or not self._close(step, state_of):
+            return False
+        self.undo_steps.append(step)
+        self.used_bytes += step.size
+        for redo in self.redo_steps:
+            self.used_bytes -= redo.size
+        self.redo_steps.clear()
+        self._trim()
+        return True
+
+    def _close(self, step, state_of):
+        for stage_id, before in list(step.before.items()):
+            after = state_of(stage_id)
+            if after == before:
+                del step.before[stage_id]   # Блок вернулся в исходное состояние
+                continue
+            step.after[stage_id] = after
+            if after is None:
+                self._known.pop(stage_id, None)
+            else:
+                self._known[stage_id] = after
+        if step.is_empty():
+            return False
+        step.size = (sum(STATE_OVERHEAD + estimate_size(state) for state in step.before.values() if state is not None)
+                     + sum(STATE_OVERHEAD + estimate_size(state) for state in step.after.values() if state is not None)
+                     + CONNECTION_OVERHEAD * len(step.connections))
+        return True
+
+    def _trim(self):
+        # Последний шаг остаётся, даже если он один больше бюджета
+        while self.used_bytes > self.budget_bytes and len(self.undo_steps) > 1:
+            self.used_bytes -= self.undo_steps.pop(0).size
+
+    # --- Отмена и повтор ---
+    def undo(self, state_of, apply):
+        """Отменяет последний шаг. apply(состояния по id, связи (id, id) -> есть ли) применяет изменения к сцене."""
+        self.checkpoint(state_of)
+        if self._suspended or not self.undo_steps:
+            return False
+        step = self.undo_steps.pop()
+        self._apply(step.before, {key: not added for key, added in step.connections.items()}, apply)
+        self.redo_steps.append(step)
+        return True
+
+    def redo(self, state_of, apply):
+        if self.checkpoint(state_of) or self._suspended or not self.redo_steps:
+            return False   # Новые правки после отмены отбрасывают повтор
+        step = self.redo_steps.pop()
+        self._apply(step.after, step.connections, apply)
+        self.undo_steps.append(step)
+        return True
+
+    def _apply(self, states, connections, apply):
+        # Пока изменения применяются, они не записываются как новый шаг
+        self._step = None
+        try:
+            apply(states, connections)
+        finally:
+            for stage_id, state in states.items():
+                if state is None:
+                    self._known.pop(stage_id, None)
+                else:
+                    self._known[stage_id] = state
+            self._step = UndoStep()